@@ -0,0 +1,468 @@
+"""
+LYT Communications - Batch Work Order Extraction
+Runs a whole folder (or manifest) of work order / map PDF pairs at once.
+
+PDF rendering is CPU-bound, so it runs in a process pool. The Claude calls
+are network-bound, so they run in a bounded thread pool. Each job moves on
+to its API call as soon as its own rendering finishes. All calls share one
+client and queue on the rate limiter in scheduler.py.
+
+Usage:
+    python extract_workorder.py batch path/to/folder --jobs 4
+    python extract_workorder.py batch --manifest jobs.csv --render-workers 2
+    python extract_workorder.py batch path/to/folder --deferred   (see deferred.py)
+    python extract_workorder.py batch path/to/folder --jobs 8 --itpm 400000 --otpm 80000
+"""
+
+import argparse
+import contextlib
+import csv
+import io
+import json
+import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from datetime import datetime
+from pathlib import Path
+
+from extract_workorder import (
+    DEFAULT_RENDER_WORKERS,
+    OUTPUT_DIR,
+    load_api_key,
+    output_name,
+    save_extraction,
+)
+
+DEFAULT_API_JOBS = 4
+
+# Filename tokens that mark a file as a map / work order, stripped when
+# computing the job key used to pair the two.
+_MAP_TOKENS = re.compile(r"(?i)(?<![a-z])(construction[ _-]*)?(maps?|design|prints?)(?![a-z])")
+_WO_TOKENS = re.compile(r"(?i)(?<![a-z])(work[ _-]*orders?|wo)(?![a-z])")
+
+
+def _is_map_file(path: Path) -> bool:
+    """True if the filename looks like a construction map rather than a WO."""
+    words = re.split(r"[^A-Za-z]+", path.stem.lower())
+    return any(w in ("map", "maps", "design", "print", "prints") for w in words)
+
+
+def job_key(path: Path) -> str:
+    """Normalize a filename to the job code shared by a WO and its map."""
+    stem = path.stem
+    stem = _MAP_TOKENS.sub(" ", stem) if _is_map_file(path) else _WO_TOKENS.sub(" ", stem)
+    return re.sub(r"[^a-z0-9]+", "", stem.lower())
+
+
+def pair_job_files(folder: Path) -> tuple[list[dict], list[Path]]:
+    """
+    Pair every work order PDF in folder with its map PDF.
+    Returns (jobs, unpaired_maps). Each job is { 'name', 'wo', 'map' }.
+    WOs with no matching map are still returned (map=None).
+    """
+    return pair_files(p for p in Path(folder).iterdir() if p.suffix.lower() == ".pdf")
+
+
+def pair_files(paths) -> tuple[list[dict], list[Path]]:
+    """pair_job_files() over an explicit set of PDF paths (e.g. the settled files of a watched inbox)."""
+    pdfs = sorted(Path(p) for p in paths)
+    maps = {job_key(p): p for p in pdfs if _is_map_file(p)}
+    wos = [p for p in pdfs if not _is_map_file(p)]
+
+    jobs = []
+    used = set()
+    for wo in wos:
+        key = job_key(wo)
+        match = maps.get(key)
+        if match is None and key:
+            # Fall back to prefix match (e.g. "SLPH01006" vs "SLPH01006rev2")
+            candidates = [k for k in maps if k not in used and (k.startswith(key) or key.startswith(k))]
+            if len(candidates) == 1:
+                match = maps[candidates[0]]
+                key = candidates[0]
+        if match is not None:
+            used.add(key)
+        jobs.append({"name": wo.stem, "wo": str(wo), "map": str(match) if match else None})
+
+    unpaired = [p for k, p in maps.items() if k not in used]
+    return jobs, unpaired
+
+
+def load_manifest(manifest_path: Path) -> list[dict]:
+    """
+    Load jobs from a CSV (columns: wo, map[, name, bbox]) or JSON list manifest.
+    Relative paths are resolved against the manifest's folder; bbox is the
+    job's project area (min_lat,min_lng,max_lat,max_lng, see --bbox).
+    """
+    from validation import parse_bbox
+    manifest_path = Path(manifest_path)
+    base = manifest_path.parent
+
+    if manifest_path.suffix.lower() == ".json":
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            rows = json.load(f)
+    else:
+        with open(manifest_path, "r", encoding="utf-8", newline="") as f:
+            rows = list(csv.DictReader(f))
+
+    jobs = []
+    for row in rows:
+        wo = (row.get("wo") or "").strip()
+        if not wo:
+            continue
+        map_path = (row.get("map") or "").strip() or None
+        wo = str(base / wo)
+        if map_path:
+            map_path = str(base / map_path)
+        jobs.append({
+            "name": (row.get("name") or "").strip() or Path(wo).stem,
+            "wo": wo,
+            "map": map_path,
+            "bbox": parse_bbox(row.get("bbox")),
+        })
+    return jobs
+
+
+def prepare_job(wo_path: str, map_path: str | None, adaptive: bool = False,
+                per_sheet: bool = False, tiered: bool = False, compact: bool = False) -> dict:
+    """
+    Process-pool worker: extract WO text and tile the map for one job.
+    Per-page progress output is captured so parallel jobs don't interleave.
+    per_sheet=True tiles every map page and keeps each page's text apart
+    for sheets.extract_per_sheet(). tiered=True marks the job for
+    tiered.extract_tiered(). compact=True encodes compact map tiles
+    (pdf_processor.tile_map_pdf). Stage measurements come back in "metrics"
+    (a metrics.JobMetrics the API stage carries on).
+    """
+    from metrics import JobMetrics
+    from pdf_processor import (
+        MAX_PAGES_MAP, extract_map_page_texts, extract_map_text, extract_work_order_text, tile_map_pdf,
+    )
+
+    mode = "tiered" if tiered else "per_sheet" if per_sheet else "single"
+    job_metrics = JobMetrics(Path(wo_path).stem, wo=wo_path, map=map_path, mode=mode, adaptive=adaptive,
+                             compact=compact)
+    with contextlib.redirect_stdout(io.StringIO()), job_metrics.active():
+        with job_metrics.stage("wo_text"):
+            wo_text = extract_work_order_text(wo_path)
+
+        map_tiles = []
+        map_text = ""
+        map_page_texts = None
+        if map_path:
+            max_pages = None if per_sheet else MAX_PAGES_MAP
+            with job_metrics.stage("render"):
+                map_tiles = tile_map_pdf(map_path, adaptive=adaptive, max_pages=max_pages, compact=compact)
+            with job_metrics.stage("map_text"):
+                map_text = extract_map_text(map_path, max_pages)
+                if per_sheet:
+                    map_page_texts = extract_map_page_texts(map_path, None)
+
+    timings = {"text": round(job_metrics.seconds("wo_text"), 2)}
+    if map_path:
+        timings["render"] = round(job_metrics.seconds("render") + job_metrics.seconds("map_text"), 2)
+    return {"wo_text": wo_text, "map_text": map_text, "map_tiles": map_tiles,
+            "map_page_texts": map_page_texts, "tiered": tiered, "wo_path": wo_path,
+            "timings": timings, "metrics": job_metrics}
+
+
+def _call_claude(prepared: dict, api_key: str) -> dict:
+    """Thread-pool worker: run the Claude extraction for one prepared job."""
+    from claude_client import extract_with_claude
+    from sheets import extract_per_sheet
+    from tiered import extract_tiered
+
+    job_metrics = prepared["metrics"]
+    with job_metrics.active(), job_metrics.stage("api"):
+        if prepared.get("tiered"):
+            extracted = extract_tiered(
+                prepared["wo_text"], prepared["map_text"], prepared["map_tiles"], api_key,
+                verbose=False, usage=prepared["usage"], wo_path=prepared.get("wo_path"),
+            )
+        elif prepared.get("map_page_texts") is not None:
+            extracted = extract_per_sheet(
+                prepared["wo_text"], prepared["map_page_texts"], prepared["map_tiles"], api_key,
+                verbose=False, usage=prepared["usage"],
+            )
+        else:
+            extracted = extract_with_claude(
+                prepared["wo_text"], prepared["map_text"], prepared["map_tiles"], api_key,
+                verbose=False, usage=prepared["usage"],
+            )
+    return extracted
+
+
+def save_job_result(extracted: dict, job: dict, result: dict, output_dir: Path,
+                    used_names: set) -> Path:
+    """
+    Write one job's extraction JSON (suffixing the job name when two jobs
+    share a WO number) and mark its result dict as ok, with the
+    validation.validate() issues against the job's "bbox", if any (None
+    when NumPy isn't installed).
+    """
+    from validation import validate
+    name = output_name(extracted)
+    if name in used_names or name == "unknown":
+        name = f"{name}_{re.sub(r'[^A-Za-z0-9.-]+', '_', job['name'])}"
+    used_names.add(name)
+    output_file = save_extraction(extracted, output_dir, name)
+
+    result.update(
+        status="ok",
+        output=str(output_file),
+        counts={
+            "segments": len(extracted.get("segments", [])),
+            "structures": len(extracted.get("structures", [])),
+            "splice_points": len(extracted.get("splice_points", [])),
+            "line_items": len(extracted.get("line_items", [])),
+        },
+    )
+    report = validate(extracted, job.get("bbox"))
+    result["validation"] = {"errors": report["errors"], "warnings": report["warnings"]} if report else None
+    return output_file
+
+
+def validation_note(result: dict) -> str:
+    """Suffix for a job's OK line when validation found issues."""
+    report = result.get("validation")
+    if not report or not (report["errors"] or report["warnings"]):
+        return ""
+    return f" [validation: {len(report['errors'])} error(s), {len(report['warnings'])} warning(s)]"
+
+
+def run_batch(
+    jobs: list[dict],
+    api_key: str,
+    output_dir: Path,
+    api_jobs: int = DEFAULT_API_JOBS,
+    render_workers: int = DEFAULT_RENDER_WORKERS,
+    adaptive: bool = False,
+    per_sheet: bool = False,
+    tiered: bool = False,
+    compact: bool = False,
+) -> list[dict]:
+    """
+    Run every job through render + extraction. Returns one result dict per
+    job: { name, wo, map, status, output, error, timings, counts }.
+    A failed job never stops the rest of the batch. Each finished job's
+    stage metrics are appended to output_dir/metrics.jsonl.
+    """
+    output_dir = Path(output_dir)
+    results = [{**job, "status": "pending", "output": None, "error": None, "timings": {}}
+               for job in jobs]
+    used_names = set()
+    total = len(jobs)
+    done = 0
+
+    with ProcessPoolExecutor(max_workers=render_workers) as render_pool, \
+            ThreadPoolExecutor(max_workers=api_jobs) as api_pool:
+        render_futures = {
+            render_pool.submit(prepare_job, job["wo"], job["map"], adaptive, per_sheet, tiered, compact): i
+            for i, job in enumerate(jobs)
+        }
+        api_futures = {}
+        prepared_jobs = {}
+
+        for future in as_completed(render_futures):
+            result = results[render_futures[future]]
+            job = jobs[render_futures[future]]
+            try:
+                prepared = future.result()
+            except Exception as e:
+                result.update(status="failed", error=f"render: {e}")
+                done += 1
+                print(f"  [{done}/{total}] FAILED {job['name']} (render): {e}")
+                continue
+            result["timings"] = prepared["timings"]
+            result["usage"] = prepared["usage"] = {}
+            prepared_jobs[render_futures[future]] = prepared
+            print(f"  Rendered {job['name']}: {len(prepared['map_tiles'])} tiles "
+                  f"({prepared['timings'].get('render', 0):.1f}s) — queued for extraction")
+            api_futures[api_pool.submit(_call_claude, prepared, api_key)] = render_futures[future]
+
+        for future in as_completed(api_futures):
+            result = results[api_futures[future]]
+            job = jobs[api_futures[future]]
+            done += 1
+            job_metrics = prepared_jobs.pop(api_futures[future])["metrics"]
+            result["timings"]["api"] = round(job_metrics.seconds("api"), 2)
+            try:
+                extracted = future.result()
+            except Exception as e:
+                result.update(status="failed", error=f"extraction: {e}")
+                job_metrics.write(output_dir, status="failed", error=str(e))
+                print(f"  [{done}/{total}] FAILED {job['name']}: {e}")
+                continue
+
+            output_file = save_job_result(extracted, job, result, output_dir, used_names)
+            job_metrics.write(output_dir, status="ok", output=str(output_file))
+            print(f"  [{done}/{total}] OK {job['name']} -> {output_file.name} "
+                  f"({result['timings'].get('api', 0):.1f}s, "
+                  f"{result['usage'].get('cache_read_input_tokens', 0)} cached prompt tokens)"
+                  + validation_note(result))
+
+    return results
+
+
+def _total_usage(results: list[dict]) -> dict:
+    """Sum token counts (including prompt cache writes/reads) over all jobs."""
+    totals = {}
+    for r in results:
+        for key, value in (r.get("usage") or {}).items():
+            if key != "time_to_first_token" and value:
+                totals[key] = totals.get(key, 0) + value
+    ttft = [r["usage"]["time_to_first_token"] for r in results
+            if (r.get("usage") or {}).get("time_to_first_token") is not None]
+    if ttft:
+        totals["mean_time_to_first_token"] = round(sum(ttft) / len(ttft), 2)
+    return totals
+
+
+def write_summary(results: list[dict], output_dir: Path, elapsed: float) -> Path:
+    """Write the batch summary JSON (per-job status, errors and timings)."""
+    from claude_client import MODEL
+
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    summary_file = output_dir / f"batch_summary_{stamp}.json"
+
+    summary = {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "model": MODEL,
+        "elapsed_seconds": round(elapsed, 1),
+        "total": len(results),
+        "succeeded": sum(1 for r in results if r["status"] == "ok"),
+        "failed": sum(1 for r in results if r["status"] == "failed"),
+        "usage": _total_usage(results),
+        "jobs": results,
+    }
+    with open(summary_file, "w", encoding="utf-8") as f:
+        json.dump(summary, f, indent=2, ensure_ascii=False)
+    return summary_file
+
+
+def batch_main(argv: list[str]):
+    parser = argparse.ArgumentParser(
+        prog="extract_workorder.py batch",
+        description="Extract a folder or manifest of work order / map PDF pairs concurrently",
+    )
+    parser.add_argument("folder", nargs="?", help="Folder containing WO and map PDFs")
+    parser.add_argument("--manifest", help="CSV (wo,map,name) or JSON manifest of jobs")
+    parser.add_argument("--output", help="Output directory", default=str(OUTPUT_DIR))
+    parser.add_argument("--jobs", type=int, default=DEFAULT_API_JOBS,
+                        help=f"Concurrent Claude extractions (default {DEFAULT_API_JOBS})")
+    parser.add_argument("--render-workers", type=int, default=DEFAULT_RENDER_WORKERS,
+                        help=f"PDF rendering processes (default {DEFAULT_RENDER_WORKERS})")
+    parser.add_argument("--adaptive", action="store_true",
+                        help="Size map tiles to each sheet's density instead of a fixed 2x2 grid")
+    parser.add_argument("--compact-tiles", action="store_true",
+                        help="Send map tiles as the smallest equally legible PNG / JPEG and drop blank sections "
+                             "(default: JPEG q70 tiles, as the web app sends)")
+    parser.add_argument("--deferred", action="store_true",
+                        help="Submit as a Message Batch (cheaper, results within 24h); "
+                             "download later with 'extract_workorder.py collect'")
+    parser.add_argument("--per-sheet", action="store_true",
+                        help="Extract each map sheet in its own request and merge (no page limit)")
+    parser.add_argument("--tiered", action="store_true",
+                        help="Copy WO line items with a fast model; Opus reads only the map")
+    parser.add_argument("--bbox", metavar="MIN_LAT,MIN_LNG,MAX_LAT,MAX_LNG",
+                        help="Project area GPS points are validated against, for jobs without a "
+                             "manifest bbox (default: within 30 km of each job's median point)")
+    parser.add_argument("--rpm", type=int, help="Opus requests per minute limit (default: from API headers)")
+    parser.add_argument("--itpm", type=int, help="Opus input tokens per minute limit")
+    parser.add_argument("--otpm", type=int, help="Opus output tokens per minute limit")
+    args = parser.parse_args(argv)
+
+    if not args.folder and not args.manifest:
+        parser.error("give a folder or --manifest")
+    if args.deferred and (args.per_sheet or args.tiered):
+        parser.error("--per-sheet and --tiered are not supported with --deferred")
+    if args.tiered and args.per_sheet:
+        parser.error("--tiered and --per-sheet can't be combined")
+    from validation import parse_bbox
+    try:
+        bbox = parse_bbox(args.bbox)
+    except ValueError as e:
+        parser.error(str(e))
+
+    print()
+    print("=" * 60)
+    print("  LYT Communications - Batch Work Order Extractor")
+    print("=" * 60)
+    print()
+
+    if args.manifest:
+        try:
+            jobs = load_manifest(Path(args.manifest))
+        except ValueError as e:
+            print(f"ERROR: {args.manifest}: {e}")
+            sys.exit(1)
+    else:
+        folder = Path(args.folder)
+        if not folder.is_dir():
+            print(f"ERROR: Folder not found: {folder}")
+            sys.exit(1)
+        jobs, unpaired = pair_job_files(folder)
+        for p in unpaired:
+            print(f"WARNING: No work order found for map {p.name} — skipped")
+
+    missing = [j for j in jobs if not os.path.exists(j["wo"]) or (j["map"] and not os.path.exists(j["map"]))]
+    for j in missing:
+        print(f"WARNING: Missing file for job {j['name']} — skipped")
+    jobs = [j for j in jobs if j not in missing]
+    for j in jobs:
+        j["bbox"] = j.get("bbox") or bbox
+
+    if not jobs:
+        print("No jobs to run.")
+        sys.exit(1)
+
+    api_key = load_api_key()
+    if args.deferred:
+        print(f"{len(jobs)} jobs, deferred submission, {args.render_workers} render workers\n")
+    else:
+        print(f"{len(jobs)} jobs, {args.jobs} concurrent extractions, {args.render_workers} render workers\n")
+    for j in jobs:
+        map_name = os.path.basename(j["map"]) if j["map"] else "(none)"
+        print(f"  {j['name']}: {os.path.basename(j['wo'])} + {map_name}")
+    print()
+
+    if args.deferred:
+        from deferred import submit_deferred
+        batch_ids = submit_deferred(jobs, api_key, Path(args.output), args.render_workers, args.adaptive,
+                                    args.compact_tiles)
+        if not batch_ids:
+            print("Nothing submitted.")
+            sys.exit(1)
+        print(f"\n{'=' * 60}")
+        print(f"  SUBMITTED: {len(batch_ids)} batch(es)")
+        print("  Collect results with: python extract_workorder.py collect --wait")
+        print(f"{'=' * 60}")
+        return
+
+    if args.rpm or args.itpm or args.otpm:
+        from claude_client import MODEL
+        from scheduler import configure_limits
+        configure_limits(MODEL, args.rpm, args.itpm, args.otpm)
+
+    start = time.time()
+    results = run_batch(jobs, api_key, Path(args.output), args.jobs, args.render_workers,
+                        args.adaptive, args.per_sheet, args.tiered, args.compact_tiles)
+    elapsed = time.time() - start
+    summary_file = write_summary(results, Path(args.output), elapsed)
+
+    ok = sum(1 for r in results if r["status"] == "ok")
+    print(f"\n{'=' * 60}")
+    print(f"  BATCH COMPLETE: {ok}/{len(results)} succeeded in {elapsed / 60:.1f} min")
+    usage = _total_usage(results)
+    print(f"  Tokens: {usage.get('input_tokens', 0):,} in / {usage.get('output_tokens', 0):,} out, "
+          f"prompt cache {usage.get('cache_creation_input_tokens', 0):,} written / "
+          f"{usage.get('cache_read_input_tokens', 0):,} read")
+    print(f"  Summary: {summary_file}")
+    print(f"{'=' * 60}")
+
+    if ok < len(results):
+        sys.exit(1)
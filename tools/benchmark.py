@@ -0,0 +1,443 @@
+"""
+LYT Communications - Offline Benchmarks
+Times the local pipeline on synthetic inputs, so a change to tiling,
+JPEG / base64 encoding or response parsing can be measured before it
+ships. Nothing here calls the API.
+
+Synthetic construction maps are ARCH D / ARCH E sheets with a street grid,
+dense vector linework (conduit runs, parcel lines, hatching), footage and
+street labels, a legend and a title block, generated deterministically
+into tools/output/.bench/. Synthetic extraction responses run from 10KB
+to 1MB, both complete and cut off mid-record like a max_tokens stop.
+
+Each case runs REPEATS times and reports the fastest run. Render and
+tile cases start every run with no sheet layouts known (map_layout's
+in-memory memo cleared, and its disk cache pointed at a benchmark folder
+that is emptied), so they include layout detection rather than a cache
+lookup, and the user's own layout cache is left alone. Results can be
+saved as a baseline and later runs compared against it; cases slower than
+the baseline by more than --threshold are flagged and the exit code is 1.
+
+Usage:
+    python extract_workorder.py bench                   # run and compare with the baseline
+    python extract_workorder.py bench --save-baseline   # record the current numbers
+    python extract_workorder.py bench --quick --only render
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import platform
+import random
+import shutil
+import statistics
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+
+import fitz  # PyMuPDF
+
+from extract_workorder import OUTPUT_DIR
+
+BENCH_DIR = OUTPUT_DIR / ".bench"
+BASELINE_FILE = BENCH_DIR / "baseline.json"
+LAYOUT_CACHE_NAMESPACE = "layouts"  # under BENCH_DIR, emptied before every render / tile run
+REPEATS = 3
+REGRESSION_THRESHOLD = 0.10  # 10% slower than the baseline
+
+# Sheet sizes in points (landscape)
+ARCH_D = (36 * 72, 24 * 72)
+ARCH_E = (48 * 72, 36 * 72)
+
+# name: (sheet size, pages, linework density)
+MAP_CONFIGS = {
+    "arch-d-2p": (ARCH_D, 2, 1.0),
+    "arch-d-4p-dense": (ARCH_D, 4, 3.0),
+    "arch-e-4p": (ARCH_E, 4, 1.5),
+    "arch-e-8p-dense": (ARCH_E, 8, 3.0),
+}
+QUICK_MAPS = ("arch-d-2p",)
+
+RESPONSE_SIZES = {"10kb": 10_000, "100kb": 100_000, "1mb": 1_000_000}
+QUICK_RESPONSES = ("10kb", "100kb")
+
+STREETS = ("Maplewood Dr", "Beglis Pkwy", "Cypress St", "Ruth St", "Prien Lake Rd",
+           "Houston River Rd", "Post Oak Rd", "Tom Hebert Rd", "Napoleon St", "Lake St")
+
+
+# ---------------------------------------------------------------------------
+# Synthetic inputs
+# ---------------------------------------------------------------------------
+
+def _draw_map_page(page, rng: random.Random, density: float):
+    """One construction sheet: street grid, conduit runs, parcels, labels, legend, title block."""
+    width, height = page.rect.width, page.rect.height
+    map_right = width * 0.72
+    shape = page.new_shape()
+
+    # Street grid
+    step = 180 / density ** 0.5
+    x = 60.0
+    while x < map_right - 40:
+        shape.draw_line((x, 60), (x, height - 60))
+        x += step * rng.uniform(0.7, 1.3)
+    y = 60.0
+    while y < height - 60:
+        shape.draw_line((60, y), (map_right - 40, y))
+        y += step * rng.uniform(0.7, 1.3)
+    shape.finish(color=(0.55, 0.55, 0.55), width=6)
+
+    # Parcel lines and hatching
+    for _ in range(int(400 * density)):
+        x0, y0 = rng.uniform(60, map_right - 60), rng.uniform(60, height - 60)
+        shape.draw_rect(fitz.Rect(x0, y0, x0 + rng.uniform(20, 90), y0 + rng.uniform(20, 90)))
+    shape.finish(color=(0.75, 0.75, 0.75), width=0.5)
+    for _ in range(int(600 * density)):
+        x0, y0 = rng.uniform(60, map_right - 60), rng.uniform(60, height - 60)
+        shape.draw_line((x0, y0), (x0 + 12, y0 + 12))
+    shape.finish(color=(0.8, 0.8, 0.8), width=0.3)
+
+    # Conduit runs (red) with handholes
+    for _ in range(int(60 * density)):
+        points = [(rng.uniform(80, map_right - 80), rng.uniform(80, height - 80))]
+        for _ in range(rng.randint(2, 6)):
+            px, py = points[-1]
+            points.append((min(max(px + rng.uniform(-150, 150), 70), map_right - 70),
+                           min(max(py + rng.uniform(-150, 150), 70), height - 70)))
+        shape.draw_polyline(points)
+        shape.finish(color=(0.85, 0.1, 0.1), width=1.5)
+        for px, py in points:
+            shape.draw_circle((px, py), 4)
+        shape.finish(color=(0, 0, 0.6), fill=(0.7, 0.8, 1.0), width=0.8)
+    shape.commit()
+
+    # Labels: footage in red, slack in grey, street names in black
+    for _ in range(int(250 * density)):
+        x0, y0 = rng.uniform(70, map_right - 80), rng.uniform(70, height - 70)
+        kind = rng.random()
+        if kind < 0.5:
+            page.insert_text((x0, y0), f"{rng.randint(12, 950)}'", fontsize=7, color=(0.85, 0.1, 0.1))
+        elif kind < 0.7:
+            page.insert_text((x0, y0), f"{rng.choice((50, 75, 100))}' SL", fontsize=6, color=(0.5, 0.5, 0.5))
+        else:
+            page.insert_text((x0, y0), rng.choice(STREETS).upper(), fontsize=8)
+
+    # Legend (top right) and title block (bottom right)
+    legend = fitz.Rect(map_right + 20, 40, width - 30, height * 0.5)
+    page.draw_rect(legend, width=1)
+    page.insert_text((legend.x0 + 12, legend.y0 + 24), "LEGEND", fontsize=14)
+    for i, label in enumerate(("024F CABLE", "048F CABLE", "HANDHOLE", "FLOWERPOT", "PLACE 1", "PLACE 2")):
+        y = legend.y0 + 50 + i * 22
+        page.draw_line((legend.x0 + 12, y - 3), (legend.x0 + 60, y - 3),
+                       color=(0.85, 0.1 * i, 0.1), width=2)
+        page.insert_text((legend.x0 + 70, y), label, fontsize=9)
+    title = fitz.Rect(map_right + 20, height * 0.75, width - 30, height - 30)
+    page.draw_rect(title, width=1.5)
+    page.insert_text((title.x0 + 12, title.y0 + 24), f"SLPH.01.{rng.randint(1000, 9999)}", fontsize=12)
+    page.insert_text((title.x0 + 12, title.y0 + 44), "SULPHUR, LA - FIBER CONSTRUCTION", fontsize=9)
+
+
+def make_map_pdf(path: Path, size: tuple[float, float], pages: int, density: float,
+                 seed: int = 7) -> Path:
+    """Write a synthetic multi-page construction map PDF (deterministic for a seed)."""
+    rng = random.Random(seed)
+    doc = fitz.open()
+    for number in range(pages):
+        page = doc.new_page(width=size[0], height=size[1])
+        _draw_map_page(page, rng, density)
+        page.insert_text((size[0] * 0.72 + 32, size[1] - 50), f"SHEET {number + 1} OF {pages}", fontsize=10)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    doc.save(str(path), garbage=3, deflate=True)
+    doc.close()
+    return path
+
+
+def bench_map(name: str) -> Path:
+    """The synthetic map for a MAP_CONFIGS entry, generated on first use."""
+    size, pages, density = MAP_CONFIGS[name]
+    path = BENCH_DIR / f"{name}.pdf"
+    if not path.exists():
+        make_map_pdf(path, size, pages, density)
+    return path
+
+
+def make_response(size: int, seed: int = 11) -> str:
+    """A complete extraction response of about `size` characters."""
+    rng = random.Random(seed)
+    segments, structures, splices = [], [], []
+    doc = {"project": {"name": "SLPH.01.006 - Sulphur, LA", "work_order_number": "SLPH.01.006",
+                       "client": "Vexus", "region": "LA", "rate_card": "vexus-la-tx-2026",
+                       "location": "Sulphur, LA", "date_received": "2026-01-15"},
+           "segments": segments, "structures": structures, "splice_points": splices,
+           "line_items": [{"code": code, "description": f"Item {code}", "uom": "LF",
+                           "quantity": rng.randint(10, 5000)} for code in ("UG1", "UG4", "UG9", "FS1")],
+           "reconciliation": {"total_footage": 0, "unmatched_items": [], "notes": ["synthetic"]}}
+    length = len(json.dumps(doc, indent=2))
+    i = 0
+    while length < size:
+        i += 1
+        lat, lng = 30.22 + rng.uniform(-0.02, 0.02), -93.37 + rng.uniform(-0.02, 0.02)
+        segment = {"segment_id": f"SEG-{i:03d}", "section": rng.choice("ABCDEF"),
+                   "street_name": rng.choice(STREETS), "footage": rng.randint(12, 950),
+                   "duct_count": rng.randint(1, 3), "cable_type": rng.choice(("024F", "048F")),
+                   "from_structure": f"HH-{i:03d}", "to_structure": f"HH-{i + 1:03d}",
+                   "gps_start": {"lat": round(lat, 6), "lng": round(lng, 6)},
+                   "gps_end": {"lat": round(lat + 0.001, 6), "lng": round(lng + 0.001, 6)},
+                   "description": f"Bore {rng.randint(1, 3)} duct along {rng.choice(STREETS)} {{\"PLACE 2\"}}"}
+        structure = {"id": f"HH-{i:03d}", "type": rng.choice(("handhole", "flowerpot")),
+                     "size": "17x30", "segment_id": segment["segment_id"],
+                     "gps": {"lat": round(lat, 6), "lng": round(lng, 6)}, "ground_rod": rng.random() < 0.5}
+        segments.append(segment)
+        structures.append(structure)
+        length += len(json.dumps(segment, indent=2)) + len(json.dumps(structure, indent=2)) + 16
+        if i % 5 == 0:
+            splice = {"splice_id": f"SP-{i // 5:03d}", "splice_type": "closure", "handhole_id": structure["id"],
+                      "segment_id": segment["segment_id"], "gps": structure["gps"], "fiber_count": 48}
+            splices.append(splice)
+            length += len(json.dumps(splice, indent=2)) + 8
+    return json.dumps(doc, indent=2)
+
+
+def truncate_response(text: str, seed: int = 13) -> str:
+    """Cut a response mid-record in its last fifth, like a max_tokens stop."""
+    rng = random.Random(seed)
+    return text[:rng.randint(int(len(text) * 0.8), len(text) - 10)]
+
+
+# ---------------------------------------------------------------------------
+# Timing
+# ---------------------------------------------------------------------------
+
+def _time(fn, repeats: int, setup=None) -> dict:
+    """Fastest and median wall time of fn() over `repeats` runs (its output silenced), setup() untimed before each."""
+    times = []
+    for _ in range(repeats):
+        with contextlib.redirect_stdout(io.StringIO()):
+            if setup is not None:
+                setup()
+            start = time.perf_counter()
+            fn()
+            times.append(time.perf_counter() - start)
+    return {"best_s": round(min(times), 4), "median_s": round(statistics.median(times), 4)}
+
+
+@contextlib.contextmanager
+def _bench_layout_cache():
+    """
+    Point map_layout's disk cache at BENCH_DIR for the run. Render workers
+    forked from this process inherit it; spawned ones (Windows) still read
+    the real cache, which only the x<workers> render cases use.
+    """
+    import map_layout
+    from cache import DiskCache
+
+    real = map_layout.layout_cache
+    map_layout.layout_cache = lambda: DiskCache(LAYOUT_CACHE_NAMESPACE, root=BENCH_DIR)
+    try:
+        yield
+    finally:
+        map_layout.layout_cache = real
+
+
+def _cold_layouts():
+    """Forget every detected sheet layout, so the next run detects them again."""
+    import map_layout
+
+    map_layout._memo.clear()
+    shutil.rmtree(map_layout.layout_cache().dir, ignore_errors=True)
+
+
+def render_cases(maps: tuple[str, ...], workers: int) -> dict:
+    from pdf_processor import tile_map_pdf
+
+    cases = {}
+    for name in maps:
+        path = str(bench_map(name))
+        for adaptive in (False, True):
+            mode = "adaptive" if adaptive else "fixed"
+            cases[f"render/{name}/{mode}"] = lambda p=path, a=adaptive: tile_map_pdf(
+                p, use_cache=False, workers=1, adaptive=a, max_pages=None)
+            if workers > 1:
+                cases[f"render/{name}/{mode}/x{workers}"] = lambda p=path, a=adaptive: tile_map_pdf(
+                    p, use_cache=False, workers=workers, adaptive=a, max_pages=None)
+        cases[f"render/{name}/fixed-compact"] = lambda p=path: tile_map_pdf(
+            p, use_cache=False, workers=1, max_pages=None, compact=True)
+    return cases
+
+
+def tile_cases(maps: tuple[str, ...]) -> dict:
+    """Tiling plans alone (layout detection, region planning; no rasterizing)."""
+    from pdf_processor import _adaptive_plan, _fixed_plan
+
+    def plan(path, planner):
+        doc = fitz.open(path)
+        try:
+            for page in doc:
+                planner(page)
+        finally:
+            doc.close()
+
+    cases = {}
+    for name in maps:
+        path = str(bench_map(name))
+        cases[f"tile/{name}/fixed"] = lambda p=path: plan(p, _fixed_plan)
+        cases[f"tile/{name}/adaptive"] = lambda p=path: plan(p, _adaptive_plan)
+    return cases
+
+
+def encode_cases(maps: tuple[str, ...]) -> dict:
+    """Tile encoding (plain JPEG and the compact format search) and base64 / request body building."""
+    from PIL import Image
+    from claude_client import build_request
+    from pdf_processor import MAP_JPEG_QUALITY, _encode_tile, _fixed_plan, tile_map_pdf
+
+    cases = {}
+    for name in maps:
+        path = str(bench_map(name))
+        with contextlib.redirect_stdout(io.StringIO()):
+            tiles = tile_map_pdf(path, use_cache=False, max_pages=None)
+
+        doc = fitz.open(path)
+        region = max(_fixed_plan(doc[0]), key=lambda r: r[5] * r[6])
+        _, _, _, x, y, w, h, scale = region
+        mat = fitz.Matrix(scale, scale)
+        pix = doc[0].get_pixmap(matrix=mat, clip=fitz.Rect(x, y, x + w, y + h) * ~mat, alpha=False)
+        image = Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
+        doc.close()
+
+        cases[f"encode/{name}/jpeg-largest-tile"] = lambda img=image: img.save(
+            io.BytesIO(), format="JPEG", quality=MAP_JPEG_QUALITY)
+        cases[f"encode/{name}/compact-largest-tile"] = lambda img=image: _encode_tile(img, section=True, compact=True)
+        cases[f"encode/{name}/base64-all-tiles"] = lambda t=tiles: [tile.base64() for tile in t]
+        cases[f"encode/{name}/build-request"] = lambda t=tiles: build_request("WO TEXT", "", t)
+    return cases
+
+
+def parse_cases(sizes: tuple[str, ...]) -> dict:
+    """Response parsing: full parse, truncation repair and the streaming record parser."""
+    from claude_client import _parse_json_response
+    from json_stream import RecordStreamParser, repair_truncated_json
+
+    def stream(text, chunk=64):
+        parser = RecordStreamParser()
+        for i in range(0, len(text), chunk):
+            parser.feed(text[i:i + chunk])
+
+    cases = {}
+    for label in sizes:
+        complete = make_response(RESPONSE_SIZES[label])
+        truncated = truncate_response(complete)
+        cases[f"parse/{label}/complete"] = lambda t=complete: _parse_json_response(t)
+        cases[f"parse/{label}/truncated"] = lambda t=truncated: _parse_json_response(t)
+        cases[f"parse/{label}/repair-scan"] = lambda t=truncated: repair_truncated_json(t)
+        cases[f"parse/{label}/stream-records"] = lambda t=complete: stream(t)
+    return cases
+
+
+GROUPS = ("render", "tile", "encode", "parse")
+
+
+def run_benchmarks(groups: tuple[str, ...] = GROUPS, quick: bool = False, repeats: int = REPEATS,
+                   workers: int = 1) -> dict:
+    """Run the selected benchmark groups; returns {case: {best_s, median_s}}."""
+    maps = QUICK_MAPS if quick else tuple(MAP_CONFIGS)
+    sizes = QUICK_RESPONSES if quick else tuple(RESPONSE_SIZES)
+    builders = {
+        "render": lambda: render_cases(maps, workers),
+        "tile": lambda: tile_cases(maps),
+        "encode": lambda: encode_cases(maps),
+        "parse": lambda: parse_cases(sizes),
+    }
+    results = {}
+    with _bench_layout_cache():
+        for group in groups:
+            print(f"  {group}:")
+            setup = _cold_layouts if group in ("render", "tile") else None
+            for case, fn in builders[group]().items():
+                results[case] = _time(fn, repeats, setup)
+                print(f"    {case:<48} {results[case]['best_s'] * 1000:>10.1f} ms")
+    return results
+
+
+def _environment() -> dict:
+    from PIL import __version__ as pillow_version
+
+    return {"python": platform.python_version(), "platform": platform.platform(),
+            "pymupdf": fitz.VersionBind, "pillow": pillow_version}
+
+
+def save_baseline(results: dict, path: Path = BASELINE_FILE):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"created": datetime.now().isoformat(timespec="seconds"),
+                   "environment": _environment(), "results": results}, f, indent=2)
+
+
+def compare(results: dict, baseline: dict, threshold: float = REGRESSION_THRESHOLD) -> list[str]:
+    """Print each case against the baseline; returns the cases that regressed."""
+    regressions = []
+    print(f"\n  {'case':<48} {'baseline':>10} {'now':>10} {'change':>8}")
+    for case, now in results.items():
+        before = baseline.get(case)
+        if before is None:
+            print(f"  {case:<48} {'-':>10} {now['best_s'] * 1000:>8.1f}ms {'new':>8}")
+            continue
+        change = (now["best_s"] - before["best_s"]) / before["best_s"] if before["best_s"] else 0.0
+        flag = ""
+        if change > threshold:
+            regressions.append(case)
+            flag = "  SLOWER"
+        elif change < -threshold:
+            flag = "  faster"
+        print(f"  {case:<48} {before['best_s'] * 1000:>8.1f}ms {now['best_s'] * 1000:>8.1f}ms "
+              f"{change:>+7.0%}{flag}")
+    return regressions
+
+
+def bench_main(argv: list[str]):
+    parser = argparse.ArgumentParser(
+        prog="extract_workorder.py bench",
+        description="Time rendering, tiling, encoding and response parsing on synthetic inputs (offline)",
+    )
+    parser.add_argument("--only", choices=GROUPS, action="append",
+                        help="Run only this group (repeatable)")
+    parser.add_argument("--quick", action="store_true", help="Smallest map and responses only")
+    parser.add_argument("--repeats", type=int, default=REPEATS, help=f"Runs per case (default {REPEATS})")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Also time rendering with this many processes")
+    parser.add_argument("--baseline", default=str(BASELINE_FILE), help="Baseline JSON file")
+    parser.add_argument("--save-baseline", action="store_true",
+                        help="Write this run as the new baseline instead of comparing")
+    parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD,
+                        help=f"Slowdown that counts as a regression (default {REGRESSION_THRESHOLD})")
+    args = parser.parse_args(argv)
+
+    print()
+    print("=" * 60)
+    print("  LYT Communications - Offline Benchmarks")
+    print("=" * 60)
+    print()
+
+    results = run_benchmarks(tuple(args.only or GROUPS), args.quick, args.repeats, args.workers)
+    baseline_path = Path(args.baseline)
+
+    if args.save_baseline:
+        save_baseline(results, baseline_path)
+        print(f"\n  Baseline saved: {baseline_path}")
+        return
+    if not baseline_path.exists():
+        print(f"\n  No baseline at {baseline_path} — run with --save-baseline to record one")
+        return
+
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    if baseline.get("environment") != _environment():
+        print(f"\n  NOTE: baseline was recorded on {baseline.get('environment')}")
+    regressions = compare(results, baseline.get("results", {}), args.threshold)
+    print()
+    if regressions:
+        print(f"  {len(regressions)} case(s) slower than the baseline by more than {args.threshold:.0%}")
+        sys.exit(1)
+    print("  No regressions")
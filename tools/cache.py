@@ -0,0 +1,163 @@
+"""
+LYT Communications - On-Disk Cache
+Content-addressed cache for extraction results, so re-running the same
+WO/map PDFs returns the stored Claude output instead of paying for another
+1-3 minute Opus stream. pdf_processor also keeps encoded map tiles here,
+one entry per page, so map revisions only re-render the sheets that changed.
+
+Entries live under tools/output/.cache/<namespace>/ and are evicted
+oldest-first when the namespace exceeds its size budget or age limit.
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+import time
+from pathlib import Path
+
+CACHE_DIR = Path(__file__).resolve().parent / "output" / ".cache"
+MAX_CACHE_MB = 500
+MAX_CACHE_AGE_DAYS = 30
+
+
+class DiskCache:
+    """Flat key -> bytes store in one directory with size/age eviction."""
+
+    def __init__(
+        self,
+        namespace: str,
+        root: Path = CACHE_DIR,
+        max_mb: float = MAX_CACHE_MB,
+        max_age_days: float = MAX_CACHE_AGE_DAYS,
+    ):
+        self.dir = Path(root) / namespace
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.max_age = max_age_days * 86400
+
+    def _path(self, key: str) -> Path:
+        return self.dir / key
+
+    def get(self, key: str) -> bytes | None:
+        """Return cached bytes, or None on a miss or expired entry."""
+        path = self._path(key)
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            return None
+        if time.time() - stat.st_mtime > self.max_age:
+            path.unlink(missing_ok=True)
+            return None
+        try:
+            data = path.read_bytes()
+        except FileNotFoundError:
+            return None
+        # Touch so eviction treats recently-used entries as fresh
+        os.utime(path, None)
+        return data
+
+    def put(self, key: str, data: bytes):
+        """Store bytes atomically, then evict if over budget."""
+        self.dir.mkdir(parents=True, exist_ok=True)
+        _atomic_write(self._path(key), data)
+        self.evict()
+
+    def get_json(self, key: str):
+        data = self.get(key)
+        if data is None:
+            return None
+        try:
+            return json.loads(data)
+        except json.JSONDecodeError:
+            return None
+
+    def put_json(self, key: str, value):
+        self.put(key, json.dumps(value, ensure_ascii=False).encode("utf-8"))
+
+    def evict(self) -> int:
+        """Drop expired entries, then oldest entries until under max size."""
+        if not self.dir.exists():
+            return 0
+        now = time.time()
+        entries = []
+        removed = 0
+        for path in self.dir.iterdir():
+            if not path.is_file() or path.name.startswith(".tmp-"):
+                continue
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            if now - stat.st_mtime > self.max_age:
+                path.unlink(missing_ok=True)
+                removed += 1
+            else:
+                entries.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+            removed += 1
+        return removed
+
+
+def _atomic_write(path: Path, data: bytes):
+    """Write via a temp file in the same folder and rename, so readers never see a partial file."""
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+    except BaseException:
+        Path(tmp).unlink(missing_ok=True)
+        raise
+
+
+def hash_file(path: str | None) -> str:
+    """SHA-256 of a file's bytes ('' for no file)."""
+    if not path:
+        return ""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def extraction_cache_key(
+    wo_path: str, map_path: str | None, wo_text: str, map_text: str, adaptive: bool = False,
+    per_sheet: bool = False, tiered: bool = False, compact: bool = False,
+) -> str:
+    """
+    Key for a full extraction: both PDFs' bytes, the exact prompts sent,
+    the tiling settings and the model. Changing any of them is a miss.
+    Per-sheet (sheets.py) and tiered (tiered.py) extractions are keyed
+    separately.
+    """
+    from claude_client import MAX_TOKENS, MODEL, build_extraction_prompt, build_system_prompt
+    from pdf_processor import tile_settings
+
+    has_tiles = bool(map_path)
+    parts = {
+        "wo_pdf": hash_file(wo_path),
+        "map_pdf": hash_file(map_path),
+        "system_prompt": build_system_prompt(has_tiles),
+        "extraction_prompt": build_extraction_prompt(wo_text, map_text, has_tiles),
+        "tiles": tile_settings(adaptive, compact) if has_tiles else None,
+        "model": MODEL,
+        "max_tokens": MAX_TOKENS,
+    }
+    if per_sheet:
+        parts["per_sheet"] = True
+    if tiered:
+        from tiered import LINE_ITEM_MODEL
+        parts["tiered"] = LINE_ITEM_MODEL
+    blob = json.dumps(parts, sort_keys=True, ensure_ascii=False).encode("utf-8")
+    return hashlib.sha256(blob).hexdigest()
+
+
+def extraction_cache() -> DiskCache:
+    return DiskCache("extractions")
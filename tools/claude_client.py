@@ -7,9 +7,107 @@ Output format matches EXTRACTION_PROMPT.md / importProjectFromExtraction().
 import json
 import os
 import re
+import threading
+import time
+from typing import Iterator
 
 import httpx
-from anthropic import Anthropic
+from anthropic import Anthropic, APITimeoutError
+
+from json_stream import RECORD_ARRAYS, REQUIRED_KEYS, RecordStreamParser, repair_truncated_json
+from metrics import record_request, stage
+from scheduler import (
+    MAX_RETRIES,
+    backoff,
+    counted_input_tokens,
+    estimate_input_tokens,
+    is_retryable,
+    limiter_for,
+)
+
+MODEL = "claude-opus-4-6"
+MAX_TOKENS = 64000
+REQUEST_TIMEOUT = 900.0  # seconds — large extractions can stream for 15 minutes
+
+# Cache the static system prompt + rate card/schema block across requests.
+# Cache reads are billed at a fraction of input price and cut time to first token.
+PROMPT_CACHING = True
+CACHE_CONTROL = {"type": "ephemeral"}
+
+# Follow-up requests when a response stops at max_tokens: the output so far
+# (cut at the last complete record) is sent back as a prefilled assistant
+# turn and the model carries on from there
+MAX_CONTINUATIONS = 3
+
+# Output tokens reserved per request by the rate limiter until the real count is known
+EXPECTED_OUTPUT_TOKENS = 16000
+
+_clients: dict[str, Anthropic] = {}
+_clients_lock = threading.Lock()
+
+
+def shared_client(api_key: str) -> Anthropic:
+    """
+    One Anthropic client (and so one HTTP connection pool) per API key,
+    shared by every extraction thread. SDK retries are off: scheduler.py
+    retries with rate-limit-aware backoff instead.
+    """
+    with _clients_lock:
+        client = _clients.get(api_key)
+        if client is None:
+            client = _clients[api_key] = Anthropic(
+                api_key=api_key,
+                # Use longer timeout for large extractions (up to 15 minutes)
+                timeout=httpx.Timeout(REQUEST_TIMEOUT, connect=30.0),
+                max_retries=0,
+            )
+        return client
+
+
+# Rate card unit codes and units of measure (vexus-la-tx-2026)
+RATE_CARD = """=== VALID UNIT CODES (use EXACT codes from this list) ===
+
+Aerial:
+AE1 (LF), AE2 (LF), AE3 (LF), AE3.1 (LF), AE4 (EA), AE5 (EA), AE6 (EA), AE7 (EA),
+AE8 (LF), AE9L (EA), AE9S (EA), AE10 (Span), AE11 (Span), AE12 (LF), AE13 (EA),
+AE14 (EA), AE15 (EA), AE17 (EA), AE18 (LF), AE19 (EA), AE31 (EA), AE31.1 (LF)
+
+Fiber Splicing:
+FS1 (EA), FS2 (EA), FS3 (EA), FS4 (EA), FS05 (EA)
+
+Underground Boring:
+UG1 (LF), UG2 (LF), UG3 (LF), UG16 (LF), UG23 (LF), UG24 (LF), UG21 (LF),
+UG29 (LF), UG30 (LF), UG32 (LF)
+
+Underground Pulling:
+UG4 (LF), UG22 (LF), UG28 (LF)
+
+Underground Direct Bury:
+UG5 (LF), UG6 (EA), UG7 (LF), UG8 (LF)
+
+Underground Structures:
+UG9 (EA), UG10 (EA), UG11 (EA), UG12 (EA), UG13 (EA), UG14 (EA), UG15 (EA),
+UG17 (EA), UG18 (EA), UG19 (EA), UG20 (EA), UG27 (EA), UG31 (EA)
+
+Poles:
+PP1 (EA), PP2 (EA), PP3 (EA), BCP (EA)
+
+Restoration:
+PA01 (SF), PA02 (SF), PA02A (SF), PC01 (SF), PC02 (SF), PC02A (SF), RA1 (CF), RC1 (CF)
+
+Other:
+HSPH (EA), TC1 (HR)
+
+Hourly Personnel:
+L10A (HR), L30A (HR), L40A (HR), L50A (HR), L70A (HR)
+
+Hourly Equipment:
+E10 (HR), E20 (HR), E30 (HR), E40 (HR), E50 (HR), E60 (HR), E70 (HR), E80 (HR), E82 (HR)"""
+
+
+def unit_codes() -> dict[str, str]:
+    """Valid unit codes from RATE_CARD, mapped to their unit of measure."""
+    return dict(re.findall(r"([A-Z][A-Z0-9.]*) \((\w+)\)", RATE_CARD))
 
 
 def build_system_prompt(has_tiles: bool) -> str:
@@ -85,9 +183,13 @@ The construction map has been split into high-resolution tiles for accurate read
     return prompt
 
 
-def build_extraction_prompt(wo_text: str, map_text: str, has_tiles: bool) -> str:
-    """Build the user extraction prompt with WO text and output format."""
-    prompt = """TASK: Extract ALL construction project data from the work order text AND map images.
+def build_static_prompt() -> str:
+    """
+    The part of the user prompt that never changes between jobs: task
+    steps, rate card unit codes, output schema and rules. Sent as its own
+    cacheable content block ahead of the per-job text.
+    """
+    return """TASK: Extract ALL construction project data from the work order text AND map images.
 
 STEP 1 - Read the work order text. Copy EVERY line item exactly. Extract job code, customer, WO number.
 STEP 2 - Read the map images for physical layout, structures, footage, streets, duct counts.
@@ -95,76 +197,9 @@ STEP 3 - Estimate GPS coordinates for all structures and segment endpoints using
 STEP 4 - Build line_items array linking each billable item to its segment/structure.
 STEP 5 - Log any discrepancies between map and WO in reconciliation.
 
-=== VALID UNIT CODES (use EXACT codes from this list) ===
+""" + RATE_CARD + """
 
-Aerial:
-AE1 (LF), AE2 (LF), AE3 (LF), AE3.1 (LF), AE4 (EA), AE5 (EA), AE6 (EA), AE7 (EA),
-AE8 (LF), AE9L (EA), AE9S (EA), AE10 (Span), AE11 (Span), AE12 (LF), AE13 (EA),
-AE14 (EA), AE15 (EA), AE17 (EA), AE18 (LF), AE19 (EA), AE31 (EA), AE31.1 (LF)
-
-Fiber Splicing:
-FS1 (EA), FS2 (EA), FS3 (EA), FS4 (EA), FS05 (EA)
-
-Underground Boring:
-UG1 (LF), UG2 (LF), UG3 (LF), UG16 (LF), UG23 (LF), UG24 (LF), UG21 (LF),
-UG29 (LF), UG30 (LF), UG32 (LF)
-
-Underground Pulling:
-UG4 (LF), UG22 (LF), UG28 (LF)
-
-Underground Direct Bury:
-UG5 (LF), UG6 (EA), UG7 (LF), UG8 (LF)
-
-Underground Structures:
-UG9 (EA), UG10 (EA), UG11 (EA), UG12 (EA), UG13 (EA), UG14 (EA), UG15 (EA),
-UG17 (EA), UG18 (EA), UG19 (EA), UG20 (EA), UG27 (EA), UG31 (EA)
-
-Poles:
-PP1 (EA), PP2 (EA), PP3 (EA), BCP (EA)
-
-Restoration:
-PA01 (SF), PA02 (SF), PA02A (SF), PC01 (SF), PC02 (SF), PC02A (SF), RA1 (CF), RC1 (CF)
-
-Other:
-HSPH (EA), TC1 (HR)
-
-Hourly Personnel:
-L10A (HR), L30A (HR), L40A (HR), L50A (HR), L70A (HR)
-
-Hourly Equipment:
-E10 (HR), E20 (HR), E30 (HR), E40 (HR), E50 (HR), E60 (HR), E70 (HR), E80 (HR), E82 (HR)
-
-"""
-
-    if wo_text and len(wo_text) > 30:
-        prompt += f"""
-========================================
-WORK ORDER TEXT (billing source of truth):
-========================================
-{wo_text}
-========================================
-
-"""
-
-    if map_text and len(map_text) > 30:
-        prompt += f"""
-MAP EMBEDDED TEXT (supplementary - images are primary):
-{map_text}
-
-"""
-
-    if has_tiles:
-        prompt += """
-The map tiles follow. Process in order:
-1. Read the LEGEND tile - learn cable colors and all symbols
-2. Check the KEY MAP for section layout
-3. Scan each section tile R1C1 -> R1C2 -> R2C1 -> R2C2
-4. For each tile, extract ALL structures, footage numbers, cable labels, street names
-5. Cross-reference across tile boundaries for features that span edges
-
-"""
-
-    prompt += """REQUIRED JSON OUTPUT — use this EXACT structure:
+REQUIRED JSON OUTPUT — use this EXACT structure:
 {
   "project": {
     "name": "[Work order name/number - Location]",
@@ -252,31 +287,115 @@ RULES:
 
 Return ONLY JSON. No markdown, no commentary."""
 
-    return prompt
 
+def build_work_order_items_prompt(work_order: dict, wo_text: str = "") -> str:
+    """
+    Map-only prompt section for tiered extraction (tiered.py): the project
+    details and line items already read from the work order, in place of
+    the raw WO text. Instead of copying the items again, the model returns
+    only their links to map records (tiered.merge_tiered applies them).
+    When the project details are missing (line items read locally from the
+    WO table), the WO text is included so the project can be filled in.
+    """
+    lines = [f"{n} | {item.get('code', '')} | {item.get('description', '')} | "
+             f"{item.get('uom', '')} | {item.get('quantity', '')}"
+             for n, item in enumerate(work_order.get("line_items") or [], 1)]
+    project = work_order.get("project") or {}
+    if project:
+        project_text = f"PROJECT: {json.dumps(project, ensure_ascii=False)}\n"
+        project_rule = 'Return "project": {}.'
+    else:
+        project_text = f"WORK ORDER TEXT (for project details only):\n{wo_text}\n\n" if wo_text else ""
+        project_rule = 'Fill in "project" from the work order.'
+    return f"""
+========================================
+WORK ORDER (already extracted - billing source of truth):
+========================================
+{project_text}LINE ITEMS (item | code | description | uom | quantity):
+{chr(10).join(lines) if lines else "(none)"}
+========================================
 
-def extract_with_claude(
-    wo_text: str,
-    map_text: str,
-    map_tiles: list[dict],
-    api_key: str,
-) -> dict:
+MAP-ONLY EXTRACTION: the work order line items above are already captured.
+Do NOT copy them. "line_items" holds only their LINKS to map records: one
+entry per segment / structure / splice point an item is built on, e.g.
+{{ "item": 1, "code": "[code of item 1]", "quantity": [amount on that record],
+  "segment_id": "SEG-001" }} (or "structure_id" / "splice_id").
+Leave out items you can't place on the map. {project_rule}
+Use the items for cable types, pull codes and duct counts, and compare them
+with the map counts (log differences in reconciliation.notes).
+Use the project location to estimate GPS coordinates.
+
+"""
+
+
+def build_job_prompt(wo_text: str, map_text: str, has_tiles: bool,
+                     work_order: dict | None = None) -> str:
     """
-    Call Claude Opus 4.6 with work order text + map tiles.
-    Returns parsed extraction JSON dict.
+    Build the per-job part of the user prompt: WO text, map text, tile order.
+    With work_order (tiered mode) the WO text is replaced by its already
+    extracted project and line items.
     """
-    # Use longer timeout for large extractions (up to 15 minutes)
-    client = Anthropic(
-        api_key=api_key,
-        timeout=httpx.Timeout(900.0, connect=30.0),
-    )
+    prompt = ""
 
-    has_tiles = len(map_tiles) > 0
-    system_prompt = build_system_prompt(has_tiles)
-    extraction_prompt = build_extraction_prompt(wo_text, map_text, has_tiles)
+    if work_order is not None:
+        prompt += build_work_order_items_prompt(work_order, wo_text)
+    elif wo_text and len(wo_text) > 30:
+        prompt += f"""
+========================================
+WORK ORDER TEXT (billing source of truth):
+========================================
+{wo_text}
+========================================
+
+"""
+
+    if map_text and len(map_text) > 30:
+        prompt += f"""
+MAP EMBEDDED TEXT (supplementary - images are primary):
+{map_text}
 
-    # Build content blocks
-    content = [{"type": "text", "text": extraction_prompt}]
+"""
+
+    if has_tiles:
+        prompt += """
+The map tiles follow. Process in order:
+1. Read the LEGEND tile - learn cable colors and all symbols
+2. Check the KEY MAP for section layout
+3. Scan each section tile R1C1 -> R1C2 -> R2C1 -> R2C2
+4. For each tile, extract ALL structures, footage numbers, cable labels, street names
+5. Cross-reference across tile boundaries for features that span edges
+
+"""
+
+    prompt += "Extract this job into the REQUIRED JSON OUTPUT structure above. Return ONLY JSON."
+    return prompt
+
+
+def build_extraction_prompt(wo_text: str, map_text: str, has_tiles: bool) -> str:
+    """Build the full user extraction prompt: static instructions + this job's text."""
+    return build_static_prompt() + "\n\n" + build_job_prompt(wo_text, map_text, has_tiles)
+
+
+def build_request(wo_text: str, map_text: str, map_tiles: list, work_order: dict | None = None) -> dict:
+    """
+    Build the Messages API request (model, max_tokens, system, messages).
+
+    Static instructions come first, marked for prompt caching: the system
+    prompt, then the task/rate card/schema block. Per-job work order text
+    and map tiles follow, so every job reuses the cached prefix.
+    Tiles are pdf_processor.Tile objects, base64-encoded here; a tile whose
+    image repeats an earlier one in the same request is sent as a reference.
+    work_order (tiered mode) swaps the WO text for its extracted line items.
+    """
+    has_tiles = len(map_tiles) > 0
+    system = [{"type": "text", "text": build_system_prompt(has_tiles)}]
+    content = [
+        {"type": "text", "text": build_static_prompt()},
+        {"type": "text", "text": build_job_prompt(wo_text, map_text, has_tiles, work_order)},
+    ]
+    if PROMPT_CACHING:
+        system[0]["cache_control"] = CACHE_CONTROL
+        content[0]["cache_control"] = CACHE_CONTROL
 
     # Add map tile images
     if map_tiles:
@@ -287,64 +406,417 @@ def extract_with_claude(
                 "The map has been split into tiles for maximum readability.\n"
                 "TILE ORDER: Legend first, then Key Map overview, then section tiles.\n"
                 "Each tile is a zoomed-in section. Read EVERY label, number, and symbol.\n"
+                + _tile_grid_note(map_tiles)
             ),
         })
-        for tile in map_tiles:
-            content.append({"type": "text", "text": f"\n[{tile['label']}]:"})
-            content.append({
-                "type": "image",
-                "source": {
-                    "type": "base64",
-                    "media_type": "image/jpeg",
-                    "data": tile["base64"],
-                },
-            })
-
-    print(f"Calling Claude Opus 4.6 via streaming (max_tokens=64000)...")
-    print(f"  WO text: {len(wo_text)} chars, map tiles: {len(map_tiles)}")
-
-    # Use streaming to handle long-running extraction
-    raw_text = ""
-    input_tokens = 0
-    output_tokens = 0
-    stop_reason = None
-
-    with client.messages.stream(
-        model="claude-opus-4-6",
-        max_tokens=64000,
-        system=system_prompt,
-        messages=[{"role": "user", "content": content}],
-    ) as stream:
-        chars_received = 0
-        for text_chunk in stream.text_stream:
-            raw_text += text_chunk
-            chars_received += len(text_chunk)
-            # Print progress every 5000 chars
-            if chars_received % 5000 < len(text_chunk):
-                print(f"  ...received {chars_received} chars so far")
-
-        # Get final message for usage stats
-        final_message = stream.get_final_message()
-        stop_reason = final_message.stop_reason
-        if final_message.usage:
-            input_tokens = final_message.usage.input_tokens
-            output_tokens = final_message.usage.output_tokens
-
-    print(f"Response: {len(raw_text)} chars, stop_reason={stop_reason}")
-    print(f"  Tokens: {input_tokens} in / {output_tokens} out")
-
-    if stop_reason == "max_tokens":
-        print("  WARNING: Response truncated at max_tokens. Will attempt JSON repair.")
-
-    # Parse JSON with fallback strategies
-    extracted = _parse_json_response(raw_text)
-    if extracted is None:
-        raise ValueError(
-            "Could not parse AI response as JSON. "
-            f"Raw preview: {raw_text[:500]}"
+        with stage("base64") as timing:
+            sent = {}  # image digest -> label of the tile that carried it
+            for tile in map_tiles:
+                digest = tile.digest()
+                if digest in sent:
+                    # Legend / key map identical to an earlier sheet's: refer back instead of resending
+                    content.append({"type": "text",
+                                    "text": f"\n[{tile.label}]: identical to [{sent[digest]}] (not repeated)"})
+                    continue
+                sent[digest] = tile.label
+                content.append({"type": "text", "text": f"\n[{tile.label}]:"})
+                content.append({
+                    "type": "image",
+                    "source": {
+                        "type": "base64",
+                        "media_type": tile.media_type,
+                        "data": tile.base64(),
+                    },
+                })
+            timing["bytes"] = sum(len(block["source"]["data"]) for block in content
+                                  if block["type"] == "image")
+            timing["duplicate_tiles"] = len(map_tiles) - len(sent)
+
+    return {
+        "model": MODEL,
+        "max_tokens": MAX_TOKENS,
+        "system": system,
+        "messages": [{"role": "user", "content": content}],
+    }
+
+
+def usage_stats(usage) -> dict:
+    """Token counts from a Messages API usage object, including prompt cache reads/writes."""
+    if usage is None:
+        return {}
+    return {
+        "input_tokens": usage.input_tokens or 0,
+        "output_tokens": usage.output_tokens or 0,
+        "cache_creation_input_tokens": getattr(usage, "cache_creation_input_tokens", 0) or 0,
+        "cache_read_input_tokens": getattr(usage, "cache_read_input_tokens", 0) or 0,
+    }
+
+
+def _add_usage(total: dict, usage: dict):
+    for key, value in usage.items():
+        total[key] = total.get(key, 0) + value
+
+
+def _record_key(name: str, record: dict):
+    """Identity of a record when stitching continuations (line items have no ID)."""
+    if name == "line_items":
+        return name, json.dumps(record, sort_keys=True)
+    return name, record.get(REQUIRED_KEYS[name])
+
+
+class ExtractionStream:
+    """
+    One streaming extraction. Iterate it to get (array_name, record) pairs
+    as each segment / structure / splice point / line item completes, while
+    the rest of the response is still arriving. Once iteration finishes,
+    `result` holds the full parsed extraction, `usage` the token counts
+    summed over all rounds (including prompt cache writes/reads,
+    time_to_first_token and continuations) and `stop_reason` why the model
+    stopped in the last round.
+
+    If a round stops at max_tokens, up to `max_continuations` follow-up
+    requests continue the same JSON document from the last complete record.
+    Records repeated by a continuation are skipped, so the stitched result
+    holds each record once. A stream that breaks after text has arrived is
+    continued the same way instead of starting over. If a continuation
+    round fails outright, the response so far is kept (repaired like a
+    max_tokens cutoff) and the failure noted in reconciliation.notes.
+
+    With a checkpoint (journal.JobJournal), the response text and usage are
+    recorded as they arrive, and a response left partial by an earlier run
+    is picked up from its last complete record.
+    Raises ValueError at the end if the response isn't parseable JSON.
+    """
+
+    def __init__(self, wo_text: str, map_text: str, map_tiles: list, api_key: str,
+                 verbose: bool = True, max_continuations: int = MAX_CONTINUATIONS,
+                 work_order: dict | None = None, checkpoint=None):
+        self.wo_text = wo_text
+        self.work_order = work_order
+        self.map_text = map_text
+        self.map_tiles = map_tiles
+        self.api_key = api_key
+        self.verbose = verbose
+        self.max_continuations = max_continuations
+        self.checkpoint = checkpoint
+        self.parser = RecordStreamParser()
+        self.raw_text = ""
+        self.result = None
+        self.usage = {}
+        self.stop_reason = None
+        self.rounds = 0
+        self._records = {name: [] for name in RECORD_ARRAYS}
+        self._seen = None  # record keys already kept before a continuation
+        self._round_started = False  # text received in the current round (no retry after that)
+        self._round_usage = {}
+        self._round_parts = []  # text of the current round so far
+        self._round_first_token = None
+        self._interruptions = 0
+        self._timeouts = 0  # timed-out attempts retried so far (scheduler.MAX_TIMEOUT_RETRIES)
+        self._continuation_error = None
+
+    def __iter__(self) -> Iterator[tuple[str, dict]]:
+        client = shared_client(self.api_key)
+        request = build_request(self.wo_text, self.map_text, self.map_tiles, self.work_order)
+        verbose = self.verbose
+
+        if verbose:
+            print(f"Calling Claude Opus 4.6 via streaming (max_tokens={MAX_TOKENS})...")
+            print(f"  WO text: {len(self.wo_text)} chars, map tiles: {len(self.map_tiles)}")
+
+        checkpoint = self.checkpoint
+        prefix, finished = "", False
+        if checkpoint is not None:
+            prefix, finished = yield from self._resume(checkpoint)
+            if prefix and not finished:
+                request = _continuation_request(request, prefix)
+
+        first_token = None
+        while not finished:
+            self.rounds += 1
+            if checkpoint is not None:
+                checkpoint.write_stream(prefix)
+            try:
+                text, round_first_token = yield from self._scheduled_round(client, request, prefix)
+            except Exception as e:
+                if not prefix:
+                    raise
+                # A continuation failed: keep what earlier rounds (and this one) produced
+                self.raw_text = prefix + "".join(self._round_parts)
+                self._continuation_error = f"{type(e).__name__}: {e}"
+                print(f"  WARNING: continuation round {self.rounds} failed ({self._continuation_error}); "
+                      f"keeping the {len(self.raw_text)} chars received")
+                break
+            if first_token is None:
+                first_token = round_first_token
+            self.raw_text = prefix + text
+            if checkpoint is not None:
+                checkpoint.save_state(usage=self.usage, stop_reason=self.stop_reason, rounds=self.rounds)
+
+            interrupted = self.stop_reason == "interrupted"
+            if not interrupted and (self.stop_reason != "max_tokens"
+                                    or self.rounds - self._interruptions > self.max_continuations):
+                break
+            # Continue from the last complete record boundary
+            _, report = repair_truncated_json(self.raw_text)
+            cut = report["cut_at"]
+            if cut is None or cut <= len(prefix):
+                if not interrupted:
+                    break
+                cut = len(prefix)  # nothing new completed: ask again from the same point
+            prefix = self.raw_text[:cut].rstrip()
+            if prefix:
+                request = _continuation_request(request, prefix)
+            self._restart_parser(prefix)
+            if verbose:
+                print(f"  Continuing from record boundary at {len(prefix)} chars "
+                      f"(round {self.rounds + 1})...")
+        if checkpoint is not None:
+            checkpoint.close()
+
+        usage = self.usage
+        usage["continuations"] = self.rounds - 1
+        usage["time_to_first_token"] = round(first_token, 2) if first_token is not None else None
+
+        if verbose:
+            print(f"Response: {len(self.raw_text)} chars, stop_reason={self.stop_reason}"
+                  + (f", {self.rounds} rounds" if self.rounds > 1 else ""))
+            print(f"  Tokens: {usage.get('input_tokens', 0)} in / {usage.get('output_tokens', 0)} out")
+            print(f"  Prompt cache: {usage.get('cache_creation_input_tokens', 0)} written / "
+                  f"{usage.get('cache_read_input_tokens', 0)} read"
+                  + (f", first token after {first_token:.1f}s" if first_token is not None else ""))
+
+        if self.stop_reason == "max_tokens":
+            print("  WARNING: Response truncated at max_tokens. Will attempt JSON repair.")
+
+        # Parse JSON with fallback strategies
+        self.result = _parse_json_response(self.raw_text)
+        if self.result is None:
+            raise ValueError(
+                "Could not parse AI response as JSON. "
+                f"Raw preview: {self.raw_text[:500]}"
+            )
+        if self.rounds > 1:
+            # Stitched at record level: arrays hold each streamed record once
+            for name, records in self._records.items():
+                if records:
+                    self.result[name] = records
+        if self._continuation_error:
+            _add_note(self.result, f"Continuation round {self.rounds} failed ({self._continuation_error}); "
+                                   "response kept up to the last complete record")
+
+    def _resume(self, checkpoint):
+        """
+        Pick up the response a previous run left in the checkpoint: yields
+        its records and returns (prefix to continue from, whether the
+        response was already complete).
+        """
+        partial = checkpoint.partial_stream()
+        if not partial:
+            return "", False
+        state = checkpoint.load_state()
+        self.usage = dict(state.get("usage") or {})
+        self.rounds = state.get("rounds", 0)
+        self.stop_reason = state.get("stop_reason")
+        finished = (self.stop_reason not in (None, "max_tokens", "interrupted")
+                    or (self.stop_reason == "max_tokens" and self.rounds > self.max_continuations))
+        if finished:
+            prefix = partial
+        else:
+            _, report = repair_truncated_json(partial)
+            prefix = partial[:report["cut_at"]].rstrip() if report["cut_at"] else ""
+        self._restart_parser(prefix)
+        self.raw_text = prefix
+        for name, records in self._records.items():
+            for record in records:
+                yield name, record
+        if self.verbose:
+            done = self.parser.summary()
+            print(f"  Resuming journaled response: {len(prefix)} of {len(partial)} chars kept"
+                  + (f" ({done})" if done else "") + (", already complete" if finished else ""))
+        return prefix, finished
+
+    def _scheduled_round(self, client, request: dict, prefix: str):
+        """
+        _stream_round under the model's rate limiter. Rate-limited,
+        overloaded and connection failures are retried with backoff as long
+        as no text has arrived yet in this round. Once text has arrived, the
+        round ends with stop_reason "interrupted" and the text so far, so
+        the caller can continue from it.
+        """
+        from pdf_processor import estimate_image_tokens, unique_tiles
+
+        limiter = limiter_for(request["model"])
+        image_tokens = sum(estimate_image_tokens(t.box[2], t.box[3]) for t in unique_tiles(self.map_tiles))
+        est_input = estimate_input_tokens(request, image_tokens)
+        for attempt in range(MAX_RETRIES + 1):
+            ticket = limiter.acquire(est_input, EXPECTED_OUTPUT_TOKENS)
+            self._round_started = False
+            self._round_parts = []
+            self._round_usage = {}
+            try:
+                result = yield from self._stream_round(client, request, prefix, limiter)
+            except Exception as e:
+                retryable = is_retryable(e, self._timeouts)
+                if retryable:
+                    self._timeouts += isinstance(e, APITimeoutError)
+                if self._round_started and retryable and self._interruptions < MAX_RETRIES:
+                    # Tokens were spent, so the ticket keeps its estimate
+                    self._interruptions += 1
+                    backoff(limiter, e, self._interruptions - 1, "Claude stream interrupted")
+                    self.stop_reason = "interrupted"
+                    return "".join(self._round_parts), self._round_first_token
+                limiter.release(ticket)
+                if self._round_started or not retryable or attempt == MAX_RETRIES:
+                    raise
+                limiter.observe(getattr(getattr(e, "response", None), "headers", None))
+                backoff(limiter, e, attempt, "Claude")
+                continue
+            usage = self._round_usage
+            limiter.settle(ticket, counted_input_tokens(usage), usage.get("output_tokens", 0))
+            if self.stop_reason is None and self._round_started and self._interruptions < MAX_RETRIES:
+                # The connection closed without an error before the message finished
+                self._interruptions += 1
+                print("  Claude stream ended early — continuing from the text received")
+                self.stop_reason = "interrupted"
+            return result
+
+    def _stream_round(self, client, request: dict, prefix: str, limiter=None):
+        """Stream one request; yields new records, returns (text, time to first token)."""
+        verbose = self.verbose
+        # Collect chunks and join once at the end (linear, unlike +=)
+        parts = self._round_parts = []
+        start = time.time()
+        first_token = self._round_first_token = None
+        checkpoint = self.checkpoint
+
+        with client.messages.stream(**request) as stream:
+            if limiter is not None:
+                limiter.observe(stream.response.headers)
+            chars_received = len(prefix)
+            for text_chunk in stream.text_stream:
+                self._round_started = True
+                if first_token is None:
+                    first_token = self._round_first_token = time.time() - start
+                parts.append(text_chunk)
+                if checkpoint is not None:
+                    checkpoint.append_stream(text_chunk)
+                chars_received += len(text_chunk)
+                # Print progress every 5000 chars
+                if verbose and chars_received % 5000 < len(text_chunk):
+                    done = self.parser.summary()
+                    print(f"  ...received {chars_received} chars so far"
+                          + (f" ({done})" if done else ""))
+                for name, record in self.parser.feed(text_chunk):
+                    if self._seen is not None:
+                        key = _record_key(name, record)
+                        if key in self._seen:
+                            continue
+                        self._seen.add(key)
+                    self._records[name].append(record)
+                    yield name, record
+
+            # Get final message for usage stats
+            final_message = stream.get_final_message()
+            self.stop_reason = final_message.stop_reason
+            self._round_usage = usage_stats(final_message.usage)
+            _add_usage(self.usage, self._round_usage)
+
+        elapsed = time.time() - start
+        generating = elapsed - (first_token or 0.0)
+        output_tokens = self._round_usage.get("output_tokens", 0)
+        from pdf_processor import unique_tiles
+        sent = unique_tiles(self.map_tiles)
+        record_request(
+            model=request["model"], round=self.rounds, stop_reason=self.stop_reason,
+            wall_s=round(elapsed, 3),
+            ttft_s=round(first_token, 3) if first_token is not None else None,
+            output_tokens_per_s=round(output_tokens / generating, 1) if generating > 0 else None,
+            image_bytes=sum(t.nbytes for t in sent), images=len(sent),
+            **self._round_usage,
         )
 
-    return extracted
+        return "".join(parts), first_token
+
+    def _restart_parser(self, prefix: str):
+        """Reset record state to exactly what the continuation prefix contains."""
+        self.parser = RecordStreamParser()
+        self._records = {name: [] for name in RECORD_ARRAYS}
+        for name, record in self.parser.feed(prefix):
+            self._records[name].append(record)
+        self._seen = {_record_key(name, record)
+                      for name, records in self._records.items() for record in records}
+
+
+def _continuation_request(request: dict, prefix: str) -> dict:
+    """The same request with prefix as a prefilled assistant turn to continue."""
+    return {**request, "messages": [
+        *request["messages"][:1],
+        {"role": "assistant", "content": prefix},
+    ]}
+
+
+def extract_with_claude(
+    wo_text: str,
+    map_text: str,
+    map_tiles: list,
+    api_key: str,
+    verbose: bool = True,
+    usage: dict | None = None,
+    work_order: dict | None = None,
+    checkpoint=None,
+) -> dict:
+    """
+    Call Claude Opus 4.6 with work order text + map tiles
+    (pdf_processor.Tile objects, base64-encoded here as the body is built).
+    Returns parsed extraction JSON dict.
+    Set verbose=False to silence streaming progress (used by batch mode,
+    where several extractions stream at once).
+    If a usage dict is passed it is filled with token counts summed over
+    any max_tokens continuations (including prompt cache writes/reads),
+    the number of continuations and time_to_first_token in seconds.
+    Use ExtractionStream directly to get records while they stream.
+    Pass work_order (project + line_items already extracted, see tiered.py)
+    to have Opus read only the map.
+    Pass a checkpoint (journal.JobJournal) to record the response as it
+    streams and resume one an earlier run left unfinished.
+    """
+    stream = ExtractionStream(wo_text, map_text, map_tiles, api_key, verbose,
+                              work_order=work_order, checkpoint=checkpoint)
+    try:
+        for _ in stream:
+            pass
+    finally:
+        if usage is not None:
+            usage.update(stream.usage)
+    return stream.result
+
+
+def _tile_grid_note(map_tiles: list) -> str:
+    """
+    Describe per-page section grids when they differ from the fixed 2x2
+    layout the system prompt explains (adaptive tiling). Empty otherwise.
+    """
+    grids = {}
+    for tile in map_tiles:
+        if tile.row is not None:
+            grids.setdefault(tile.page, set()).add((tile.row, tile.col))
+
+    full_2x2 = {(r, c) for r in (1, 2) for c in (1, 2)}
+    if all(cells == full_2x2 for cells in grids.values()):
+        return ""
+
+    lines = ["SECTION GRIDS (RxCy = row x from top, column y from left):"]
+    for page, cells in sorted(grids.items()):
+        rows = max(r for r, _ in cells)
+        cols = max(c for _, c in cells)
+        line = f"  Page {page}: {rows} rows x {cols} columns"
+        missing = [f"R{r}C{c}" for r in range(1, rows + 1) for c in range(1, cols + 1)
+                   if (r, c) not in cells]
+        if missing:
+            line += f" (blank sections omitted: {', '.join(missing)})"
+        lines.append(line)
+    return "\n".join(lines) + "\n"
 
 
 def _parse_json_response(raw_text: str) -> dict | None:
@@ -380,60 +852,28 @@ def _parse_json_response(raw_text: str) -> dict | None:
 
 
 def _repair_truncated_json(raw_text: str) -> dict | None:
-    """Repair truncated JSON from max_tokens cutoff."""
-    start = raw_text.find("{")
-    if start == -1:
-        return None
-
-    truncated = raw_text[start:]
-    if len(truncated) < 10:
+    """
+    Repair truncated JSON from max_tokens cutoff (one linear scan, see
+    json_stream.repair_truncated_json). Anything lost is printed and logged
+    in reconciliation.notes so the gap is visible after import.
+    """
+    repaired, report = repair_truncated_json(raw_text)
+    if not isinstance(repaired, dict):
         return None
 
-    # Try closing at each } from the end
-    for i in range(len(truncated) - 1, 100, -1):
-        if truncated[i] == "}":
-            try:
-                return json.loads(truncated[: i + 1])
-            except json.JSONDecodeError:
-                continue
-
-    # Count unclosed braces/brackets and close them
-    # Strip trailing incomplete entries
-    truncated = re.sub(r',\s*"[^"]*"?\s*:?\s*"?[^",\]\}]*$', "", truncated)
-    truncated = re.sub(r',\s*\{[^\}]*$', "", truncated)
-    truncated = re.sub(r',\s*\[[^\]]*$', "", truncated)
-    truncated = re.sub(r",\s*$", "", truncated)
-
-    braces = 0
-    brackets = 0
-    in_string = False
-    escape = False
-
-    for ch in truncated:
-        if escape:
-            escape = False
-            continue
-        if ch == "\\":
-            escape = True
-            continue
-        if ch == '"':
-            in_string = not in_string
-            continue
-        if in_string:
-            continue
-        if ch == "{":
-            braces += 1
-        elif ch == "}":
-            braces -= 1
-        elif ch == "[":
-            brackets += 1
-        elif ch == "]":
-            brackets -= 1
-
-    if in_string:
-        truncated += '"'
-    truncated += "]" * brackets
-    truncated += "}" * braces
-
-    print(f"  JSON repair: closed {braces} braces, {brackets} brackets")
-    return json.loads(truncated)
+    lost = [f"{n} {name}" for name, n in report["dropped"].items()]
+    lost += [f"all {name}" for name in report["missing"]]
+    print(f"  JSON repair: cut {report['truncated_chars']} trailing chars"
+          + (f", lost {', '.join(lost)}" if lost else ""))
+    if lost:
+        _add_note(repaired, f"Response truncated at max_tokens; incomplete or missing: {', '.join(lost)}")
+    return repaired
+
+
+def _add_note(result: dict, note: str):
+    """Append to result's reconciliation.notes (if the model left them in shape)."""
+    recon = result.setdefault("reconciliation", {})
+    if isinstance(recon, dict):
+        notes = recon.setdefault("notes", [])
+        if isinstance(notes, list):
+            notes.append(note)
@@ -0,0 +1,257 @@
+"""
+LYT Communications - Deferred (Message Batches) Extraction
+Submits a whole batch of work order / map jobs as one Message Batches
+request instead of streaming each one. Results usually arrive within an
+hour (at most 24h) and cost half the price of synchronous calls, which
+suits backlog processing that doesn't need answers in minutes.
+
+Each submission is recorded in tools/output/deferred/<batch_id>.json so a
+later `collect` run (from any machine with the same output folder) can
+download the results and write the usual per-job extraction JSON files.
+
+Usage:
+    python extract_workorder.py batch path/to/folder --deferred
+    python extract_workorder.py collect                # all pending batches
+    python extract_workorder.py collect msgbatch_01... --wait
+"""
+
+import argparse
+import json
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+from pathlib import Path
+
+from batch import prepare_job, save_job_result, validation_note, write_summary
+from extract_workorder import DEFAULT_RENDER_WORKERS, OUTPUT_DIR, load_api_key
+
+DEFERRED_DIR_NAME = "deferred"
+POLL_SECONDS = 60
+# Message Batches accepts up to 256MB per batch; stay well under it
+MAX_BATCH_BYTES = 200 * 1024 * 1024
+# SDK retries for batch create / status / results calls (shared_client has none:
+# its streaming calls go through scheduler.py instead)
+BATCH_API_RETRIES = 2
+
+
+def batch_client(api_key: str):
+    """The key's shared client (and connection pool), with SDK retries back on."""
+    from claude_client import shared_client
+    return shared_client(api_key).with_options(max_retries=BATCH_API_RETRIES)
+
+
+def deferred_dir(output_dir: Path) -> Path:
+    return Path(output_dir) / DEFERRED_DIR_NAME
+
+
+def _request_bytes(request: dict) -> int:
+    return len(json.dumps(request))
+
+
+def _chunk_requests(requests: list[dict]) -> list[list[dict]]:
+    """Split batch requests so each submission stays under MAX_BATCH_BYTES."""
+    chunks = [[]]
+    size = 0
+    for req in requests:
+        req_size = _request_bytes(req)
+        if chunks[-1] and size + req_size > MAX_BATCH_BYTES:
+            chunks.append([])
+            size = 0
+        chunks[-1].append(req)
+        size += req_size
+    return chunks
+
+
+def submit_deferred(
+    jobs: list[dict],
+    api_key: str,
+    output_dir: Path,
+    render_workers: int = DEFAULT_RENDER_WORKERS,
+    adaptive: bool = False,
+    compact: bool = False,
+) -> list[str]:
+    """
+    Render every job, then submit them as Message Batches (one per
+    MAX_BATCH_BYTES). Writes a record per batch and returns the batch IDs.
+    Jobs that fail to render are reported and left out.
+    """
+    from claude_client import MODEL, build_request
+
+    requests = []
+    job_index = {}
+    with ProcessPoolExecutor(max_workers=render_workers) as pool:
+        futures = {pool.submit(prepare_job, job["wo"], job["map"], adaptive, compact=compact): i
+                   for i, job in enumerate(jobs)}
+        for future in as_completed(futures):
+            i = futures[future]
+            job = jobs[i]
+            try:
+                prepared = future.result()
+            except Exception as e:
+                print(f"  FAILED {job['name']} (render): {e}")
+                continue
+            custom_id = f"job-{i:04d}"
+            job_metrics = prepared["metrics"]
+            with job_metrics.active():
+                params = build_request(prepared["wo_text"], prepared["map_text"], prepared["map_tiles"])
+            requests.append({"custom_id": custom_id, "params": params})
+            job_index[custom_id] = {**job, "timings": prepared["timings"]}
+            # Token usage arrives with the results; the line records the local stages
+            job_metrics.write(output_dir, status="deferred", custom_id=custom_id)
+            print(f"  Rendered {job['name']}: {len(prepared['map_tiles'])} tiles "
+                  f"({prepared['timings'].get('render', 0):.1f}s)")
+
+    if not requests:
+        return []
+
+    requests.sort(key=lambda r: r["custom_id"])
+    client = batch_client(api_key)
+    record_dir = deferred_dir(output_dir)
+    record_dir.mkdir(parents=True, exist_ok=True)
+    batch_ids = []
+
+    for chunk in _chunk_requests(requests):
+        batch = client.messages.batches.create(requests=chunk)
+        record = {
+            "batch_id": batch.id,
+            "created": datetime.now().isoformat(timespec="seconds"),
+            "model": MODEL,
+            "status": "submitted",
+            "output_dir": str(Path(output_dir).resolve()),
+            "jobs": {req["custom_id"]: job_index[req["custom_id"]] for req in chunk},
+        }
+        _write_record(record_dir / f"{batch.id}.json", record)
+        batch_ids.append(batch.id)
+        print(f"  Submitted {len(chunk)} jobs as {batch.id}")
+
+    return batch_ids
+
+
+def _write_record(path: Path, record: dict):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(record, f, indent=2, ensure_ascii=False)
+
+
+def _pending_records(output_dir: Path) -> list[Path]:
+    record_dir = deferred_dir(output_dir)
+    if not record_dir.exists():
+        return []
+    pending = []
+    for path in sorted(record_dir.glob("*.json")):
+        with open(path, "r", encoding="utf-8") as f:
+            if json.load(f).get("status") != "collected":
+                pending.append(path)
+    return pending
+
+
+def collect_batch(client, record_path: Path, wait: bool = False, poll: float = POLL_SECONDS) -> list[dict] | None:
+    """
+    Download one submitted batch and write its extraction files.
+    Returns per-job result dicts (same shape as batch mode), or None if the
+    batch is still processing and wait is False.
+    """
+    from claude_client import _parse_json_response, usage_stats
+
+    with open(record_path, "r", encoding="utf-8") as f:
+        record = json.load(f)
+    batch_id = record["batch_id"]
+
+    while True:
+        batch = client.messages.batches.retrieve(batch_id)
+        if batch.processing_status == "ended":
+            break
+        counts = batch.request_counts
+        print(f"  {batch_id}: {batch.processing_status} "
+              f"({counts.succeeded + counts.errored + counts.canceled + counts.expired}"
+              f"/{len(record['jobs'])} done)")
+        if not wait:
+            return None
+        time.sleep(poll)
+
+    output_dir = Path(record.get("output_dir") or OUTPUT_DIR)
+    results = {cid: {**job, "status": "pending", "output": None, "error": None}
+               for cid, job in record["jobs"].items()}
+    used_names = set()
+
+    for entry in client.messages.batches.results(batch_id):
+        result = results.get(entry.custom_id)
+        if result is None:
+            continue
+        job = record["jobs"][entry.custom_id]
+        outcome = entry.result
+        if outcome.type != "succeeded":
+            error = getattr(outcome, "error", None)
+            detail = getattr(getattr(error, "error", None), "message", None) or error
+            result.update(status="failed", error=f"{outcome.type}: {detail}" if detail else outcome.type)
+            print(f"  FAILED {job['name']}: {result['error']}")
+            continue
+
+        message = outcome.message
+        result["usage"] = usage_stats(message.usage)
+        raw_text = "".join(block.text for block in message.content if block.type == "text")
+        if message.stop_reason == "max_tokens":
+            print(f"  WARNING: {job['name']} truncated at max_tokens. Will attempt JSON repair.")
+        extracted = _parse_json_response(raw_text)
+        if extracted is None:
+            result.update(status="failed", error=f"extraction: unparseable JSON: {raw_text[:200]}")
+            print(f"  FAILED {job['name']}: could not parse response as JSON")
+            continue
+
+        output_file = save_job_result(extracted, job, result, output_dir, used_names)
+        print(f"  OK {job['name']} -> {output_file.name}{validation_note(result)}")
+
+    for result in results.values():
+        if result["status"] == "pending":
+            result.update(status="failed", error="no result returned by batch")
+
+    record["status"] = "collected"
+    record["collected"] = datetime.now().isoformat(timespec="seconds")
+    _write_record(record_path, record)
+    return list(results.values())
+
+
+def collect_main(argv: list[str]):
+    parser = argparse.ArgumentParser(
+        prog="extract_workorder.py collect",
+        description="Download results of deferred (Message Batches) extractions",
+    )
+    parser.add_argument("batch_ids", nargs="*", help="Batch IDs to collect (default: all pending)")
+    parser.add_argument("--output", help="Output directory holding deferred/ records",
+                        default=str(OUTPUT_DIR))
+    parser.add_argument("--wait", action="store_true", help="Poll until each batch has ended")
+    parser.add_argument("--poll", type=float, default=POLL_SECONDS,
+                        help=f"Seconds between status checks with --wait (default {POLL_SECONDS})")
+    args = parser.parse_args(argv)
+
+    output_dir = Path(args.output)
+    if args.batch_ids:
+        records = [deferred_dir(output_dir) / f"{bid}.json" for bid in args.batch_ids]
+        for path in records:
+            if not path.exists():
+                print(f"ERROR: No record for batch {path.stem} in {path.parent}")
+                sys.exit(1)
+    else:
+        records = _pending_records(output_dir)
+    if not records:
+        print("No pending deferred batches.")
+        return
+
+    client = batch_client(load_api_key())
+    start = time.time()
+    all_results = []
+    still_running = 0
+    for path in records:
+        results = collect_batch(client, path, args.wait, args.poll)
+        if results is None:
+            still_running += 1
+            continue
+        all_results.extend(results)
+
+    if all_results:
+        summary_file = write_summary(all_results, output_dir, time.time() - start)
+        ok = sum(1 for r in all_results if r["status"] == "ok")
+        print(f"\n  COLLECTED: {ok}/{len(all_results)} succeeded")
+        print(f"  Summary: {summary_file}")
+    if still_running:
+        print(f"  {still_running} batch(es) still processing — run collect again later")
@@ -6,8 +6,22 @@ Usage:
     python extract_workorder.py
     python extract_workorder.py --wo path/to/workorder.pdf --map path/to/map.pdf
     python extract_workorder.py --wo path/to/workorder.pdf  (no map)
+    python extract_workorder.py --wo wo.pdf --map map.pdf --no-cache
+    python extract_workorder.py --wo wo.pdf --map map.pdf --render-workers 4
+    python extract_workorder.py --wo wo.pdf --map map.pdf --adaptive
+    python extract_workorder.py --wo wo.pdf --map map.pdf --compact-tiles
+    python extract_workorder.py --wo wo.pdf --map map.pdf --bbox 29.41,-98.62,29.52,-98.43
+    python extract_workorder.py batch path/to/folder --jobs 4
+    python extract_workorder.py batch --manifest jobs.csv
+    python extract_workorder.py batch path/to/folder --deferred
+    python extract_workorder.py collect --wait
+    python extract_workorder.py watch path/to/inbox --status-port 8765
+    python extract_workorder.py serve --port 8787
+    python extract_workorder.py bench --quick
 
 Double-click run.bat for the easiest launch.
+Per-stage timings, memory and token counts of every run are appended to
+<output>/metrics.jsonl (see metrics.py).
 """
 
 import argparse
@@ -22,6 +36,7 @@ from pathlib import Path
 REPO_DIR = Path(__file__).resolve().parent.parent
 ENV_FILE = REPO_DIR / ".env.local"
 OUTPUT_DIR = REPO_DIR / "tools" / "output"
+DEFAULT_RENDER_WORKERS = max(1, min(4, (os.cpu_count() or 2) - 1))
 
 
 def load_api_key() -> str:
@@ -71,110 +86,35 @@ def pick_file(title: str, required: bool = True) -> str | None:
         sys.exit(1)
 
 
-def main():
-    parser = argparse.ArgumentParser(description="LYT Work Order Extraction Tool")
-    parser.add_argument("--wo", help="Path to work order PDF")
-    parser.add_argument("--map", help="Path to construction map PDF (optional)")
-    parser.add_argument("--output", help="Output directory", default=str(OUTPUT_DIR))
-    args = parser.parse_args()
-
-    print()
-    print("=" * 60)
-    print("  LYT Communications - Work Order Extractor")
-    print("  Powered by Claude Opus 4.6")
-    print("=" * 60)
-    print()
-
-    # Load API key
-    api_key = load_api_key()
-    print(f"API key loaded from {ENV_FILE.name}")
-
-    # Get file paths
-    wo_path = args.wo
-    map_path = args.map
-
-    if not wo_path:
-        print("Select the WORK ORDER PDF...")
-        wo_path = pick_file("Select Work Order PDF", required=True)
-
-    if not map_path and not args.wo:
-        print("\nSelect the CONSTRUCTION MAP PDF (or Cancel to skip)...")
-        map_path = pick_file("Select Construction Map PDF (optional)", required=False)
-
-    if not wo_path or not os.path.exists(wo_path):
-        print(f"ERROR: Work order file not found: {wo_path}")
-        sys.exit(1)
-
-    print(f"\nWork Order: {os.path.basename(wo_path)}")
-    if map_path:
-        print(f"Map:        {os.path.basename(map_path)}")
-    else:
-        print("Map:        (none)")
-
-    # Import processing modules
-    from pdf_processor import extract_work_order_text, tile_map_pdf, extract_map_text
-    from claude_client import extract_with_claude
-
-    # Step 1: Extract work order text
-    print("\n[1/3] Extracting work order text...")
-    start = time.time()
-    wo_text = extract_work_order_text(wo_path)
-    print(f"  {len(wo_text)} characters extracted ({time.time() - start:.1f}s)")
-
-    if len(wo_text) < 30:
-        print("WARNING: Very little text extracted from work order.")
-        print("The PDF may be scanned/image-based. Extraction quality may be limited.")
-
-    # Step 2: Process map (if provided)
-    map_tiles = []
-    map_text = ""
-    if map_path and os.path.exists(map_path):
-        print("\n[2/3] Processing construction map...")
-        start = time.time()
-        map_tiles = tile_map_pdf(map_path)
-        map_text = extract_map_text(map_path)
-        elapsed = time.time() - start
-        total_mb = sum(len(t["base64"]) * 3 / 4 for t in map_tiles) / (1024 * 1024)
-        print(f"  {len(map_tiles)} tiles ({total_mb:.1f}MB) in {elapsed:.1f}s")
-    else:
-        print("\n[2/3] No map PDF — skipping map processing")
-
-    # Step 3: Call Claude for extraction
-    print("\n[3/3] Sending to Claude Opus 4.6 for extraction...")
-    print("  This may take 1-3 minutes depending on document complexity.")
-    start = time.time()
-
-    try:
-        extracted = extract_with_claude(wo_text, map_text, map_tiles, api_key)
-    except Exception as e:
-        print(f"\nERROR: Extraction failed: {e}")
-        sys.exit(1)
-
-    elapsed = time.time() - start
-    print(f"  Extraction complete ({elapsed:.1f}s)")
-
-    # Derive output filename from job code
+def output_name(extracted: dict) -> str:
+    """Derive a filename-safe job code from the extraction's project info."""
     job_code = "unknown"
     if extracted.get("project", {}).get("work_order_number"):
         job_code = extracted["project"]["work_order_number"]
     elif extracted.get("project", {}).get("name"):
         job_code = extracted["project"]["name"]
     # Sanitize for filename
-    safe_name = "".join(c if c.isalnum() or c in ".-_" else "_" for c in job_code)
+    return "".join(c if c.isalnum() or c in ".-_" else "_" for c in job_code)
 
-    # Save output
-    output_dir = Path(args.output)
+
+def save_extraction(extracted: dict, output_dir: Path, name: str | None = None) -> Path:
+    """Write extraction JSON to output_dir and return the file path."""
+    output_dir = Path(output_dir)
     output_dir.mkdir(parents=True, exist_ok=True)
-    output_file = output_dir / f"{safe_name}_extraction.json"
+    output_file = output_dir / f"{name or output_name(extracted)}_extraction.json"
 
     with open(output_file, "w", encoding="utf-8") as f:
         json.dump(extracted, f, indent=2, ensure_ascii=False)
 
+    return output_file
+
+
+def print_summary(extracted: dict, output_file: Path, report: dict | None = None):
+    """Print the post-extraction summary block (with the validation.validate() report, if given)."""
     print(f"\n{'=' * 60}")
     print(f"  EXTRACTION COMPLETE")
     print(f"{'=' * 60}")
 
-    # Print summary
     proj = extracted.get("project", {})
     segments = extracted.get("segments", [])
     structures = extracted.get("structures", [])
@@ -193,7 +133,7 @@ def main():
 
     total_footage = recon.get("total_footage", 0)
     if not total_footage:
-        total_footage = sum(s.get("footage", 0) for s in segments)
+        total_footage = report["totals"]["footage"] if report else sum(s.get("footage", 0) for s in segments)
     print(f"  Total Footage: {total_footage:,.0f} LF")
 
     unmatched = recon.get("unmatched_items", [])
@@ -206,22 +146,236 @@ def main():
         for note in notes[:5]:
             print(f"    - {note}")
 
+    from validation import print_report
+    print()
+    print_report(report)
+
     print(f"\n  Output: {output_file}")
     print()
     print("  Next step: Paste this JSON into lytcomm.com -> JSON Import")
     print(f"{'=' * 60}")
 
-    # Open output folder
+
+def open_folder(path: Path):
+    """Open a folder in the platform file browser (best effort)."""
     try:
         if sys.platform == "win32":
-            os.startfile(str(output_dir))
+            os.startfile(str(path))
         elif sys.platform == "darwin":
-            subprocess.run(["open", str(output_dir)])
+            subprocess.run(["open", str(path)])
         else:
-            subprocess.run(["xdg-open", str(output_dir)])
+            subprocess.run(["xdg-open", str(path)])
     except Exception:
         pass  # Non-critical
 
 
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] == "batch":
+        from batch import batch_main
+        batch_main(sys.argv[2:])
+        return
+    if len(sys.argv) > 1 and sys.argv[1] == "collect":
+        from deferred import collect_main
+        collect_main(sys.argv[2:])
+        return
+    if len(sys.argv) > 1 and sys.argv[1] == "watch":
+        from watch import watch_main
+        watch_main(sys.argv[2:])
+        return
+    if len(sys.argv) > 1 and sys.argv[1] == "serve":
+        from service import serve_main
+        serve_main(sys.argv[2:])
+        return
+    if len(sys.argv) > 1 and sys.argv[1] == "bench":
+        from benchmark import bench_main
+        bench_main(sys.argv[2:])
+        return
+
+    parser = argparse.ArgumentParser(description="LYT Work Order Extraction Tool")
+    parser.add_argument("--wo", help="Path to work order PDF")
+    parser.add_argument("--map", help="Path to construction map PDF (optional)")
+    parser.add_argument("--output", help="Output directory", default=str(OUTPUT_DIR))
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Ignore cached results and always call Claude")
+    parser.add_argument("--render-workers", type=int, default=DEFAULT_RENDER_WORKERS,
+                        help=f"Processes for rendering map pages and reading long work orders "
+                             f"(default {DEFAULT_RENDER_WORKERS})")
+    parser.add_argument("--adaptive", action="store_true",
+                        help="Size map tiles to each sheet's density instead of a fixed 2x2 grid")
+    parser.add_argument("--compact-tiles", action="store_true",
+                        help="Send map tiles as the smallest equally legible PNG / JPEG and drop blank sections "
+                             "(default: JPEG q70 tiles, as the web app sends)")
+    parser.add_argument("--per-sheet", action="store_true",
+                        help="Extract each map sheet in its own concurrent request and merge "
+                             "(no page limit)")
+    parser.add_argument("--tiered", action="store_true",
+                        help="Copy WO line items with a fast model while the map renders; "
+                             "Opus reads only the map")
+    parser.add_argument("--bbox", metavar="MIN_LAT,MIN_LNG,MAX_LAT,MAX_LNG",
+                        help="Project area GPS points are validated against "
+                             "(default: within 30 km of the job's median point)")
+    args = parser.parse_args()
+    if args.tiered and args.per_sheet:
+        parser.error("--tiered and --per-sheet can't be combined")
+    from validation import parse_bbox
+    try:
+        bbox = parse_bbox(args.bbox)
+    except ValueError as e:
+        parser.error(str(e))
+
+    print()
+    print("=" * 60)
+    print("  LYT Communications - Work Order Extractor")
+    print("  Powered by Claude Opus 4.6")
+    print("=" * 60)
+    print()
+
+    # Load API key
+    api_key = load_api_key()
+    print(f"API key loaded from {ENV_FILE.name}")
+
+    # Get file paths
+    wo_path = args.wo
+    map_path = args.map
+
+    if not wo_path:
+        print("Select the WORK ORDER PDF...")
+        wo_path = pick_file("Select Work Order PDF", required=True)
+
+    if not map_path and not args.wo:
+        print("\nSelect the CONSTRUCTION MAP PDF (or Cancel to skip)...")
+        map_path = pick_file("Select Construction Map PDF (optional)", required=False)
+
+    if not wo_path or not os.path.exists(wo_path):
+        print(f"ERROR: Work order file not found: {wo_path}")
+        sys.exit(1)
+
+    print(f"\nWork Order: {os.path.basename(wo_path)}")
+    if map_path:
+        print(f"Map:        {os.path.basename(map_path)}")
+    else:
+        print("Map:        (none)")
+
+    # Import processing modules
+    from pdf_processor import (
+        MAX_PAGES_MAP, extract_map_page_texts, extract_map_text, extract_work_order_text, tile_map_pdf,
+    )
+    from claude_client import MODEL, extract_with_claude
+    from cache import extraction_cache, extraction_cache_key
+    from journal import open_journal
+    from metrics import JobMetrics
+
+    has_map = bool(map_path and os.path.exists(map_path))
+    max_pages = None if args.per_sheet else MAX_PAGES_MAP
+    mode = "tiered" if args.tiered else "per_sheet" if args.per_sheet else "single"
+    job_metrics = JobMetrics(Path(wo_path).stem, wo=wo_path, map=map_path if has_map else None,
+                             mode=mode, adaptive=args.adaptive, compact=args.compact_tiles).activate()
+
+    # Stages finished by an earlier, interrupted run of this job are reused
+    journal = open_journal(wo_path, map_path if has_map else None, adaptive=args.adaptive,
+                           per_sheet=args.per_sheet, tiered=args.tiered, compact=args.compact_tiles)
+    resumed = journal.stages()
+    if resumed:
+        print(f"\nResuming interrupted run (done: {', '.join(resumed)})")
+    texts = journal.load_text()
+
+    # Step 1: Extract work order text
+    print("\n[1/3] Extracting work order text...")
+    if texts is not None:
+        wo_text, map_text = texts["wo_text"], texts["map_text"]
+        print(f"  {len(wo_text)} characters (from journal)")
+    else:
+        with job_metrics.stage("wo_text") as timing:
+            wo_text = extract_work_order_text(wo_path, workers=args.render_workers)
+            timing["chars"] = len(wo_text)
+        print(f"  {len(wo_text)} characters extracted ({job_metrics.seconds('wo_text'):.1f}s)")
+
+    if len(wo_text) < 30:
+        print("WARNING: Very little text extracted from work order.")
+        print("The PDF may be scanned/image-based and OCR unavailable (install Tesseract).")
+        print("Extraction quality may be limited.")
+
+    # Step 2: Process map (if provided)
+    map_tiles = []
+    if texts is None:
+        with job_metrics.stage("map_text") as timing:
+            map_text = extract_map_text(map_path, max_pages) if has_map else ""
+            timing["chars"] = len(map_text)
+        journal.save_text(wo_text=wo_text, map_text=map_text)
+
+    # Identical PDFs + prompts + tile settings + model -> reuse prior result
+    cache = extraction_cache()
+    cache_key = extraction_cache_key(wo_path, map_path if has_map else None, wo_text, map_text,
+                                     args.adaptive, args.per_sheet, args.tiered, args.compact_tiles)
+    cached = None if args.no_cache else cache.get_json(cache_key)
+
+    if cached is not None:
+        print("\n[2/3] Cache hit — skipping map rendering and Claude call")
+        print(f"  Cached {cached.get('created', '')} ({cached.get('model', '')})")
+        extracted = cached["result"]
+        journal.finish()
+        job_metrics.data["cache_hit"] = True
+    else:
+        work_order = None
+        if args.tiered:
+            from tiered import LINE_ITEM_MODEL, start_line_items
+            print(f"\n  Reading work order line items (WO table, else {LINE_ITEM_MODEL}) in the background...")
+            work_order = start_line_items(wo_text, api_key, wo_path=wo_path)
+
+        if has_map:
+            print("\n[2/3] Processing construction map...")
+            with job_metrics.stage("render"):
+                map_tiles = journal.load_tiles()
+                if map_tiles is None:
+                    map_tiles = tile_map_pdf(map_path, workers=args.render_workers, adaptive=args.adaptive,
+                                             max_pages=max_pages, compact=args.compact_tiles)
+                    journal.save_tiles(map_tiles)
+            total_mb = sum(t.nbytes for t in map_tiles) / (1024 * 1024)
+            print(f"  {len(map_tiles)} tiles ({total_mb:.1f}MB) in {job_metrics.seconds('render'):.1f}s")
+        else:
+            print("\n[2/3] No map PDF — skipping map processing")
+
+        # Step 3: Call Claude for extraction
+        print("\n[3/3] Sending to Claude Opus 4.6 for extraction...")
+        print("  This may take 1-3 minutes depending on document complexity.")
+
+        try:
+            with job_metrics.stage("api"):
+                if args.tiered:
+                    from tiered import extract_tiered
+                    extracted = extract_tiered(wo_text, map_text, map_tiles, api_key, work_order=work_order)
+                elif args.per_sheet and has_map:
+                    from sheets import extract_per_sheet
+                    extracted = extract_per_sheet(wo_text, extract_map_page_texts(map_path, None),
+                                                  map_tiles, api_key)
+                else:
+                    extracted = extract_with_claude(wo_text, map_text, map_tiles, api_key, checkpoint=journal)
+        except Exception as e:
+            print(f"\nERROR: Extraction failed: {e}")
+            print("  Finished stages are journaled; run the same command again to resume.")
+            job_metrics.write(Path(args.output), status="failed", error=str(e))
+            sys.exit(1)
+
+        print(f"  Extraction complete ({job_metrics.seconds('api'):.1f}s)")
+
+        cache.put_json(cache_key, {
+            "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "model": MODEL,
+            "result": extracted,
+        })
+        journal.finish()
+
+    from validation import validate
+    report = validate(extracted, bbox)
+    output_file = save_extraction(extracted, Path(args.output))
+    print_summary(extracted, output_file, report)
+    job_metrics.write(Path(args.output), status="ok", output=str(output_file),
+                      validation={"errors": len(report["errors"]), "warnings": len(report["warnings"])}
+                      if report else None)
+
+    # Open output folder
+    open_folder(output_file.parent)
+
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,139 @@
+"""
+LYT Communications - Resumable Job Journal
+Records each stage of an extraction on disk as it completes, so a crashed
+or interrupted run picks up where it stopped instead of starting over:
+
+    text.json      work order / map text
+    tiles.bin      encoded map tiles (same format as the tile cache)
+    stream.txt     the response text streamed so far
+    state.json     token usage and stop reason of the rounds already finished
+
+A re-run of the same job (same PDFs and options) skips the stages that are
+done. If the stream was cut, the partial response is sent back as a
+prefilled assistant turn and the model continues from the last complete
+record (see ExtractionStream continuation in claude_client.py).
+The journal is deleted once the extraction has been saved.
+
+Journals live in tools/output/.journal/<job key>/.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+from pathlib import Path
+
+from cache import CACHE_DIR, _atomic_write, hash_file
+
+JOURNAL_DIR = CACHE_DIR.parent / ".journal"
+
+
+def job_key(wo_path: str, map_path: str | None, **options) -> str:
+    """Identify a job: both PDFs' bytes, the model, tiling settings and run options."""
+    from claude_client import MODEL
+    from pdf_processor import tile_settings
+
+    parts = {
+        "wo_pdf": hash_file(wo_path),
+        "map_pdf": hash_file(map_path),
+        "model": MODEL,
+        "tiles": tile_settings(options.get("adaptive", False), options.get("compact", False)) if map_path else None,
+        "options": options,
+    }
+    return hashlib.sha256(json.dumps(parts, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def open_journal(wo_path: str, map_path: str | None, **options) -> "JobJournal":
+    return JobJournal(JOURNAL_DIR / job_key(wo_path, map_path, **options)[:32])
+
+
+class JobJournal:
+    """Stage outputs of one job. Every write is atomic except the stream, which is appended."""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._stream = None
+
+    def _file(self, name: str) -> Path:
+        return self.path / name
+
+    def _read_json(self, name: str):
+        try:
+            with open(self._file(name), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write_json(self, name: str, value):
+        self.path.mkdir(parents=True, exist_ok=True)
+        _atomic_write(self._file(name), json.dumps(value, ensure_ascii=False).encode("utf-8"))
+
+    def stages(self) -> list[str]:
+        """Stages already recorded, for progress output."""
+        names = {"text.json": "text", "tiles.bin": "tiles", "stream.txt": "partial response"}
+        return [label for name, label in names.items() if self._file(name).exists()]
+
+    # Stage 1: text
+    def load_text(self) -> dict | None:
+        return self._read_json("text.json")
+
+    def save_text(self, **texts):
+        self._write_json("text.json", texts)
+
+    # Stage 2: tiles
+    def load_tiles(self) -> list | None:
+        from pdf_processor import _unpack_tiles
+
+        try:
+            blob = self._file("tiles.bin").read_bytes()
+        except OSError:
+            return None
+        return _unpack_tiles(blob)
+
+    def save_tiles(self, tiles: list):
+        from pdf_processor import _pack_tiles
+
+        self.path.mkdir(parents=True, exist_ok=True)
+        _atomic_write(self._file("tiles.bin"), _pack_tiles(tiles))
+
+    # Stage 3: the response stream (ExtractionStream checkpoint interface)
+    def partial_stream(self) -> str:
+        try:
+            return self._file("stream.txt").read_text(encoding="utf-8")
+        except (OSError, UnicodeDecodeError):
+            return ""
+
+    def write_stream(self, text: str):
+        """Start a round: the stream file holds exactly `text` (the continuation prefix)."""
+        self.close()
+        self.path.mkdir(parents=True, exist_ok=True)
+        self._stream = open(self._file("stream.txt"), "w", encoding="utf-8")
+        self._stream.write(text)
+        self._stream.flush()
+
+    def append_stream(self, chunk: str):
+        if self._stream is None:
+            self._stream = open(self._file("stream.txt"), "a", encoding="utf-8")
+        self._stream.write(chunk)
+        self._stream.flush()
+
+    def load_state(self) -> dict:
+        """{'usage', 'stop_reason', 'rounds'} as of the last finished round, {} if none."""
+        return self._read_json("state.json") or {}
+
+    def save_state(self, **state):
+        self._write_json("state.json", state)
+
+    def close(self):
+        if self._stream is not None:
+            self._stream.close()
+            self._stream = None
+
+    def finish(self):
+        """The extraction is saved: drop the journal."""
+        self.close()
+        shutil.rmtree(self.path, ignore_errors=True)
+
+    def __del__(self):
+        if self._stream is not None and not self._stream.closed and os is not None:
+            self._stream.close()
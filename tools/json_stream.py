@@ -0,0 +1,214 @@
+"""
+LYT Communications - Incremental Extraction JSON Parser
+Consumes Claude's streamed text chunk by chunk and emits each completed
+segments / structures / splice_points / line_items record as soon as its
+closing brace arrives, so callers can write or count records while the
+rest of the response is still streaming.
+
+One pass over the text: the scanner only tracks strings, escapes and the
+container stack, and slices each record's text out of the chunks.
+"""
+
+import json
+
+RECORD_ARRAYS = ("segments", "structures", "splice_points", "line_items")
+
+# Key every record of that array must have to be emitted
+REQUIRED_KEYS = {
+    "segments": "segment_id",
+    "structures": "id",
+    "splice_points": "splice_id",
+    "line_items": "code",
+}
+
+
+class RecordStreamParser:
+    """
+    Feed text chunks; get back (array_name, record) pairs for every record
+    completed by that chunk. Records that don't parse or lack their
+    required key are counted in `invalid` instead of being emitted.
+    """
+
+    def __init__(self, arrays: tuple[str, ...] = RECORD_ARRAYS):
+        self.arrays = set(arrays)
+        self.counts = {name: 0 for name in arrays}
+        self.invalid = {name: 0 for name in arrays}
+        self._stack = []  # "{" / "[" for each open container
+        self._in_string = False
+        self._escape = False
+        self._key_parts = None  # chars of a string at root level (a key candidate)
+        self._last_key = None
+        self._array = None  # record array currently open at root level
+        self._record_parts = None  # text of the record being captured
+
+    def feed(self, chunk: str) -> list[tuple[str, dict]]:
+        records = []
+        capture_from = 0 if self._record_parts is not None else None
+        stack = self._stack
+
+        for i, ch in enumerate(chunk):
+            if self._in_string:
+                if self._key_parts is not None:
+                    self._key_parts.append(ch)
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    if self._key_parts is not None:
+                        self._last_key = "".join(self._key_parts[:-1])
+                        self._key_parts = None
+                continue
+
+            if ch == '"':
+                if not stack:
+                    continue  # text before the root object (e.g. a markdown fence)
+                self._in_string = True
+                if len(stack) == 1:
+                    self._key_parts = []
+            elif ch == "{":
+                if len(stack) == 2 and self._array is not None and stack[1] == "[":
+                    self._record_parts = []
+                    capture_from = i
+                stack.append("{")
+            elif ch == "[":
+                if stack:
+                    if len(stack) == 1:
+                        self._array = self._last_key if self._last_key in self.arrays else None
+                    stack.append("[")
+            elif ch == "}" or ch == "]":
+                if not stack:
+                    continue
+                stack.pop()
+                if ch == "}" and len(stack) == 2 and self._record_parts is not None:
+                    self._record_parts.append(chunk[capture_from:i + 1])
+                    self._emit("".join(self._record_parts), records)
+                    self._record_parts = None
+                    capture_from = None
+                elif ch == "]" and len(stack) == 1:
+                    self._array = None
+
+        if self._record_parts is not None and capture_from is not None:
+            self._record_parts.append(chunk[capture_from:])
+        return records
+
+    def _emit(self, text: str, records: list):
+        name = self._array
+        try:
+            record = json.loads(text)
+        except json.JSONDecodeError:
+            self.invalid[name] += 1
+            return
+        if not isinstance(record, dict) or REQUIRED_KEYS.get(name, "") not in record:
+            self.invalid[name] += 1
+            return
+        self.counts[name] += 1
+        records.append((name, record))
+
+    def summary(self) -> str:
+        """Short progress string like '12 segments, 30 structures'."""
+        return ", ".join(f"{n} {name}" for name, n in self.counts.items() if n)
+
+
+def repair_truncated_json(raw_text: str) -> tuple[dict | None, dict]:
+    """
+    Repair a response cut off mid-document (max_tokens) in a single pass.
+
+    The scanner tracks the container stack and remembers the last point
+    where everything before it is complete: after a ',' between values,
+    after a container closes, or just after one opens. Records inside
+    arrays are kept whole or not at all, so a half-written segment is
+    dropped rather than imported with missing fields. The text is cut at
+    that point and the open containers are closed, then parsed once.
+
+    Returns (document or None, report) where report is
+    { 'cut_at', 'truncated_chars', 'dropped': {array: n}, 'missing': [keys] }.
+    """
+    report = {"cut_at": None, "truncated_chars": 0, "dropped": {}, "missing": []}
+    start = raw_text.find("{")
+    if start == -1:
+        return None, report
+    text = raw_text[start:]
+
+    # Frame: [closer, key, parent_is_array]
+    stack = []
+    in_string = False
+    escape = False
+    key_start = None
+    last_key = None
+    blocked = 0  # open objects/arrays that are array elements (can't cut inside)
+    cut = None  # (position, closers)
+    started = {}  # top-level array name -> elements opened
+    completed = {}  # top-level array name -> elements closed before the cut
+    closed_at = []  # (position, array name) per completed top-level element
+
+    def mark(pos):
+        nonlocal cut
+        if blocked == 0:
+            cut = (pos, "".join(frame[0] for frame in reversed(stack)))
+
+    for i, ch in enumerate(text):
+        if in_string:
+            if escape:
+                escape = False
+            elif ch == "\\":
+                escape = True
+            elif ch == '"':
+                in_string = False
+                if key_start is not None:
+                    last_key = text[key_start + 1:i]
+                    key_start = None
+            continue
+
+        if ch == '"':
+            in_string = True
+            if len(stack) == 1:
+                key_start = i
+        elif ch == "{" or ch == "[":
+            parent_is_array = bool(stack) and stack[-1][0] == "]"
+            if parent_is_array:
+                blocked += 1
+                if len(stack) == 2:
+                    name = stack[1][1]
+                    started[name] = started.get(name, 0) + 1
+            key = last_key if len(stack) == 1 else None
+            stack.append(["}" if ch == "{" else "]", key, parent_is_array])
+            mark(i + 1)
+        elif ch == "}" or ch == "]":
+            if not stack:
+                break
+            frame = stack.pop()
+            if frame[2]:
+                blocked -= 1
+                if len(stack) == 2:
+                    closed_at.append((i + 1, stack[1][1]))
+            if not stack:
+                # Root closed: the document wasn't truncated after all
+                cut = (i + 1, "")
+                break
+            mark(i + 1)
+        elif ch == ",":
+            mark(i)
+
+    if cut is None:
+        return None, report
+
+    pos, closers = cut
+    for end, name in closed_at:
+        if end <= pos:
+            completed[name] = completed.get(name, 0) + 1
+    repaired = text[:pos].rstrip().rstrip(",") + closers
+
+    try:
+        doc = json.loads(repaired)
+    except json.JSONDecodeError:
+        return None, report
+
+    report["cut_at"] = start + pos
+    report["truncated_chars"] = len(text) - pos
+    report["dropped"] = {name: n - completed.get(name, 0)
+                         for name, n in started.items() if n > completed.get(name, 0)}
+    if isinstance(doc, dict):
+        report["missing"] = [k for k in (*RECORD_ARRAYS, "reconciliation") if k not in doc]
+    return doc, report
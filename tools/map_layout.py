@@ -0,0 +1,161 @@
+"""
+LYT Communications - Map Sheet Layout Detection
+Finds the legend and key map boxes on a construction sheet from its vector
+drawings and text, so tiling can crop exactly those regions instead of the
+fixed LEGEND_X_RATIO / LEGEND_BOTTOM_RATIO split.
+
+Detected layouts are cached per sheet template (page size, rotation and
+where the "LEGEND" / "KEY MAP" labels sit), so every later sheet drawn on
+the same title block skips detection.
+"""
+
+import hashlib
+import json
+
+import fitz  # PyMuPDF
+
+from cache import DiskCache
+
+LEGEND_LABELS = ("LEGEND",)
+KEY_MAP_LABELS = ("KEY MAP", "KEYMAP", "KEY PLAN", "VICINITY MAP")
+
+MIN_BOX_RATIO = 0.08  # candidate boxes must be at least this fraction of page width and height
+MAX_BOX_AREA_RATIO = 0.5  # ... and no more than this fraction of the page (not the sheet border)
+MIN_REGION_PT = 40  # leftover strip regions smaller than this are ignored
+LAYOUT_VERSION = 1  # bump when detection changes, so cached layouts are redone
+
+_memo: dict[str, dict | None] = {}
+
+
+def layout_cache() -> DiskCache:
+    return DiskCache("layouts")
+
+
+def _label_hits(page, labels: tuple[str, ...]) -> list:
+    hits = []
+    for label in labels:
+        hits.extend(page.search_for(label))
+    return sorted(hits, key=lambda r: (r.y0, r.x0))
+
+
+def template_key(page) -> str:
+    """
+    Identify a sheet template cheaply: page geometry plus the positions of
+    the legend/key map labels (text search only, no drawing extraction).
+    """
+    parts = {
+        "version": LAYOUT_VERSION,
+        "size": [round(page.rect.width), round(page.rect.height)],
+        "rotation": page.rotation,
+        "legend": [[round(v) for v in r] for r in _label_hits(page, LEGEND_LABELS)],
+        "key_map": [[round(v) for v in r] for r in _label_hits(page, KEY_MAP_LABELS)],
+    }
+    return hashlib.sha256(json.dumps(parts, sort_keys=True).encode()).hexdigest()
+
+
+def _candidate_boxes(page) -> list:
+    """Rectangles drawn on the page that are big enough to be a legend/key map frame."""
+    rect = page.rect
+    min_w = rect.width * MIN_BOX_RATIO
+    min_h = rect.height * MIN_BOX_RATIO
+    max_area = rect.width * rect.height * MAX_BOX_AREA_RATIO
+    boxes = []
+    for path in page.get_cdrawings():
+        kinds = {item[0] for item in path["items"]}
+        if kinds <= {"re", "qu"}:
+            rects = [fitz.Rect(item[1]) if item[0] == "re" else fitz.Quad(item[1]).rect
+                     for item in path["items"]]
+        elif kinds == {"l"} and 3 <= len(path["items"]) <= 5:
+            rects = [fitz.Rect(path["rect"])]  # frame drawn as a closed polyline
+        else:
+            continue
+        for r in rects:
+            if r.width >= min_w and r.height >= min_h and r.width * r.height <= max_area:
+                boxes.append(r)
+    return boxes
+
+
+def _enclosing_box(hits: list, boxes: list):
+    """Smallest candidate box containing any of the label hits."""
+    best = None
+    for hit in hits:
+        for box in boxes:
+            if box.contains(hit) and (best is None or box.get_area() < best.get_area()):
+                best = box
+    return best
+
+
+def detect_layout(page) -> dict | None:
+    """
+    Find legend and key map frames on a sheet.
+    Returns { 'legend', 'key_map', 'map' } as [x0, y0, x1, y1] lists in page
+    coordinates (legend/key_map may be None), or None if no labelled frame
+    was found and the caller should fall back to the fixed ratios.
+    """
+    rect = page.rect
+    boxes = _candidate_boxes(page)
+    legend = _enclosing_box(_label_hits(page, LEGEND_LABELS), boxes)
+    key_map = _enclosing_box(_label_hits(page, KEY_MAP_LABELS), boxes)
+    found = [r for r in (legend, key_map) if r is not None]
+    if not found:
+        return None
+
+    strip_x = min(r.x0 for r in found)
+    strip_y = min(r.y0 for r in found)
+    if strip_x >= rect.width * 0.5:
+        # Title block down the right edge: map is everything to its left
+        map_rect = fitz.Rect(rect.x0, rect.y0, strip_x, rect.y1)
+        strip = fitz.Rect(strip_x, rect.y0, rect.x1, rect.y1)
+    elif strip_y >= rect.height * 0.5:
+        # Title block along the bottom: map is everything above it
+        map_rect = fitz.Rect(rect.x0, rect.y0, rect.x1, strip_y)
+        strip = fitz.Rect(rect.x0, strip_y, rect.x1, rect.y1)
+    else:
+        # Frames float inside the drawing: tile the whole sheet
+        map_rect = fitz.Rect(rect)
+        strip = None
+
+    # Only one frame found: give the rest of the strip to the other tile,
+    # so nothing outside the map area is silently dropped
+    if strip is not None and (legend is None or key_map is None):
+        known = legend or key_map
+        if strip.width >= strip.height:
+            rest = [fitz.Rect(strip.x0, strip.y0, known.x0, strip.y1),
+                    fitz.Rect(known.x1, strip.y0, strip.x1, strip.y1)]
+        else:
+            rest = [fitz.Rect(strip.x0, strip.y0, strip.x1, known.y0),
+                    fitz.Rect(strip.x0, known.y1, strip.x1, strip.y1)]
+        rest = max(rest, key=lambda r: r.get_area())
+        if rest.width >= MIN_REGION_PT and rest.height >= MIN_REGION_PT:
+            if legend is None:
+                legend = rest
+            else:
+                key_map = rest
+
+    def as_list(r):
+        return [round(v, 2) for v in r] if r is not None else None
+
+    return {"legend": as_list(legend), "key_map": as_list(key_map), "map": as_list(map_rect)}
+
+
+def sheet_layout(page, use_cache: bool = True) -> dict | None:
+    """
+    detect_layout() with a per-template cache: in memory for this process,
+    and on disk under tools/output/.cache/layouts/ across runs.
+    """
+    if not use_cache:
+        return detect_layout(page)
+
+    key = template_key(page)
+    if key in _memo:
+        return _memo[key]
+
+    cache = layout_cache()
+    cached = cache.get_json(key)
+    if cached is not None:
+        layout = cached["layout"]
+    else:
+        layout = detect_layout(page)
+        cache.put_json(key, {"layout": layout})
+    _memo[key] = layout
+    return layout
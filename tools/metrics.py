@@ -0,0 +1,239 @@
+"""
+LYT Communications - Run Instrumentation
+Measures each stage of a job and appends one JSON line per job to
+<output>/metrics.jsonl, so regressions show up run over run and batch
+capacity can be planned from real numbers.
+
+Each stage records wall time, the CPU time of the stage's own thread and
+the peak RSS of the process while the stage ran (peak_rss_mb; Linux resets
+the high-water mark at each stage start). A stage that ran alongside
+another thread's stage (API stages of concurrent batch jobs) can't be told
+apart from it, so it gets process_peak_rss_mb instead, as do stages on
+systems without a resettable high-water mark (the process peak so far).
+Rendering adds time spent rasterizing vs encoding tiles and, when pages
+render in a process pool, the largest worker's peak RSS during its pages
+(worker_peak_rss_mb). Every API request adds time to first token, output
+tokens/sec, token counts and the image bytes sent:
+
+    {"job": "WO-1234", "started": "...", "mode": "single", "wall_s": 96.1,
+     "stages": {"wo_text": {"wall_s": 0.41, "cpu_s": 0.4, "peak_rss_mb": 92.3},
+                "render": {..., "rasterize_s": 6.2, "encode_s": 2.9, "tiles": 24},
+                "base64": {..., "bytes": 5242880}, "api": {...}},
+     "requests": [{"model": "claude-opus-4-6", "ttft_s": 4.8, "output_tokens_per_s": 61.5, ...}],
+     "process": {"peak_rss_mb": 412.0, "child_peak_rss_mb": 180.5, "child_cpu_s": 14.2}}
+
+"process" is read when the line is written and covers the whole process
+so far (peak RSS, and CPU / peak RSS of child processes reaped, such as a
+finished render pool). Jobs running side by side (batch, watch, the
+service) share it, so it is only that job's own cost in a single-job run.
+
+Instrumented code calls stage() / record() / record_request()
+unconditionally; they do nothing unless a JobMetrics is active in the
+calling thread (JobMetrics.activate() / active(), or bind() for work
+handed to a thread pool).
+"""
+
+import json
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+
+try:
+    import resource  # Unix only; "process" is omitted elsewhere
+except ImportError:
+    resource = None
+
+METRICS_FILE = "metrics.jsonl"
+
+_local = threading.local()
+_write_lock = threading.Lock()
+_stages_lock = threading.Lock()
+_open_stages = []  # per running stage: {"thread", "peak", "overlap"}
+_HWM_FILE = "/proc/self/status"
+_CLEAR_REFS_FILE = "/proc/self/clear_refs"
+_lifetime_peak_mb = 0.0  # high-water marks from before each reset
+
+
+def peak_rss_mb() -> float | None:
+    """This process's peak RSS since the last reset_peak_rss() (else since it started)."""
+    try:
+        with open(_HWM_FILE) as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    if resource is None:
+        return None
+    # ru_maxrss is KB on Linux, bytes on macOS
+    unit = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / unit, 1)
+
+
+def reset_peak_rss() -> bool:
+    """
+    Start a new peak RSS measurement (Linux only; False elsewhere). Running
+    stages keep the peak they saw so far.
+    """
+    global _lifetime_peak_mb
+    with _stages_lock:
+        current = peak_rss_mb() or 0.0
+        _lifetime_peak_mb = max(_lifetime_peak_mb, current)
+        for state in _open_stages:
+            state["peak"] = max(state["peak"], current)
+        try:
+            with open(_CLEAR_REFS_FILE, "w") as f:
+                f.write("5")
+        except OSError:
+            return False
+        return True
+
+
+def _process_usage() -> dict:
+    """Process-wide figures (not per job): peak RSS, and CPU / peak RSS of reaped children."""
+    if resource is None:
+        return {}
+    # ru_maxrss is KB on Linux, bytes on macOS
+    unit = 1024 * 1024 if sys.platform == "darwin" else 1024
+    peak = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / unit, _lifetime_peak_mb)
+    values = {"peak_rss_mb": round(peak, 1)}
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    if children.ru_maxrss:
+        values["child_peak_rss_mb"] = round(children.ru_maxrss / unit, 1)
+        values["child_cpu_s"] = round(children.ru_utime + children.ru_stime, 3)
+    return values
+
+
+def _merge(entry: dict, values: dict):
+    """Add numbers into a stage entry (peaks take the max; repeated stages add up)."""
+    for key, value in values.items():
+        if isinstance(value, (int, float)) and not isinstance(value, bool) and key in entry:
+            entry[key] = max(entry[key], value) if "peak" in key else round(entry[key] + value, 3)
+        else:
+            entry[key] = value
+
+
+class JobMetrics:
+    """Measurements for one job; picklable so batch render workers can hand it back."""
+
+    def __init__(self, job: str, **info):
+        self.data = {"job": job, "started": datetime.now().isoformat(timespec="seconds"), **info,
+                     "stages": {}, "requests": []}
+        self._start = time.time()
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        return {"data": self.data, "_start": self._start}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def activate(self) -> "JobMetrics":
+        """Report to this job from the calling thread from now on (a CLI run's one job)."""
+        _local.job = self
+        return self
+
+    @contextmanager
+    def active(self):
+        """Make this the job that stage() / record() report to in this thread."""
+        previous = getattr(_local, "job", None)
+        _local.job = self
+        try:
+            yield self
+        finally:
+            _local.job = previous
+
+    @contextmanager
+    def stage(self, name: str):
+        """Time a block; the yielded dict takes extra values (e.g. byte counts)."""
+        entry = {}
+        thread = threading.get_ident()
+        state = {"thread": thread, "peak": 0.0, "overlap": False}
+        resettable = reset_peak_rss()  # before registering: the old peak isn't this stage's
+        with _stages_lock:
+            for other in _open_stages:
+                if other["thread"] != thread:
+                    other["overlap"] = state["overlap"] = True
+            _open_stages.append(state)
+        wall, cpu = time.perf_counter(), time.thread_time()
+        try:
+            yield entry
+        finally:
+            with _stages_lock:
+                _open_stages.remove(state)
+                peak = peak_rss_mb()
+            memory = {}
+            if peak is not None:
+                own = resettable and not state["overlap"]
+                memory["peak_rss_mb" if own else "process_peak_rss_mb"] = max(peak, state["peak"])
+            entry = {"wall_s": round(time.perf_counter() - wall, 3),
+                     "cpu_s": round(time.thread_time() - cpu, 3), **memory, **entry}
+            self.record(name, **entry)
+
+    def record(self, name: str, **values):
+        with self._lock:
+            _merge(self.data["stages"].setdefault(name, {}), values)
+
+    def record_request(self, **values):
+        with self._lock:
+            self.data["requests"].append(values)
+
+    def seconds(self, name: str) -> float:
+        return self.data["stages"].get(name, {}).get("wall_s", 0.0)
+
+    def write(self, output_dir: Path, **info) -> Path:
+        """Append this job's line to output_dir/metrics.jsonl."""
+        self.data.update(info)
+        self.data["wall_s"] = round(time.time() - self._start, 3)
+        process = _process_usage()
+        if process:
+            self.data["process"] = process
+        path = Path(output_dir) / METRICS_FILE
+        path.parent.mkdir(parents=True, exist_ok=True)
+        line = json.dumps(self.data, ensure_ascii=False)
+        with _write_lock, open(path, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+        return path
+
+
+def current() -> JobMetrics | None:
+    """The job active in this thread, if any."""
+    return getattr(_local, "job", None)
+
+
+@contextmanager
+def stage(name: str):
+    job = current()
+    if job is None:
+        yield {}
+        return
+    with job.stage(name) as entry:
+        yield entry
+
+
+def record(name: str, **values):
+    job = current()
+    if job is not None:
+        job.record(name, **values)
+
+
+def record_request(**values):
+    job = current()
+    if job is not None:
+        job.record_request(**values)
+
+
+def bind(fn):
+    """fn wrapped to report to this thread's job when it runs on a worker thread."""
+    job = current()
+    if job is None:
+        return fn
+
+    def run(*args, **kwargs):
+        with job.active():
+            return fn(*args, **kwargs)
+    return run
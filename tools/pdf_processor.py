@@ -5,9 +5,21 @@ Replicates the tiling logic from JobImportPage.js.
 """
 
 import base64
+import hashlib
 import io
+import json
+import math
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterator
+
 import fitz  # PyMuPDF
-from PIL import Image
+from PIL import Image, ImageChops, ImageStat
+
+from cache import DiskCache
+from map_layout import LAYOUT_VERSION, sheet_layout
+from metrics import peak_rss_mb, record, reset_peak_rss
 
 # Map tiling constants — must match JobImportPage.js
 MAP_RENDER_SCALE = 2.5
@@ -18,124 +30,934 @@ LEGEND_X_RATIO = 0.72
 LEGEND_TOP_RATIO = 0.0
 LEGEND_BOTTOM_RATIO = 0.55
 
-MAX_PAGES_WORKORDER = 10
+# Find legend/key map frames on each sheet instead of the fixed ratios
+# above (which remain the fallback when no labelled frame is found)
+DETECT_SHEET_LAYOUT = True
+
 MAX_PAGES_MAP = 4
 
+# Work order text: every page is read. Long work orders are split into
+# chunks of WO_CHUNK_PAGES for a process pool; pages without a text layer
+# are OCR'd locally (Tesseract via PyMuPDF) when it is installed
+WO_CHUNK_PAGES = 8
+WO_EDGE_ZONE = 0.1  # share of the page height at the top and bottom where headers/footers sit
+WO_EDGE_BAND = 0.02  # lines within this share of the page height count as the same position
+WO_EDGE_MIN_PAGES = 3  # a header/footer must repeat in place on most pages, and at least this many
+OCR_LANGUAGE = "eng"
+OCR_DPI = 300
+
+# Claude vision limits: images over 1568px on the long edge or ~1.15MP are
+# downscaled by the API before reading; cost is about (w * h) / 750 tokens.
+MAX_IMAGE_EDGE = 1568
+MAX_IMAGE_PIXELS = 1_150_000
+PIXELS_PER_TOKEN = 750
+
+# Adaptive tiling (opt-in): pick scale and grid per page from map density
+ADAPTIVE_TEXT_PX = 16  # target word-box height of the smallest labels, in pixels
+ADAPTIVE_DENSE_TEXT_PX = 20  # ... on sheets with dense linework
+ADAPTIVE_DENSE_ITEMS_PER_SQIN = 4.0
+ADAPTIVE_MIN_SCALE = 1.0
+ADAPTIVE_MAX_SCALE = 4.0
+ADAPTIVE_MAX_TILES = 16  # section tiles per page
+ADAPTIVE_TOKEN_BUDGET = 1.0  # a page's plan may cost at most this share of its fixed 2x2 image tokens
+BLANK_TILE_MAX_ITEMS = 2  # section tiles with no text and this few vector items are dropped
+
+# Compact tiles (opt-in, compact=True / --compact-tiles): instead of the
+# MAP_JPEG_QUALITY JPEG above, each tile is sent as a palettized PNG, or a
+# lower-quality JPEG, when that reads as well as the JPEG would (see
+# _encode_tile), and section tiles that render essentially empty are dropped
+TILE_PNG_COLORS = 32
+TILE_PNG_ACCEPT_RATIO = 0.6  # a legible PNG this much smaller than the JPEG is taken without trying JPEGs
+TILE_JPEG_QUALITIES = (45, 55)  # tried when the PNG is bigger than that
+INK_LEVEL = 200  # a pixel whose darkest channel is below this is ink, not paper
+LEGIBLE_RED_RECALL_DROP = 0.02  # a candidate may keep this much less of the red ink...
+LEGIBLE_INK_PSNR_DROP_DB = 1.0  # ...and be this much noisier around ink than the baseline
+BLANK_INK_FRACTION = 0.0005  # section tiles with less ink than this are dropped
+
+
+def tile_settings(adaptive: bool = False, compact: bool = False) -> dict:
+    """Current tiling parameters (used in cache keys)."""
+    settings = {
+        "scale": MAP_RENDER_SCALE,
+        "quality": MAP_JPEG_QUALITY,
+        "cols": TILE_COLS,
+        "rows": TILE_ROWS,
+        "legend_x": LEGEND_X_RATIO,
+        "legend_top": LEGEND_TOP_RATIO,
+        "legend_bottom": LEGEND_BOTTOM_RATIO,
+        "max_pages": MAX_PAGES_MAP,
+        "detect_layout": LAYOUT_VERSION if DETECT_SHEET_LAYOUT else None,
+        "compact": {
+            "jpeg_qualities": TILE_JPEG_QUALITIES,
+            "png_colors": TILE_PNG_COLORS,
+            "png_accept": TILE_PNG_ACCEPT_RATIO,
+            "ink_level": INK_LEVEL,
+            "red_recall_drop": LEGIBLE_RED_RECALL_DROP,
+            "psnr_drop": LEGIBLE_INK_PSNR_DROP_DB,
+            "blank_ink": BLANK_INK_FRACTION,
+        } if compact else None,
+    }
+    if adaptive:
+        settings["adaptive"] = {
+            "max_edge": MAX_IMAGE_EDGE,
+            "max_pixels": MAX_IMAGE_PIXELS,
+            "text_px": ADAPTIVE_TEXT_PX,
+            "dense_text_px": ADAPTIVE_DENSE_TEXT_PX,
+            "dense_items": ADAPTIVE_DENSE_ITEMS_PER_SQIN,
+            "scale_range": [ADAPTIVE_MIN_SCALE, ADAPTIVE_MAX_SCALE],
+            "max_tiles": ADAPTIVE_MAX_TILES,
+            "token_budget": ADAPTIVE_TOKEN_BUDGET,
+            "blank_items": BLANK_TILE_MAX_ITEMS,
+        }
+    return settings
+
+
+_SPACES = re.compile(r"[ \t\u00a0]+")
+_PAGE_NUMBER = re.compile(r"\b(page\s*)?\d+\s*(of|/)\s*\d+\b|\bpage\s*\d+\b")
+# A unit of measure or a rate-card-like code (UG1, AE3.1): the row is a line item
+_LINE_ITEM_TOKEN = re.compile(r"\b(LF|EA|SF|CF|HR|SPAN)\b|\b[A-Z]{1,4}\d{1,3}[A-Z]?(\.\d)?\b")
+_ROW_TOLERANCE = 3.0  # points: lines whose vertical centres are this close share a row
+
+
+def _page_lines(page, textpage=None) -> list[tuple[str, float, bool]]:
+    """
+    One page's text lines in reading order as (text, y, in_table): y is the
+    line's vertical centre as a share of the page height, and in_table
+    marks lines inside a ruled table or on the same row as a unit code or
+    unit of measure (a line item's description cell, for instance) or
+    between two such rows.
+    """
+    height = page.rect.height or 1.0
+    lines = []
+    for block in page.get_text("dict", textpage=textpage)["blocks"]:
+        for line in block.get("lines", []):
+            text = _SPACES.sub(" ", "".join(span["text"] for span in line["spans"])).strip()
+            if text:
+                lines.append((text, fitz.Rect(line["bbox"])))
+    try:
+        tables = [fitz.Rect(t.bbox) for t in page.find_tables().tables]
+    except Exception:
+        tables = []
+    item_rows = [(r.y0 + r.y1) / 2 for text, r in lines if _LINE_ITEM_TOKEN.search(text)]
+    result = []
+    for text, r in lines:
+        mid = (r.y0 + r.y1) / 2
+        in_table = (any(t.contains(fitz.Point((r.x0 + r.x1) / 2, mid)) for t in tables)
+                    or bool(item_rows) and min(item_rows) - _ROW_TOLERANCE <= mid <= max(item_rows) + _ROW_TOLERANCE)
+        result.append((text, mid / height, in_table))
+    return result
+
+
+def _read_wo_page(page, ocr: bool = True) -> tuple[list[tuple[str, float, bool]], bool, str | None]:
+    """
+    (lines, ocr_used, ocr_error) for one work order page (lines as in
+    _page_lines). The text layer is used when it has any text; otherwise a
+    page with images is OCR'd.
+    """
+    text = page.get_text("text")
+    if len(text.strip()) > 5 or not ocr or not page.get_images():
+        return _page_lines(page), False, None
+    try:
+        textpage = page.get_textpage_ocr(language=OCR_LANGUAGE, dpi=OCR_DPI, full=True)
+    except RuntimeError as e:  # Tesseract / tessdata not installed
+        return _page_lines(page), False, str(e)
+    return _page_lines(page, textpage), True, None
 
-def extract_work_order_text(pdf_path: str) -> str:
-    """Extract text from work order PDF, preserving line structure."""
+
+def _wo_pages_worker(pdf_path: str, start: int, stop: int, ocr: bool = True) -> list[tuple]:
+    """Process-pool worker: open the PDF in this process and read pages start..stop-1."""
     doc = fitz.open(pdf_path)
-    pages_to_read = min(doc.page_count, MAX_PAGES_WORKORDER)
-    full_text = ""
+    try:
+        return [_read_wo_page(doc[i], ocr) for i in range(start, stop)]
+    finally:
+        doc.close()
 
-    for i in range(pages_to_read):
-        page = doc[i]
-        text = page.get_text("text")
-        if text and len(text.strip()) > 5:
-            full_text += f"\n--- Page {i + 1} ---\n{text.strip()}"
 
-    if doc.page_count > MAX_PAGES_WORKORDER:
-        full_text += f"\n\n[NOTE: PDF has {doc.page_count} pages but only first {MAX_PAGES_WORKORDER} were processed]"
+def iter_work_order_pages(pdf_path: str, workers: int = 1, ocr: bool = True) -> Iterator[tuple[int, list, bool]]:
+    """
+    Yield (page_num, lines, ocr_used) for every page of a work order, in
+    order, with lines as in _page_lines (whitespace compacted). With
+    workers > 1 and more than WO_CHUNK_PAGES pages, chunks of pages are
+    read in a process pool and yielded as each finishes in turn.
+    """
+    doc = fitz.open(pdf_path)
+    page_count = doc.page_count
+    starts = range(0, page_count, WO_CHUNK_PAGES)
+    if workers > 1 and len(starts) > 1:
+        doc.close()
+        stops = [min(start + WO_CHUNK_PAGES, page_count) for start in starts]
+        with ProcessPoolExecutor(max_workers=min(workers, len(starts))) as pool:
+            chunks = pool.map(_wo_pages_worker, [pdf_path] * len(starts), starts, stops, [ocr] * len(starts))
+            pages = (page for chunk in chunks for page in chunk)
+            yield from _checked_ocr(pages)
+        return
+    try:
+        yield from _checked_ocr(_read_wo_page(doc[i], ocr) for i in range(page_count))
+    finally:
+        doc.close()
 
-    doc.close()
-    return full_text.strip()
+
+def _checked_ocr(pages: Iterator[tuple]) -> Iterator[tuple[int, list, bool]]:
+    """Number the pages and report an OCR failure once rather than per page."""
+    warned = False
+    for page_num, (lines, ocr_used, error) in enumerate(pages, 1):
+        if error and not warned:
+            print(f"  OCR unavailable, scanned pages have no text ({error})")
+            warned = True
+        yield page_num, lines, ocr_used
+
+
+def _edge_keys(lines: list[tuple[str, float, bool]]) -> list[tuple | None]:
+    """
+    Position key per line for header/footer matching: (zone, index within
+    the zone, y band, text with page numbers masked), or None for lines
+    outside the top/bottom WO_EDGE_ZONE and for line item table lines.
+    """
+    keys = [None] * len(lines)
+    top = [i for i, (_, y, _) in enumerate(lines) if y < WO_EDGE_ZONE]
+    bottom = [i for i, (_, y, _) in enumerate(lines) if y > 1 - WO_EDGE_ZONE][::-1]
+    for zone, indexes in (("top", top), ("bottom", bottom)):
+        for n, i in enumerate(indexes):
+            text, y, in_table = lines[i]
+            if not in_table:
+                keys[i] = (zone, n, round(y / WO_EDGE_BAND), _PAGE_NUMBER.sub("#", text.lower()))
+    return keys
+
+
+def extract_work_order_text(pdf_path: str, workers: int = 1, ocr: bool = True) -> str:
+    """
+    Extract text from every work order page, preserving line structure.
+    Header and footer lines that repeat at the same place on most pages
+    (WO_EDGE_MIN_PAGES at least) are kept only on the first page they
+    appear on; line item table rows are never dropped. Scanned pages are
+    OCR'd (marked "(OCR)") when Tesseract is available.
+    """
+    pages = []
+    ocr_pages = 0
+    for page_num, lines, ocr_used in iter_work_order_pages(pdf_path, workers, ocr):
+        pages.append((page_num, lines, ocr_used, _edge_keys(lines)))
+        ocr_pages += ocr_used
+
+    counts = {}
+    for _, _, _, keys in pages:
+        for key in set(keys) - {None}:
+            counts[key] = counts.get(key, 0) + 1
+    repeated = {key for key, n in counts.items() if n >= WO_EDGE_MIN_PAGES and n * 2 > len(pages)}
+
+    parts = []
+    kept = set()
+    for page_num, lines, ocr_used, keys in pages:
+        text_lines = []
+        for (line, _, _), key in zip(lines, keys):
+            if key in repeated:
+                if key in kept:
+                    continue
+                kept.add(key)
+            text_lines.append(line)
+        text = "\n".join(text_lines)
+        if len(text) > 5:
+            parts.append(f"--- Page {page_num}{' (OCR)' if ocr_used else ''} ---\n{text}")
+    record("wo_text", pages=len(pages), ocr_pages=ocr_pages)
+    return "\n".join(parts)
+
+
+class Tile:
+    """
+    One encoded map tile. The image bytes (JPEG or PNG, see media_type) are
+    kept as a memoryview (no copy when sliced out of a cache blob) and only
+    turned into base64 when the request body is built.
+    """
+
+    __slots__ = ("data", "name", "page", "row", "col", "box", "scale", "nbytes", "media_type", "_digest")
+
+    def __init__(self, data, name: str, page: int = 0, row: int | None = None,
+                 col: int | None = None, box: tuple[int, int, int, int] = (0, 0, 0, 0),
+                 scale: float = MAP_RENDER_SCALE, media_type: str = "image/jpeg"):
+        self.data = memoryview(data)
+        self.name = name  # "LEGEND", "KEY MAP", "Section R1C1"
+        self.page = page  # 1-based page number
+        self.row = row  # 1-based grid position for section tiles, else None
+        self.col = col
+        self.box = box  # (x, y, w, h) in canvas pixels at `scale`
+        self.scale = scale
+        self.nbytes = self.data.nbytes
+        self.media_type = media_type
+        self._digest = None
+
+    @property
+    def label(self) -> str:
+        return f"Page {self.page} - {self.name}"
+
+    @property
+    def size(self) -> str:
+        return f"{self.box[2]}x{self.box[3]}"
+
+    def base64(self) -> str:
+        return base64.b64encode(self.data).decode("ascii")
+
+    def digest(self) -> str:
+        """Hash of the encoded image; identical renders (a legend repeated on every sheet) match."""
+        if self._digest is None:  # asked for on every request round
+            self._digest = hashlib.sha1(self.data).hexdigest()
+        return self._digest
+
+    def meta(self) -> dict:
+        return {"name": self.name, "row": self.row, "col": self.col,
+                "box": list(self.box), "scale": self.scale, "media_type": self.media_type}
+
+    def __reduce__(self):
+        # memoryviews don't pickle; send bytes across the process pool
+        return (Tile, (bytes(self.data), self.name, self.page, self.row, self.col,
+                       self.box, self.scale, self.media_type))
+
+    def __repr__(self):
+        return f"Tile({self.label!r}, {self.size}, {self.nbytes} bytes)"
 
 
-def _render_page_to_image(page, scale: float) -> Image.Image:
-    """Render a PDF page to a PIL Image at given scale."""
-    mat = fitz.Matrix(scale, scale)
-    pix = page.get_pixmap(matrix=mat, alpha=False)
+def unique_tiles(tiles: list[Tile]) -> list[Tile]:
+    """Tiles whose image isn't identical to an earlier one's (what build_request actually sends)."""
+    seen = set()
+    unique = []
+    for tile in tiles:
+        digest = tile.digest()
+        if digest not in seen:
+            seen.add(digest)
+            unique.append(tile)
+    return unique
+
+
+def _pack_tiles(tiles: list[Tile]) -> bytes:
+    """Serialize tiles (a page's for the tile cache, a job's for the journal): JSON header line + raw images."""
+    header = [{**t.meta(), "page": t.page, "nbytes": t.nbytes} for t in tiles]
+    return b"".join([json.dumps(header).encode("utf-8"), b"\n", *(t.data for t in tiles)])
+
+
+def _unpack_tiles(blob: bytes) -> list[Tile] | None:
+    """Inverse of _pack_tiles; tiles view into blob without copying. None if unreadable."""
+    try:
+        newline = blob.index(b"\n")
+        header = json.loads(blob[:newline])
+        view = memoryview(blob)
+        offset = newline + 1
+        tiles = []
+        for meta in header:
+            end = offset + meta["nbytes"]
+            tiles.append(Tile(view[offset:end], meta["name"], page=meta.get("page", 0),
+                              row=meta["row"], col=meta["col"], box=tuple(meta["box"]),
+                              scale=meta["scale"], media_type=meta.get("media_type", "image/jpeg")))
+            offset = end
+    except (ValueError, KeyError, TypeError):
+        return None
+    if offset != len(blob):
+        return None
+    return tiles
+
+
+def _render_clip(page, mat, x: int, y: int, w: int, h: int) -> Image.Image:
+    """
+    Render just one pixel box of a page (in canvas pixels at `mat`).
+    Only this tile's pixels are ever in memory.
+    """
+    clip = fitz.Rect(x, y, x + w, y + h) * ~mat
+    pix = page.get_pixmap(matrix=mat, clip=clip, alpha=False)
     img = Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
+    del pix
     return img
 
 
-def _crop_to_base64(img: Image.Image, x: int, y: int, w: int, h: int, quality: int) -> str:
-    """Crop a region from an image and return base64 JPEG."""
-    cropped = img.crop((x, y, x + w, y + h))
+def _jpeg(img: Image.Image, quality: int) -> bytes:
+    buffer = io.BytesIO()
+    img.save(buffer, format="JPEG", quality=quality)
+    return buffer.getvalue()
+
+
+def _palette_png(img: Image.Image) -> bytes:
     buffer = io.BytesIO()
-    cropped.save(buffer, format="JPEG", quality=quality)
-    return base64.b64encode(buffer.getvalue()).decode("ascii")
+    img.quantize(colors=TILE_PNG_COLORS, method=Image.Quantize.FASTOCTREE).save(buffer, format="PNG")
+    return buffer.getvalue()
+
 
+def _count(mask: Image.Image) -> int:
+    return mask.histogram()[255]
 
-def tile_map_pdf(pdf_path: str) -> list[dict]:
+
+def _red_mask(img: Image.Image) -> Image.Image:
+    """Pixels of red ink (footage labels, conduit runs) as a 0/255 mask."""
+    r, g, b = img.split()
+    return ImageChops.darker(r.point(lambda v: 255 if v >= 150 else 0),
+                             ImageChops.lighter(g, b).point(lambda v: 255 if v <= 110 else 0))
+
+
+def _ink_mask(img: Image.Image) -> Image.Image:
+    """Pixels that are ink rather than paper, as a 0/255 mask."""
+    r, g, b = img.split()
+    return ImageChops.darker(ImageChops.darker(r, g), b).point(lambda v: 255 if v < INK_LEVEL else 0)
+
+
+def legibility(img: Image.Image, data: bytes, ink: Image.Image, red: Image.Image) -> tuple[float, float]:
+    """
+    How well an encoding of img preserves what the model has to read:
+    (share of red-ink pixels still red after decoding, PSNR in dB over the
+    pixels that are ink before or after, so both faded strokes and JPEG
+    ringing count). Small red footage digits are the first thing chroma
+    subsampling and palette quantization blur away.
+    """
+    decoded = Image.open(io.BytesIO(data)).convert("RGB")
+    red_pixels = _count(red)
+    red_recall = _count(ImageChops.darker(red, _red_mask(decoded))) / red_pixels if red_pixels else 1.0
+    ink = ImageChops.lighter(ink, _ink_mask(decoded))
+    rms = ImageStat.Stat(ImageChops.difference(img, decoded), mask=ink).rms
+    mse = sum(v * v for v in rms) / len(rms)
+    psnr = 10 * math.log10(255 * 255 / mse) if mse else 99.0
+    return red_recall, psnr
+
+
+def _encode_tile(img: Image.Image, section: bool = False, compact: bool = False) -> tuple[bytes | None, str]:
+    """
+    Encode one rendered tile as (bytes, media_type): the MAP_JPEG_QUALITY
+    JPEG, as JobImportPage.js does. With compact=True a smaller encoding
+    whose legibility() is within LEGIBLE_RED_RECALL_DROP /
+    LEGIBLE_INK_PSNR_DROP_DB of that JPEG's is sent instead: the palettized
+    PNG when it is under TILE_PNG_ACCEPT_RATIO of the JPEG's size, else the
+    smallest legible of it and the TILE_JPEG_QUALITIES JPEGs. Compact
+    section tiles with under BLANK_INK_FRACTION ink return (None, "") and
+    are dropped.
+    """
+    baseline = _jpeg(img, MAP_JPEG_QUALITY)
+    if not compact:
+        return baseline, "image/jpeg"
+
+    ink = _ink_mask(img)
+    inked = _count(ink)
+    if section and inked < BLANK_INK_FRACTION * img.width * img.height:
+        return None, ""
+    if not inked:
+        return baseline, "image/jpeg"
+    red = _red_mask(img)
+    base_recall, base_psnr = legibility(img, baseline, ink, red)
+
+    def legible(data: bytes) -> bool:
+        recall, psnr = legibility(img, data, ink, red)
+        return recall >= base_recall - LEGIBLE_RED_RECALL_DROP and psnr >= base_psnr - LEGIBLE_INK_PSNR_DROP_DB
+
+    png = _palette_png(img)
+    png_legible = None
+    if len(png) <= TILE_PNG_ACCEPT_RATIO * len(baseline):
+        png_legible = legible(png)
+        if png_legible:
+            return png, "image/png"
+
+    candidates = [(_jpeg(img, q), "image/jpeg") for q in TILE_JPEG_QUALITIES if q < MAP_JPEG_QUALITY]
+    if png_legible is None:
+        candidates.append((png, "image/png"))
+    for data, media_type in sorted(candidates, key=lambda c: len(c[0])):
+        if len(data) >= len(baseline):
+            break
+        if legible(data):
+            return data, media_type
+    return baseline, "image/jpeg"
+
+
+def page_content_hash(doc, page) -> str:
+    """
+    Hash everything that affects how a page renders: its content stream,
+    geometry, and the raw streams of the images/forms and annotations it uses.
+    Pages untouched by a map revision hash the same even if the file changed.
+    """
+    h = hashlib.sha256()
+    h.update(page.read_contents())
+    h.update(f"{tuple(page.rect)}|{page.rotation}".encode())
+    xrefs = sorted({img[0] for img in page.get_images(full=True)} |
+                   {xo[0] for xo in page.get_xobjects()})
+    for xref in xrefs:
+        h.update(doc.xref_object(xref, compressed=True).encode())
+        if doc.xref_is_stream(xref):
+            h.update(doc.xref_stream_raw(xref))
+    for xref, _, _ in page.annot_xrefs():
+        h.update(doc.xref_object(xref, compressed=True).encode())
+    return h.hexdigest()
+
+
+def page_tile_cache_key(doc, page, adaptive: bool = False, compact: bool = False) -> str:
+    """Cache key for one page's tiles: page content + tiling parameters."""
+    settings = tile_settings(adaptive, compact)
+    settings.pop("max_pages")  # page count doesn't change how a page is tiled
+    blob = json.dumps({"page": page_content_hash(doc, page), "tiles": settings}, sort_keys=True)
+    return hashlib.sha256(blob.encode()).hexdigest()
+
+
+def tile_cache() -> DiskCache:
+    return DiskCache("tiles")
+
+
+def _cached_tiles(cache: DiskCache, key: str) -> list[Tile] | None:
+    blob = cache.get(key)
+    return _unpack_tiles(blob) if blob is not None else None
+
+
+def _tile_regions(W: int, H: int) -> list[tuple[str, int | None, int | None, int, int, int, int]]:
+    """
+    Pixel boxes (name, row, col, x, y, w, h) for a W x H canvas using the
+    fixed ratios: legend, key map, then the TILE_COLS x TILE_ROWS map grid,
+    in label order.
+    """
+    regions = []
+
+    # 1. Legend crop (right portion, top half)
+    legend_x = int(W * LEGEND_X_RATIO)
+    legend_y = int(H * LEGEND_TOP_RATIO)
+    legend_w = W - legend_x
+    legend_h = int(H * LEGEND_BOTTOM_RATIO) - legend_y
+
+    if legend_w > 100 and legend_h > 100:
+        regions.append(("LEGEND", None, None, legend_x, legend_y, legend_w, legend_h))
+
+    # 2. Key Map crop (right portion, bottom half)
+    key_y = int(H * LEGEND_BOTTOM_RATIO)
+    key_w = W - legend_x
+    key_h = H - key_y
+
+    if key_w > 100 and key_h > 100:
+        regions.append(("KEY MAP", None, None, legend_x, key_y, key_w, key_h))
+
+    # 3. Map area tiles (left portion, full height, TILE_COLS x TILE_ROWS grid)
+    map_w = int(W * LEGEND_X_RATIO)
+    map_h = H
+    tile_w = map_w // TILE_COLS
+    tile_h = map_h // TILE_ROWS
+
+    for row in range(TILE_ROWS):
+        for col in range(TILE_COLS):
+            tx = col * tile_w
+            ty = row * tile_h
+            tw = (map_w - tx) if col == TILE_COLS - 1 else tile_w
+            th = (map_h - ty) if row == TILE_ROWS - 1 else tile_h
+            regions.append((f"Section R{row + 1}C{col + 1}", row + 1, col + 1, tx, ty, tw, th))
+
+    return regions
+
+
+def _ratio_layout(rect) -> dict:
+    """The fixed-ratio layout as page-coordinate boxes (same shape as map_layout's)."""
+    legend_x = rect.width * LEGEND_X_RATIO
+    split_y = rect.height * LEGEND_BOTTOM_RATIO
+    return {
+        "legend": [legend_x, rect.height * LEGEND_TOP_RATIO, rect.width, split_y],
+        "key_map": [legend_x, split_y, rect.width, rect.height],
+        "map": [0, 0, legend_x, rect.height],
+    }
+
+
+def _page_layout(page) -> dict | None:
+    """Detected legend/key map/map boxes for this sheet, or None to use the fixed ratios."""
+    return sheet_layout(page) if DETECT_SHEET_LAYOUT else None
+
+
+def _box_px(box: list, scale: float) -> tuple[int, int, int, int]:
+    """A page-coordinate [x0, y0, x1, y1] box as an (x, y, w, h) pixel box at scale."""
+    x0, y0, x1, y1 = (round(v * scale) for v in box)
+    return x0, y0, x1 - x0, y1 - y0
+
+
+def _side_regions(layout: dict, scale: float, fit: bool = False) -> list[tuple]:
+    """
+    Legend and key map regions of a layout at `scale`. With fit=True each
+    region's scale is capped so it stays within the image limits.
+    """
+    regions = []
+    for name, key in (("LEGEND", "legend"), ("KEY MAP", "key_map")):
+        box = layout.get(key)
+        if box is None:
+            continue
+        w_pt, h_pt = box[2] - box[0], box[3] - box[1]
+        region_scale = min(scale, _fit_scale(w_pt, h_pt)) if fit else scale
+        x, y, w, h = _box_px(box, region_scale)
+        if w > 100 and h > 100:
+            regions.append((name, None, None, x, y, w, h, region_scale))
+    return regions
+
+
+def _grid_regions(map_box: list, scale: float, cols: int, rows: int) -> list[tuple]:
+    """Split the map area of a layout into a cols x rows grid at `scale`."""
+    map_x, map_y, map_w, map_h = _box_px(map_box, scale)
+    tile_w = map_w // cols
+    tile_h = map_h // rows
+    regions = []
+    for row in range(rows):
+        for col in range(cols):
+            tx = map_x + col * tile_w
+            ty = map_y + row * tile_h
+            tw = (map_x + map_w - tx) if col == cols - 1 else tile_w
+            th = (map_y + map_h - ty) if row == rows - 1 else tile_h
+            regions.append((f"Section R{row + 1}C{col + 1}", row + 1, col + 1, tx, ty, tw, th, scale))
+    return regions
+
+
+def _fixed_plan(page) -> list[tuple]:
+    """
+    Every region at MAP_RENDER_SCALE on a TILE_COLS x TILE_ROWS grid.
+    Without a detected layout this is exactly the JobImportPage.js crop.
+    """
+    layout = _page_layout(page)
+    if layout is None:
+        canvas = (page.rect * fitz.Matrix(MAP_RENDER_SCALE, MAP_RENDER_SCALE)).irect
+        return [(*region, MAP_RENDER_SCALE) for region in _tile_regions(canvas.width, canvas.height)]
+    return (_side_regions(layout, MAP_RENDER_SCALE)
+            + _grid_regions(layout["map"], MAP_RENDER_SCALE, TILE_COLS, TILE_ROWS))
+
+
+def _plan_tokens(plan: list[tuple]) -> int:
+    return sum(estimate_image_tokens(w, h) for _, _, _, _, _, w, h, _ in plan)
+
+
+def estimate_image_tokens(w: int, h: int) -> int:
+    """Approximate image input tokens for a w x h image after API downscaling."""
+    fit = min(1.0, MAX_IMAGE_EDGE / max(w, h), math.sqrt(MAX_IMAGE_PIXELS / (w * h)))
+    return math.ceil((w * fit) * (h * fit) / PIXELS_PER_TOKEN)
+
+
+def _fit_scale(w_pt: float, h_pt: float) -> float:
+    """Largest scale at which a w_pt x h_pt region stays within the image limits."""
+    return min(MAX_IMAGE_EDGE / max(w_pt, h_pt), math.sqrt(MAX_IMAGE_PIXELS / (w_pt * h_pt)))
+
+
+def _page_content_rects(page) -> tuple[list, list, list]:
+    """
+    Bounding boxes (x0, y0, x1, y1 tuples; maps hold 100k+ vector items, too
+    many for fitz.Rect objects) of the page's words, individual vector items
+    (lines, curves, rects) and raster images, all in page coordinates.
+    """
+    words = [tuple(w[:4]) for w in page.get_text("words")]
+    items = []
+    for path in page.get_cdrawings():
+        for item in path["items"]:
+            if item[0] == "re":
+                items.append(tuple(item[1]))
+                continue
+            points = item[1] if item[0] == "qu" else item[1:]
+            xs = [point[0] for point in points]
+            ys = [point[1] for point in points]
+            items.append((min(xs), min(ys), max(xs), max(ys)))
+    images = [tuple(info["bbox"]) for info in page.get_image_info()]
+    return words, items, images
+
+
+def _overlaps(a: tuple, b: tuple) -> bool:
+    return a[0] <= b[2] and b[0] <= a[2] and a[1] <= b[3] and b[1] <= a[3]
+
+
+def _is_blank(region: tuple, words: list, items: list, images: list) -> bool:
+    """
+    True if a map region has no text, no raster image and at most
+    BLANK_TILE_MAX_ITEMS vector items. Frames that enclose the whole region
+    (sheet borders, viewports) don't count.
+    """
+    if any(_overlaps(r, region) for r in images) or any(_overlaps(r, region) for r in words):
+        return False
+    x0, y0, x1, y1 = region
+    count = 0
+    for r in items:
+        if _overlaps(r, region) and not (r[0] <= x0 and r[1] <= y0 and r[2] >= x1 and r[3] >= y1):
+            count += 1
+            if count > BLANK_TILE_MAX_ITEMS:
+                return False
+    return True
+
+
+def _adaptive_plan(page) -> list[tuple]:
+    """
+    Choose scale and grid for one page from its content:
+    - scale renders the small labels (10th-percentile word height) at
+      ADAPTIVE_TEXT_PX, or ADAPTIVE_DENSE_TEXT_PX on dense sheets;
+    - the grid is the smallest that keeps each section tile inside the
+      model's per-image pixel limits, so nothing is downscaled by the API;
+    - section tiles with no content are dropped;
+    - the scale is lowered until the plan's estimated image tokens fit
+      ADAPTIVE_TOKEN_BUDGET times the fixed 2x2 cost of the page, and the
+      fixed plan is used if no scale down to ADAPTIVE_MIN_SCALE does.
+    Legend and key map render at the same scale, capped to fit one image each.
+    """
+    words, items, images = _page_content_rects(page)
+    layout = _page_layout(page) or _ratio_layout(page.rect)
+    map_box = layout["map"]
+    map_w_pt = map_box[2] - map_box[0]
+    map_h_pt = map_box[3] - map_box[1]
+    area_sqin = (map_w_pt * map_h_pt) / (72 * 72)
+    density = (len(words) + len(items)) / area_sqin if area_sqin else 0
+
+    heights = sorted(min(x1 - x0, y1 - y0) for x0, y0, x1, y1 in words if x1 > x0 and y1 > y0)
+    target_px = ADAPTIVE_DENSE_TEXT_PX if density >= ADAPTIVE_DENSE_ITEMS_PER_SQIN else ADAPTIVE_TEXT_PX
+    if heights:
+        small_text = heights[len(heights) // 10]
+        scale = target_px / max(small_text, 1.0)
+    else:
+        scale = MAP_RENDER_SCALE  # no text layer (scanned sheet): keep the fixed scale
+    scale = min(max(scale, ADAPTIVE_MIN_SCALE), ADAPTIVE_MAX_SCALE)
+    fixed = _fixed_plan(page)
+    budget = _plan_tokens(fixed) * ADAPTIVE_TOKEN_BUDGET
+
+    # Smallest grid whose tiles fit the image limits; lower the scale while
+    # that takes more than ADAPTIVE_MAX_TILES or costs more than the budget
+    while True:
+        cols = max(1, math.ceil(map_w_pt * scale / MAX_IMAGE_EDGE))
+        rows = max(1, math.ceil(map_h_pt * scale / MAX_IMAGE_EDGE))
+        while (map_w_pt / cols) * (map_h_pt / rows) * scale ** 2 > MAX_IMAGE_PIXELS:
+            if map_w_pt / cols >= map_h_pt / rows:
+                cols += 1
+            else:
+                rows += 1
+        if cols * rows <= ADAPTIVE_MAX_TILES:
+            plan = _side_regions(layout, scale, fit=True)
+            for region in _grid_regions(map_box, scale, cols, rows):
+                x, y, w, h = region[3:7]
+                box = (x / scale, y / scale, (x + w) / scale, (y + h) / scale)
+                if not _is_blank(box, words, items, images):
+                    plan.append(region)
+            if _plan_tokens(plan) <= budget:
+                return plan
+        if scale <= ADAPTIVE_MIN_SCALE:
+            return fixed  # nothing adaptive beats the fixed layout on this page
+        scale = max(ADAPTIVE_MIN_SCALE, scale * 0.9)
+
+
+def _iter_page_tiles(page, adaptive: bool = False, timings: dict | None = None,
+                     compact: bool = False) -> Iterator[Tile]:
+    """
+    Lazily render one page's tiles, each straight from the PDF with a clip
+    rectangle, so the full-page canvas is never built.
+    Page numbers are left unset so results can be cached; callers fill them in.
+    Seconds spent rasterizing and encoding, and the number of blank
+    section tiles dropped (compact only), are added to timings.
+    """
+    timings = {} if timings is None else timings
+    plan = _adaptive_plan(page) if adaptive else _fixed_plan(page)
+    for name, row, col, x, y, w, h, scale in plan:
+        start = time.perf_counter()
+        img = _render_clip(page, fitz.Matrix(scale, scale), x, y, w, h)
+        rasterized = time.perf_counter()
+        data, media_type = _encode_tile(img, section=row is not None, compact=compact)
+        del img
+        timings["rasterize_s"] = timings.get("rasterize_s", 0.0) + rasterized - start
+        timings["encode_s"] = timings.get("encode_s", 0.0) + time.perf_counter() - rasterized
+        if data is None:
+            timings["blank_tiles"] = timings.get("blank_tiles", 0) + 1
+            continue
+        yield Tile(data, name, row=row, col=col, box=(x, y, w, h), scale=scale, media_type=media_type)
+
+
+def _tile_page(page, adaptive: bool = False, timings: dict | None = None, compact: bool = False) -> list[Tile]:
+    """Render and encode all of one page's tiles."""
+    return list(_iter_page_tiles(page, adaptive, timings, compact))
+
+
+def _tile_page_worker(pdf_path: str, page_index: int, adaptive: bool = False,
+                      compact: bool = False) -> tuple[list[Tile], dict]:
+    """
+    Process-pool worker: open the PDF in this process and tile one page;
+    also returns render timings and this worker's peak RSS for the page.
+    """
+    timings = {}
+    reset_peak_rss()
+    doc = fitz.open(pdf_path)
+    try:
+        return _tile_page(doc[page_index], adaptive, timings, compact), timings
+    finally:
+        doc.close()
+        peak = peak_rss_mb()
+        if peak is not None:
+            timings["worker_peak_rss_mb"] = peak
+
+
+def _record_render(tiles: list[Tile], cached_pages: int, timings: dict):
+    """Report a tiling run to the active job's metrics (metrics.py)."""
+    record("render", tiles=len(tiles), image_bytes=sum(t.nbytes for t in tiles),
+           cached_pages=cached_pages, **{k: round(v, 3) for k, v in timings.items()})
+
+
+def token_report(pdf_path: str, tiles: list[Tile]) -> dict:
+    """
+    Estimated image tokens for `tiles` against the fixed 2x2 layout of the
+    same pages (6 images per page at MAP_RENDER_SCALE).
+    """
+    doc = fitz.open(pdf_path)
+    pages = sorted({t.page for t in tiles})
+    fixed_images = 0
+    fixed_tokens = 0
+    for page_num in pages:
+        for _, _, _, _, _, w, h, _ in _fixed_plan(doc[page_num - 1]):
+            fixed_images += 1
+            fixed_tokens += estimate_image_tokens(w, h)
+    doc.close()
+
+    tokens = sum(estimate_image_tokens(t.box[2], t.box[3]) for t in tiles)
+    return {
+        "images": len(tiles),
+        "tokens": tokens,
+        "fixed_images": fixed_images,
+        "fixed_tokens": fixed_tokens,
+        "saved_tokens": fixed_tokens - tokens,
+        "saved_pct": round(100 * (fixed_tokens - tokens) / fixed_tokens, 1) if fixed_tokens else 0.0,
+    }
+
+
+def _labelled(page_num: int, tile: Tile) -> Tile:
+    tile.page = page_num
+    print(f"  {tile.label}: {tile.size} = {tile.nbytes // 1024}KB {tile.media_type[6:].upper()}")
+    return tile
+
+
+def _pages_to_read(doc, max_pages: int | None) -> int:
+    return doc.page_count if max_pages is None else min(doc.page_count, max_pages)
+
+
+def iter_map_tiles(
+    pdf_path: str, use_cache: bool = True, adaptive: bool = False,
+    max_pages: int | None = MAX_PAGES_MAP, compact: bool = False,
+) -> Iterator[Tile]:
+    """
+    Streaming form of tile_map_pdf: yields Tiles one at a time, in the same
+    order. Rendering happens as the caller consumes, so peak memory is about
+    one tile (plus the current page's encoded tiles while they are collected
+    for the tile cache).
+    """
+    doc = fitz.open(pdf_path)
+    timings = {}
+    tiles_out = []
+    cached_pages = 0
+    try:
+        pages_to_render = _pages_to_read(doc, max_pages)
+        cache = tile_cache() if use_cache else None
+
+        for i in range(pages_to_render):
+            page_num = i + 1
+            page = doc[i]
+            key = page_tile_cache_key(doc, page, adaptive, compact) if cache else None
+            tiles = _cached_tiles(cache, key) if cache else None
+
+            if tiles is not None:
+                print(f"  Map page {page_num}/{pages_to_render}: unchanged, reusing {len(tiles)} cached tiles")
+                cached_pages += 1
+                for tile in tiles:
+                    tiles_out.append(tile)
+                    yield _labelled(page_num, tile)
+                continue
+
+            mode = ("adaptive" if adaptive else f"{MAP_RENDER_SCALE}x") + (", compact" if compact else "")
+            print(f"  Map page {page_num}/{pages_to_render}: rendering ({mode})...")
+            rendered = []
+            for tile in _iter_page_tiles(page, adaptive, timings, compact):
+                if cache:
+                    rendered.append(tile)
+                tiles_out.append(tile)
+                yield _labelled(page_num, tile)
+            if cache:
+                cache.put(key, _pack_tiles(rendered))
+    finally:
+        doc.close()
+        _record_render(tiles_out, cached_pages, timings)
+
+
+def tile_map_pdf(
+    pdf_path: str, use_cache: bool = True, workers: int = 1, adaptive: bool = False,
+    max_pages: int | None = MAX_PAGES_MAP, compact: bool = False,
+) -> list[Tile]:
     """
     Render map PDF pages at high resolution and tile into sections.
-    Returns list of { 'base64': str, 'label': str } dicts.
+    Returns a list of Tiles labelled like "Page 1 - Section R1C1".
     Replicates JobImportPage.js tileMapPage() logic.
+
+    Encoded tiles are cached per page (keyed on the page's content and the
+    tiling constants), so a map revision only re-renders the changed sheets.
+
+    With workers > 1, uncached pages render in a process pool, each worker
+    opening the PDF itself, and tiles are always returned in page order.
+    Otherwise this is list(iter_map_tiles(...)).
+
+    adaptive=True sizes the grid and scale per page to its content and the
+    model's image limits, drops blank sections, and prints the estimated
+    image tokens saved compared with the fixed 2x2 layout.
+
+    compact=True sends each tile as the smallest equally legible PNG / JPEG
+    and drops blank sections (see _encode_tile); otherwise every tile is
+    the MAP_JPEG_QUALITY JPEG.
+
+    Only the first max_pages pages are tiled (None for every page, as the
+    per-sheet mode in sheets.py does).
     """
+    if workers <= 1:
+        all_tiles = list(iter_map_tiles(pdf_path, use_cache, adaptive, max_pages, compact))
+    else:
+        all_tiles = _tile_map_pdf_parallel(pdf_path, use_cache, workers, adaptive, max_pages, compact)
+
+    total_mb = sum(t.nbytes for t in all_tiles) / (1024 * 1024)
+    repeats = len(all_tiles) - len(unique_tiles(all_tiles))
+    print(f"  Total: {len(all_tiles)} tiles, {total_mb:.1f}MB"
+          + (f" ({repeats} identical to an earlier tile, sent once)" if repeats else ""))
+    if adaptive and all_tiles:
+        report = token_report(pdf_path, all_tiles)
+        print(f"  Adaptive: ~{report['tokens']:,} image tokens in {report['images']} images "
+              f"vs ~{report['fixed_tokens']:,} in {report['fixed_images']} for fixed 2x2 "
+              f"(saved {report['saved_tokens']:,}, {report['saved_pct']}%)")
+    return all_tiles
+
+
+def _tile_map_pdf_parallel(pdf_path: str, use_cache: bool, workers: int, adaptive: bool,
+                           max_pages: int | None = MAX_PAGES_MAP, compact: bool = False) -> list[Tile]:
     doc = fitz.open(pdf_path)
-    pages_to_render = min(doc.page_count, MAX_PAGES_MAP)
-    all_tiles = []
+    pages_to_render = _pages_to_read(doc, max_pages)
+    cache = tile_cache() if use_cache else None
+    page_tiles = {}
+    keys = {}
+    timings = {}  # rasterize / encode seconds summed over the worker processes
 
     for i in range(pages_to_render):
-        page_num = i + 1
-        print(f"  Map page {page_num}/{pages_to_render}: rendering at {MAP_RENDER_SCALE}x...")
-        page = doc[i]
-        img = _render_page_to_image(page, MAP_RENDER_SCALE)
-        W, H = img.size
-        print(f"  Full canvas: {W}x{H}")
-
-        # 1. Legend crop (right portion, top half)
-        legend_x = int(W * LEGEND_X_RATIO)
-        legend_y = int(H * LEGEND_TOP_RATIO)
-        legend_w = W - legend_x
-        legend_h = int(H * LEGEND_BOTTOM_RATIO) - legend_y
-
-        if legend_w > 100 and legend_h > 100:
-            b64 = _crop_to_base64(img, legend_x, legend_y, legend_w, legend_h, MAP_JPEG_QUALITY)
-            label = f"Page {page_num} - LEGEND"
-            all_tiles.append({"base64": b64, "label": label})
-            size_kb = len(b64) * 3 // 4 // 1024
-            print(f"  {label}: {legend_w}x{legend_h} = {size_kb}KB")
-
-        # 2. Key Map crop (right portion, bottom half)
-        key_y = int(H * LEGEND_BOTTOM_RATIO)
-        key_w = W - legend_x
-        key_h = H - key_y
-
-        if key_w > 100 and key_h > 100:
-            b64 = _crop_to_base64(img, legend_x, key_y, key_w, key_h, MAP_JPEG_QUALITY)
-            label = f"Page {page_num} - KEY MAP"
-            all_tiles.append({"base64": b64, "label": label})
-            size_kb = len(b64) * 3 // 4 // 1024
-            print(f"  {label}: {key_w}x{key_h} = {size_kb}KB")
-
-        # 3. Map area tiles (left portion, full height, TILE_COLS x TILE_ROWS grid)
-        map_w = int(W * LEGEND_X_RATIO)
-        map_h = H
-        tile_w = map_w // TILE_COLS
-        tile_h = map_h // TILE_ROWS
-
-        for row in range(TILE_ROWS):
-            for col in range(TILE_COLS):
-                tx = col * tile_w
-                ty = row * tile_h
-                tw = (map_w - tx) if col == TILE_COLS - 1 else tile_w
-                th = (map_h - ty) if row == TILE_ROWS - 1 else tile_h
-
-                label = f"Page {page_num} - Section R{row + 1}C{col + 1}"
-                b64 = _crop_to_base64(img, tx, ty, tw, th, MAP_JPEG_QUALITY)
-                all_tiles.append({"base64": b64, "label": label})
-                size_kb = len(b64) * 3 // 4 // 1024
-                print(f"  {label}: {tw}x{th} = {size_kb}KB")
-
+        if cache:
+            keys[i] = page_tile_cache_key(doc, doc[i], adaptive, compact)
+            tiles = _cached_tiles(cache, keys[i])
+            if tiles is not None:
+                page_tiles[i] = tiles
+                print(f"  Map page {i + 1}/{pages_to_render}: unchanged, reusing {len(tiles)} cached tiles")
     doc.close()
-    total_mb = sum(len(t["base64"]) * 3 / 4 for t in all_tiles) / (1024 * 1024)
-    print(f"  Total: {len(all_tiles)} tiles, {total_mb:.1f}MB")
+
+    to_render = [i for i in range(pages_to_render) if i not in page_tiles]
+    if to_render:
+        workers = min(workers, len(to_render))
+        pages = ", ".join(str(i + 1) for i in to_render)
+        mode = ("adaptive" if adaptive else f"{MAP_RENDER_SCALE}x") + (", compact" if compact else "")
+        print(f"  Rendering page(s) {pages} ({mode}, {workers} workers)...")
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            rendered = pool.map(_tile_page_worker, [pdf_path] * len(to_render), to_render,
+                                [adaptive] * len(to_render), [compact] * len(to_render))
+            for i, (tiles, page_timings) in zip(to_render, rendered):
+                page_tiles[i] = tiles
+                for key, value in page_timings.items():
+                    if key == "worker_peak_rss_mb":
+                        timings[key] = max(timings.get(key, 0.0), value)
+                    else:
+                        timings[key] = timings.get(key, 0.0) + value
+
+    all_tiles = []
+    for i in range(pages_to_render):
+        if cache and i in to_render:
+            cache.put(keys[i], _pack_tiles(page_tiles[i]))
+        all_tiles.extend(_labelled(i + 1, tile) for tile in page_tiles[i])
+    _record_render(all_tiles, pages_to_render - len(to_render), timings)
     return all_tiles
 
 
-def extract_map_text(pdf_path: str) -> str:
-    """Extract embedded text from map PDF (supplementary to images)."""
+def extract_map_page_texts(pdf_path: str, max_pages: int | None = MAX_PAGES_MAP) -> dict[int, str]:
+    """Embedded text of each map page that has any, keyed by 1-based page number."""
     doc = fitz.open(pdf_path)
-    pages_to_read = min(doc.page_count, MAX_PAGES_MAP)
-    full_text = ""
-
-    for i in range(pages_to_read):
-        page = doc[i]
-        text = page.get_text("text")
+    texts = {}
+    for i in range(_pages_to_read(doc, max_pages)):
+        text = doc[i].get_text("text")
         if text and len(text.strip()) > 5:
-            full_text += f"\n--- Map Page {i + 1} ---\n{text.strip()}"
-
+            texts[i + 1] = text.strip()
     doc.close()
-    return full_text.strip()
+    return texts
+
+
+def extract_map_text(pdf_path: str, max_pages: int | None = MAX_PAGES_MAP) -> str:
+    """Extract embedded text from map PDF (supplementary to images)."""
+    texts = extract_map_page_texts(pdf_path, max_pages)
+    return "".join(f"\n--- Map Page {n} ---\n{text}" for n, text in texts.items()).strip()
@@ -0,0 +1,266 @@
+"""
+LYT Communications - Request Scheduling
+Keeps concurrent extractions under the account's rate limits instead of
+failing jobs on 429 / 529 responses.
+
+One RateLimiter per model tracks requests, input tokens and output tokens
+over a sliding minute. Limits come from configure_limits() (batch
+--rpm/--itpm/--otpm) or are learned from the API's anthropic-ratelimit-*
+response headers. Requests wait their turn in FIFO order until their
+estimated tokens fit, and the estimate is corrected with the real usage
+once the response is done. A 429's retry-after pauses every job on that
+model, not just the one that hit it.
+
+call_with_retries() retries rate-limited, overloaded (529), 5xx and
+connection failures with jittered exponential backoff. A timed-out request
+has already held a slot for the full client timeout, so timeouts get their
+own, much smaller budget (MAX_TIMEOUT_RETRIES).
+"""
+
+import random
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+import anthropic
+
+from metrics import record_request
+
+WINDOW_SECONDS = 60.0
+MAX_RETRIES = 6
+MAX_TIMEOUT_RETRIES = 1  # retries after a request ran into the client timeout (15 min each)
+BACKOFF_BASE = 2.0  # seconds; attempt n waits up to BACKOFF_BASE * 2**n
+BACKOFF_CAP = 60.0
+CHARS_PER_TOKEN = 4  # rough text token estimate before the real count is known
+
+# Per-model limits per minute; None means "learn from response headers"
+RATE_LIMITS: dict[str, dict] = {}
+
+_limiters: dict[str, "RateLimiter"] = {}
+_limiters_lock = threading.Lock()
+
+
+def configure_limits(model: str, requests: int | None = None, input_tokens: int | None = None,
+                     output_tokens: int | None = None):
+    """Set per-minute limits for a model (unset values are learned from headers)."""
+    RATE_LIMITS[model] = {"requests": requests, "input_tokens": input_tokens,
+                          "output_tokens": output_tokens}
+    with _limiters_lock:
+        limiter = _limiters.get(model)
+    if limiter is not None:
+        limiter.set_limits(**RATE_LIMITS[model])
+
+
+def limiter_for(model: str) -> "RateLimiter":
+    """The process-wide RateLimiter for a model."""
+    with _limiters_lock:
+        if model not in _limiters:
+            _limiters[model] = RateLimiter(**RATE_LIMITS.get(model, {}))
+        return _limiters[model]
+
+
+def estimate_input_tokens(request: dict, image_tokens: int = 0) -> int:
+    """Rough input tokens for a Messages request: text length plus the given image tokens."""
+    chars = 0
+    system = request.get("system") or ""
+    blocks = system if isinstance(system, list) else [{"type": "text", "text": system}]
+    for message in request.get("messages") or []:
+        content = message.get("content")
+        if isinstance(content, str):
+            chars += len(content)
+        else:
+            blocks = [*blocks, *content]
+    for block in blocks:
+        if block.get("type") == "text":
+            chars += len(block.get("text", ""))
+    return chars // CHARS_PER_TOKEN + image_tokens
+
+
+def counted_input_tokens(usage: dict) -> int:
+    """Input tokens that count against the input limit (cache reads don't)."""
+    return usage.get("input_tokens", 0) + usage.get("cache_creation_input_tokens", 0)
+
+
+class RateLimiter:
+    """
+    Sliding-window limiter over requests, input tokens and output tokens.
+    acquire() blocks (FIFO) until an estimated request fits and returns a
+    ticket; settle() replaces the estimate with actual usage.
+    clock (window timing) and sleep (retry backoff) are injectable for tests.
+    """
+
+    def __init__(self, requests: int | None = None, input_tokens: int | None = None,
+                 output_tokens: int | None = None, window: float = WINDOW_SECONDS,
+                 clock=time.monotonic, sleep=time.sleep):
+        self.limits = {"requests": requests, "input_tokens": input_tokens,
+                       "output_tokens": output_tokens}
+        self._configured = {k for k, v in self.limits.items() if v}
+        self.window = window
+        self.clock = clock
+        self.sleep = sleep
+        self._events = deque()  # [time, input, output] per admitted request
+        self._queue = deque()
+        self._paused_until = 0.0
+        self._cond = threading.Condition()
+        self.waited = 0.0  # total seconds requests spent queued
+
+    def set_limits(self, requests=None, input_tokens=None, output_tokens=None):
+        with self._cond:
+            for key, value in (("requests", requests), ("input_tokens", input_tokens),
+                               ("output_tokens", output_tokens)):
+                if value:
+                    self.limits[key] = value
+                    self._configured.add(key)
+            self._cond.notify_all()
+
+    def _used(self, now: float) -> tuple[int, int, int]:
+        while self._events and now - self._events[0][0] >= self.window:
+            self._events.popleft()
+        return (len(self._events), sum(e[1] for e in self._events), sum(e[2] for e in self._events))
+
+    def _fits(self, now: float, est_input: int, est_output: int) -> bool:
+        if now < self._paused_until:
+            return False
+        requests, used_in, used_out = self._used(now)
+        if not self._events:
+            return True  # always let one request through, however large
+        limits = self.limits
+        return ((not limits["requests"] or requests + 1 <= limits["requests"])
+                and (not limits["input_tokens"] or used_in + est_input <= limits["input_tokens"])
+                and (not limits["output_tokens"] or used_out + est_output <= limits["output_tokens"]))
+
+    def _wait_time(self, now: float) -> float:
+        if now < self._paused_until:
+            return self._paused_until - now
+        if self._events:
+            return max(0.05, self._events[0][0] + self.window - now)
+        return 0.05
+
+    def acquire(self, est_input: int, est_output: int) -> list:
+        token = object()
+        start = self.clock()
+        with self._cond:
+            self._queue.append(token)
+            try:
+                while True:
+                    now = self.clock()
+                    if self._queue[0] is token and self._fits(now, est_input, est_output):
+                        break
+                    delay = self._wait_time(now) if self._queue[0] is token else 1.0
+                    self._cond.wait(timeout=min(delay, 1.0))
+            finally:
+                self._queue.remove(token)
+                self._cond.notify_all()
+            ticket = [self.clock(), est_input, est_output]
+            self._events.append(ticket)
+        self.waited += self.clock() - start
+        return ticket
+
+    def settle(self, ticket: list, input_tokens: int, output_tokens: int):
+        """Replace a ticket's estimate with the request's real token counts."""
+        with self._cond:
+            ticket[1] = input_tokens
+            ticket[2] = output_tokens
+            self._cond.notify_all()
+
+    def release(self, ticket: list):
+        """A request that failed before using tokens still counts as a request."""
+        self.settle(ticket, 0, 0)
+
+    def pause(self, seconds: float):
+        """Hold every queued request for this model (server asked us to back off)."""
+        with self._cond:
+            self._paused_until = max(self._paused_until, self.clock() + seconds)
+
+    def observe(self, headers):
+        """Learn limits and remaining capacity from anthropic-ratelimit-* headers."""
+        if not headers:
+            return
+        for key, name in (("requests", "requests"), ("input_tokens", "input-tokens"),
+                          ("output_tokens", "output-tokens")):
+            limit = headers.get(f"anthropic-ratelimit-{name}-limit")
+            remaining = headers.get(f"anthropic-ratelimit-{name}-remaining")
+            reset = headers.get(f"anthropic-ratelimit-{name}-reset")
+            if limit and limit.isdigit() and key not in self._configured:
+                with self._cond:
+                    self.limits[key] = int(limit)
+            if remaining == "0" and reset:
+                wait = _seconds_until(reset)
+                if wait > 0:
+                    self.pause(wait)
+
+
+def _seconds_until(timestamp: str) -> float:
+    try:
+        reset = datetime.fromisoformat(timestamp.replace("Z", "+00:00"))
+    except ValueError:
+        return 0.0
+    return reset.timestamp() - time.time()
+
+
+def is_retryable(error: Exception, timeouts: int = 0) -> bool:
+    """timeouts: timed-out attempts of this request already retried."""
+    if isinstance(error, anthropic.APITimeoutError):  # subclass of APIConnectionError
+        return timeouts < MAX_TIMEOUT_RETRIES
+    if isinstance(error, (anthropic.RateLimitError, anthropic.APIConnectionError)):
+        return True
+    if isinstance(error, anthropic.APIStatusError):
+        return error.status_code == 529 or error.status_code >= 500
+    return False
+
+
+def retry_delay(error: Exception, attempt: int) -> float:
+    """Full-jitter exponential backoff, never shorter than the server's retry-after."""
+    delay = random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt))
+    response = getattr(error, "response", None)
+    retry_after = response.headers.get("retry-after") if response is not None else None
+    try:
+        delay = max(delay, float(retry_after))
+    except (TypeError, ValueError):
+        pass
+    return delay
+
+
+def backoff(limiter: RateLimiter, error: Exception, attempt: int, label: str = "") -> float:
+    """Sleep before a retry (pausing the whole model on 429) and return the delay."""
+    delay = retry_delay(error, attempt)
+    status = getattr(error, "status_code", None) or type(error).__name__
+    if isinstance(error, anthropic.RateLimitError):
+        limiter.pause(delay)
+    print(f"  {label + ': ' if label else ''}{status} — retrying in {delay:.1f}s "
+          f"(attempt {attempt + 2} of {MAX_RETRIES + 1})")
+    limiter.sleep(delay)
+    return delay
+
+
+def call_with_retries(model: str, fn, est_input: int, est_output: int, label: str = ""):
+    """
+    Run fn() (one non-streaming API call returning a raw response from
+    with_raw_response) under the model's rate limiter, retrying transient
+    failures. Returns the parsed message.
+    """
+    from claude_client import usage_stats
+
+    limiter = limiter_for(model)
+    timeouts = 0
+    for attempt in range(MAX_RETRIES + 1):
+        ticket = limiter.acquire(est_input, est_output)
+        start = time.time()
+        try:
+            raw = fn()
+        except Exception as e:
+            limiter.release(ticket)
+            if not is_retryable(e, timeouts) or attempt == MAX_RETRIES:
+                raise
+            timeouts += isinstance(e, anthropic.APITimeoutError)
+            limiter.observe(getattr(getattr(e, "response", None), "headers", None))
+            backoff(limiter, e, attempt, label)
+            continue
+        limiter.observe(raw.headers)
+        message = raw.parse()
+        usage = usage_stats(message.usage)
+        limiter.settle(ticket, counted_input_tokens(usage), usage.get("output_tokens", 0))
+        record_request(model=model, label=label, stop_reason=message.stop_reason,
+                       wall_s=round(time.time() - start, 3), **usage)
+        return message
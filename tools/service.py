@@ -0,0 +1,526 @@
+"""
+LYT Communications - Local Extraction Service
+An HTTP front end to the Python pipeline, so the web app can hand PDFs to
+pdf_processor / claude_client instead of tiling maps in the browser.
+
+Runs on asyncio with no extra dependencies. Uploads are rendered in a
+process pool, and extractions run with at most --jobs in flight. Progress
+and each completed record stream back over Server-Sent Events while
+Claude is still writing the response.
+
+    POST /jobs                multipart/form-data: wo (PDF, required), map (PDF),
+                              mode (single | per_sheet | tiered), adaptive (true/false),
+                              compact (true/false: compact map tiles, see --compact-tiles),
+                              bbox (min_lat,min_lng,max_lat,max_lng: project area, default --bbox)
+                              -> 202 {job_id, status_url, events_url}; 429 when the queue is full
+    GET  /jobs                every job's status
+    GET  /jobs/<id>           one job's status (and result once done)
+    GET  /jobs/<id>/events    SSE: status, progress, record (single mode), done / failed
+                              (past events are replayed first)
+    GET  /health
+
+Browsers only get in from the web app origins given with --allow-origin:
+a request carrying any other Origin header is refused (403) and CORS
+headers are only sent back to allowed origins. When listening on anything
+but loopback, every endpoint except /health also needs the token printed
+at startup (or given with --token), as an X-Service-Token header or a
+?token= query parameter (EventSource can't set headers).
+
+The Anthropic endpoint comes from ANTHROPIC_BASE_URL when set (as the SDK
+does), so the service can be exercised against a mock server (see
+tests/test_service.py).
+
+Usage:
+    python extract_workorder.py serve --port 8787 --jobs 2
+    python extract_workorder.py serve --allow-origin https://lytcomm.com
+"""
+
+import argparse
+import asyncio
+import hmac
+import ipaddress
+import json
+import secrets
+import shutil
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from email import policy
+from email.parser import BytesParser
+from pathlib import Path
+from urllib.parse import parse_qs, urlsplit
+
+from batch import DEFAULT_API_JOBS, prepare_job
+from validation import parse_bbox, validate
+from extract_workorder import DEFAULT_RENDER_WORKERS, OUTPUT_DIR, load_api_key, output_name, save_extraction
+
+DEFAULT_PORT = 8787
+MAX_UPLOAD_MB = 150
+MAX_PENDING_JOBS = 20  # queued + running; more gets 429
+JOB_HISTORY = 100  # finished jobs kept for status queries
+KEEPALIVE_SECONDS = 15.0
+MODES = ("single", "per_sheet", "tiered")
+
+STATUS_TEXT = {200: "OK", 202: "Accepted", 204: "No Content", 400: "Bad Request", 401: "Unauthorized",
+               403: "Forbidden", 404: "Not Found", 405: "Method Not Allowed", 413: "Payload Too Large", 429: "Too Many Requests",
+               500: "Internal Server Error"}
+TERMINAL_EVENTS = ("done", "failed")
+
+
+class HttpError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+def is_loopback(host: str) -> bool:
+    if host == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+class _Connection:
+    """The response side of one request: its stream writer and the CORS headers its origin gets."""
+
+    def __init__(self, writer: asyncio.StreamWriter):
+        self.writer = writer
+        self.cors = ""
+
+    def write(self, data: bytes):
+        self.writer.write(data)
+
+    async def drain(self):
+        await self.writer.drain()
+
+
+def parse_multipart(content_type: str, body: bytes) -> tuple[dict[str, tuple[str, bytes]], dict[str, str]]:
+    """Split a multipart/form-data body into files {field: (filename, bytes)} and text fields."""
+    if not content_type.startswith("multipart/form-data"):
+        raise HttpError(400, "expected multipart/form-data")
+    message = BytesParser(policy=policy.HTTP).parsebytes(
+        b"Content-Type: " + content_type.encode("latin-1") + b"\r\n\r\n" + body)
+    if not message.is_multipart():
+        raise HttpError(400, "malformed multipart body")
+    files, fields = {}, {}
+    for part in message.iter_parts():
+        name = part.get_param("name", header="content-disposition")
+        if not name:
+            continue
+        payload = part.get_payload(decode=True) or b""
+        if part.get_filename() is not None:
+            files[name] = (part.get_filename(), payload)
+        else:
+            fields[name] = payload.decode("utf-8", "replace").strip()
+    return files, fields
+
+
+def _upload_name(field: str, filename: str | None) -> str:
+    """Bare file name for an uploaded part (no directories); 400 for names like '..'."""
+    if not filename:
+        return f"{field}.pdf"
+    name = Path(filename.replace("\\", "/")).name
+    if name in ("", ".", ".."):
+        raise HttpError(400, f"invalid file name for '{field}': {filename!r}")
+    return name
+
+
+class ServiceJob:
+    """One uploaded job: its state, and every event so far for SSE replay."""
+
+    def __init__(self, job_id: str, name: str, wo_path: str, map_path: str | None, mode: str,
+                 adaptive: bool, compact: bool = False, bbox: tuple[float, float, float, float] | None = None):
+        self.id = job_id
+        self.name = name
+        self.wo_path = wo_path
+        self.map_path = map_path
+        self.mode = mode
+        self.adaptive = adaptive
+        self.compact = compact
+        self.bbox = bbox
+        self.state = "queued"
+        self.created = time.time()
+        self.finished = None
+        self.counts = {}
+        self.usage = {}
+        self.result = None
+        self.validation = None
+        self.output = None
+        self.error = None
+        self.events = []  # (event, data)
+        self._listeners = set()  # asyncio.Queue per open SSE stream
+
+    def publish(self, event: str, data: dict):
+        """Record an event and hand it to every open stream (event loop thread only)."""
+        self.events.append((event, data))
+        for queue in self._listeners:
+            queue.put_nowait((event, data))
+
+    def set_state(self, state: str, **extra):
+        self.state = state
+        self.publish("status", {"state": state, **extra})
+
+    def listen(self) -> asyncio.Queue:
+        queue = asyncio.Queue()
+        for item in self.events:
+            queue.put_nowait(item)
+        self._listeners.add(queue)
+        return queue
+
+    def unlisten(self, queue: asyncio.Queue):
+        self._listeners.discard(queue)
+
+    def status(self, with_result: bool = False) -> dict:
+        status = {
+            "job_id": self.id, "name": self.name, "state": self.state, "mode": self.mode,
+            "adaptive": self.adaptive, "compact": self.compact, "has_map": self.map_path is not None,
+            "created": datetime.fromtimestamp(self.created).isoformat(timespec="seconds"),
+            "seconds": round((self.finished or time.time()) - self.created, 1),
+            "counts": self.counts, "usage": self.usage, "output": self.output, "error": self.error,
+            "validation": self.validation,
+        }
+        if with_result and self.result is not None:
+            status["result"] = self.result
+        return status
+
+
+class ExtractionService:
+    """Job registry plus the render pool and the extraction concurrency limit."""
+
+    def __init__(self, api_key: str, output_dir: Path = OUTPUT_DIR, api_jobs: int = DEFAULT_API_JOBS,
+                 render_workers: int = DEFAULT_RENDER_WORKERS, max_pending: int = MAX_PENDING_JOBS,
+                 allow_origins: tuple[str, ...] = (), token: str | None = None,
+                 bbox: tuple[float, float, float, float] | None = None):
+        self.api_key = api_key
+        self.allow_origins = {origin.rstrip("/") for origin in allow_origins}
+        self.token = token  # required on every endpoint but /health when set
+        self.bbox = bbox  # project area for GPS validation unless a job brings its own
+        self.output_dir = Path(output_dir)
+        self.upload_dir = self.output_dir / ".service"
+        self.api_jobs = api_jobs
+        self.render_workers = render_workers
+        self.max_pending = max_pending
+        self.jobs: dict[str, ServiceJob] = {}
+        self.render_pool = None
+        self._api_slots = None
+        self._tasks = set()
+
+    async def start(self):
+        self.render_pool = ProcessPoolExecutor(max_workers=self.render_workers)
+        self._api_slots = asyncio.Semaphore(self.api_jobs)
+
+    async def stop(self):
+        for task in list(self._tasks):
+            task.cancel()
+        if self.render_pool is not None:
+            self.render_pool.shutdown(wait=False, cancel_futures=True)
+
+    def pending(self) -> int:
+        return sum(1 for job in self.jobs.values() if job.state not in TERMINAL_EVENTS)
+
+    # -- jobs --------------------------------------------------------------
+
+    def submit(self, files: dict, fields: dict) -> ServiceJob:
+        if "wo" not in files:
+            raise HttpError(400, "missing 'wo' file field")
+        mode = fields.get("mode") or "single"
+        if mode not in MODES:
+            raise HttpError(400, f"mode must be one of {', '.join(MODES)}")
+        if self.pending() >= self.max_pending:
+            raise HttpError(429, f"{self.max_pending} jobs already pending; try again later")
+        for field, (_, data) in files.items():
+            if field in ("wo", "map") and not data.startswith(b"%PDF"):
+                raise HttpError(400, f"'{field}' is not a PDF")
+        try:
+            bbox = parse_bbox(fields.get("bbox")) or self.bbox
+        except ValueError as e:
+            raise HttpError(400, str(e))
+        names = {field: _upload_name(field, files[field][0]) for field in ("wo", "map") if field in files}
+        if names.get("map") == names["wo"]:
+            names["map"] = f"map_{names['map']}"
+
+        job_id = uuid.uuid4().hex[:12]
+        folder = self.upload_dir / job_id
+        folder.mkdir(parents=True, exist_ok=True)
+        paths = {}
+        for field, filename in names.items():
+            paths[field] = folder / filename
+            paths[field].write_bytes(files[field][1])
+
+        name = paths["wo"].stem if files["wo"][0] else "work_order"
+        adaptive, compact = (fields.get(flag, "").lower() in ("1", "true", "yes", "on")
+                             for flag in ("adaptive", "compact"))
+        job = ServiceJob(job_id, name, str(paths["wo"]), str(paths["map"]) if "map" in paths else None,
+                         mode, adaptive, compact, bbox)
+        self.jobs[job_id] = job
+        self._trim_history()
+        job.set_state("queued")
+        task = asyncio.create_task(self.run(job))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return job
+
+    def _trim_history(self):
+        finished = [job for job in self.jobs.values() if job.state in TERMINAL_EVENTS]
+        for job in sorted(finished, key=lambda j: j.created)[:max(0, len(finished) - JOB_HISTORY)]:
+            del self.jobs[job.id]
+
+    async def run(self, job: ServiceJob):
+        loop = asyncio.get_running_loop()
+        prepared = None
+        outcome = {"status": "cancelled"}  # the metrics line, written however the job ends
+        try:
+            job.set_state("rendering")
+            prepared = await loop.run_in_executor(
+                self.render_pool, prepare_job, job.wo_path, job.map_path, job.adaptive,
+                job.mode == "per_sheet", job.mode == "tiered", job.compact)
+            prepared["usage"] = job.usage
+            job.publish("progress", {"stage": "rendered", "tiles": len(prepared["map_tiles"]),
+                                     "timings": prepared["timings"]})
+
+            async with self._api_slots:
+                job.set_state("extracting")
+                # Worker-thread callbacks hop back onto the loop to publish
+                publish = lambda event, data: loop.call_soon_threadsafe(job.publish, event, data)  # noqa: E731
+                extracted = await asyncio.to_thread(self._extract, job, prepared, publish)
+
+            job.result = extracted
+            job.output = str(save_extraction(extracted, self.output_dir,
+                                             f"{output_name(extracted)}_{job.id}"))
+            job.counts = {name: len(extracted.get(name) or []) for name in
+                          ("segments", "structures", "splice_points", "line_items")}
+            report = validate(extracted, job.bbox)
+            job.validation = {"errors": report["errors"], "warnings": report["warnings"]} if report else None
+            outcome = {"status": "ok", "output": job.output,
+                       "validation": {"errors": len(report["errors"]), "warnings": len(report["warnings"])}
+                       if report else None}
+            job.state = "done"
+            job.finished = time.time()
+            job.publish("done", job.status(with_result=True))
+        except Exception as e:
+            job.error = str(e)
+            job.state = "failed"
+            job.finished = time.time()
+            job.publish("failed", {"error": job.error})
+            outcome = {"status": "failed", "error": job.error}
+        finally:
+            if prepared is not None:
+                prepared["metrics"].write(self.output_dir, source="service", **outcome)
+            shutil.rmtree(self.upload_dir / job.id, ignore_errors=True)
+
+    def _extract(self, job: ServiceJob, prepared: dict, publish) -> dict:
+        """Worker thread: run the extraction, publishing records as they complete (single mode)."""
+        from claude_client import ExtractionStream
+        from batch import _call_claude
+
+        if job.mode != "single":
+            return _call_claude(prepared, self.api_key)
+
+        job_metrics = prepared["metrics"]
+        counts = {}
+        with job_metrics.active(), job_metrics.stage("api"):
+            stream = ExtractionStream(prepared["wo_text"], prepared["map_text"], prepared["map_tiles"],
+                                      self.api_key, verbose=False)
+            try:
+                for name, record in stream:
+                    counts[name] = counts.get(name, 0) + 1
+                    publish("record", {"array": name, "record": record, "counts": dict(counts)})
+            finally:
+                job.usage.update(stream.usage)
+        return stream.result
+
+    # -- HTTP --------------------------------------------------------------
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """One request per connection (Connection: close)."""
+        conn = _Connection(writer)
+        try:
+            method, path, query, headers, body = await self._read_request(reader)
+            self._authorize(conn, method, path, query, headers)
+            await self.route(method, path, headers, body, conn)
+        except HttpError as e:
+            await self._send_json(conn, e.status, {"error": str(e)})
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except Exception as e:
+            await self._send_json(conn, 500, {"error": str(e)})
+        finally:
+            try:
+                writer.close()
+                await writer.wait_closed()
+            except (ConnectionError, OSError):
+                pass
+
+    def _authorize(self, conn: _Connection, method: str, path: str, query: dict, headers: dict):
+        """
+        Refuse browsers on origins not in allow_origins (a cross-site form
+        post needs no preflight, so CORS headers alone wouldn't stop an
+        upload) and, when a token is set, requests without it.
+        """
+        origin = headers.get("origin")
+        if origin is not None:
+            if origin.rstrip("/") not in self.allow_origins:
+                raise HttpError(403, f"origin {origin} not allowed (see --allow-origin)")
+            conn.cors = (f"Access-Control-Allow-Origin: {origin}\r\n"
+                         "Vary: Origin\r\n"
+                         "Access-Control-Allow-Methods: GET, POST, OPTIONS\r\n"
+                         "Access-Control-Allow-Headers: Content-Type, X-Service-Token\r\n")
+        if self.token is None or method == "OPTIONS" or path == "/health":
+            return
+        given = headers.get("x-service-token") or (query.get("token") or [""])[0]
+        if not hmac.compare_digest(given.encode(), self.token.encode()):
+            raise HttpError(401, "missing or wrong service token")
+
+    async def _read_request(self, reader: asyncio.StreamReader) -> tuple[str, str, dict, dict, bytes]:
+        line = await reader.readline()
+        parts = line.decode("latin-1").split()
+        if len(parts) != 3:
+            raise HttpError(400, "bad request line")
+        method, target, _ = parts
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            key, _, value = line.decode("latin-1").partition(":")
+            headers[key.strip().lower()] = value.strip()
+        length = int(headers.get("content-length") or 0)
+        if length > MAX_UPLOAD_MB * 1024 * 1024:
+            raise HttpError(413, f"upload larger than {MAX_UPLOAD_MB}MB")
+        body = await reader.readexactly(length) if length else b""
+        url = urlsplit(target)
+        return method.upper(), url.path.rstrip("/") or "/", parse_qs(url.query), headers, body
+
+    async def route(self, method: str, path: str, headers: dict, body: bytes, writer):
+        parts = path.strip("/").split("/")
+        if method == "OPTIONS":
+            await self._send(writer, 204, b"", "text/plain")
+        elif path == "/health":
+            await self._send_json(writer, 200, {"ok": True, "pending": self.pending(),
+                                                "api_jobs": self.api_jobs})
+        elif parts == ["jobs"] and method == "POST":
+            files, fields = parse_multipart(headers.get("content-type", ""), body)
+            job = self.submit(files, fields)
+            await self._send_json(writer, 202, {"job_id": job.id, "status_url": f"/jobs/{job.id}",
+                                                "events_url": f"/jobs/{job.id}/events"})
+        elif parts == ["jobs"] and method == "GET":
+            await self._send_json(writer, 200, {"pending": self.pending(),
+                                                "jobs": [job.status() for job in self.jobs.values()]})
+        elif parts[0] == "jobs" and len(parts) in (2, 3):
+            if method != "GET":
+                raise HttpError(405, "method not allowed")
+            job = self.jobs.get(parts[1])
+            if job is None:
+                raise HttpError(404, "no such job")
+            if len(parts) == 2:
+                await self._send_json(writer, 200, job.status(with_result=True))
+            elif parts[2] == "events":
+                await self._stream_events(job, writer)
+            else:
+                raise HttpError(404, "not found")
+        else:
+            raise HttpError(404, "not found")
+
+    async def _stream_events(self, job: ServiceJob, writer):
+        writer.write(self._head(200, "text/event-stream", extra="Cache-Control: no-cache\r\n" + writer.cors))
+        queue = job.listen()
+        try:
+            while True:
+                try:
+                    event, data = await asyncio.wait_for(queue.get(), KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    writer.write(b": keepalive\n\n")
+                    await writer.drain()
+                    continue
+                writer.write(f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n".encode("utf-8"))
+                await writer.drain()
+                if event in TERMINAL_EVENTS:
+                    break
+        finally:
+            job.unlisten(queue)
+
+    @staticmethod
+    def _head(status: int, content_type: str, length: int | None = None, extra: str = "") -> bytes:
+        head = (f"HTTP/1.1 {status} {STATUS_TEXT.get(status, '')}\r\n"
+                f"Content-Type: {content_type}\r\n"
+                "Connection: close\r\n" + extra)
+        if length is not None:
+            head += f"Content-Length: {length}\r\n"
+        return (head + "\r\n").encode("latin-1")
+
+    async def _send(self, writer: _Connection, status: int, body: bytes, content_type: str):
+        writer.write(self._head(status, content_type, len(body), writer.cors) + body)
+        await writer.drain()
+
+    async def _send_json(self, writer, status: int, data: dict):
+        await self._send(writer, status, json.dumps(data, ensure_ascii=False).encode("utf-8"),
+                         "application/json")
+
+
+async def serve(service: ExtractionService, host: str, port: int, ready=None):
+    """Run the service until cancelled. ready(port) is called once it is listening."""
+    await service.start()
+    server = await asyncio.start_server(service.handle, host, port)
+    if ready is not None:
+        ready(server.sockets[0].getsockname()[1])
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        await service.stop()
+
+
+def serve_main(argv: list[str]):
+    parser = argparse.ArgumentParser(
+        prog="extract_workorder.py serve",
+        description="Local HTTP extraction service (PDF upload, SSE progress, job status)",
+    )
+    parser.add_argument("--host", default="127.0.0.1",
+                        help="Interface to listen on (default 127.0.0.1; anything else requires a token)")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help=f"Port (default {DEFAULT_PORT})")
+    parser.add_argument("--output", help="Output directory", default=str(OUTPUT_DIR))
+    parser.add_argument("--jobs", type=int, default=DEFAULT_API_JOBS,
+                        help=f"Concurrent Claude extractions (default {DEFAULT_API_JOBS})")
+    parser.add_argument("--render-workers", type=int, default=DEFAULT_RENDER_WORKERS,
+                        help=f"PDF rendering processes (default {DEFAULT_RENDER_WORKERS})")
+    parser.add_argument("--max-pending", type=int, default=MAX_PENDING_JOBS,
+                        help=f"Queued + running jobs before uploads get 429 (default {MAX_PENDING_JOBS})")
+    parser.add_argument("--allow-origin", action="append", default=[], metavar="ORIGIN",
+                        help="Web app origin allowed to call the service from a browser, e.g. "
+                             "https://lytcomm.com (repeatable; default none)")
+    parser.add_argument("--token", help="Service token (default: a random one when not on loopback)")
+    parser.add_argument("--bbox", metavar="MIN_LAT,MIN_LNG,MAX_LAT,MAX_LNG",
+                        help="Project area GPS points are validated against when an upload has no bbox "
+                             "field (default: within 30 km of each job's median point)")
+    args = parser.parse_args(argv)
+    try:
+        bbox = parse_bbox(args.bbox)
+    except ValueError as e:
+        parser.error(str(e))
+    token = args.token or (None if is_loopback(args.host) else secrets.token_urlsafe(24))
+
+    print()
+    print("=" * 60)
+    print("  LYT Communications - Extraction Service")
+    print("=" * 60)
+    print()
+
+    api_key = load_api_key()
+    service = ExtractionService(api_key, Path(args.output), args.jobs, args.render_workers, args.max_pending,
+                                allow_origins=tuple(args.allow_origin), token=token, bbox=bbox)
+
+    def ready(port):
+        print(f"Listening on http://{args.host}:{port} "
+              f"({args.jobs} concurrent extractions, {args.render_workers} render workers)")
+        print(f"Browser origins allowed: {', '.join(args.allow_origin) or 'none'}")
+        if token:
+            print(f"Service token (X-Service-Token header or ?token=): {token}")
+        print("Press Ctrl+C to stop.\n")
+
+    try:
+        asyncio.run(serve(service, args.host, args.port, ready))
+    except KeyboardInterrupt:
+        print("\nStopped.")
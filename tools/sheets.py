@@ -0,0 +1,340 @@
+"""
+LYT Communications - Per-Sheet Map Extraction
+Sends one extraction per map sheet instead of a single request holding
+every tile. Each request gets the shared work order text, that sheet's
+tiles and map text, and a legend tile (the sheet's own, or the first
+legend found when the sheet has none). Sheets run concurrently, so maps
+aren't capped at MAX_PAGES_MAP pages and each request reaches its first
+token sooner.
+
+Per-sheet results are merged in sheet order. Records drawn on two sheets
+(structures in the overlap at a match line, a segment shown on both) are
+kept once, and SEG / HH / FP / ... / SP IDs are renumbered across the job
+with every reference updated. Work order line items (no map link) are
+taken from one sheet only; linked line items are merged per code and
+linked record.
+
+Usage:
+    python extract_workorder.py --wo WO.pdf --map MAP.pdf --per-sheet
+    python extract_workorder.py batch path/to/folder --per-sheet
+"""
+
+import math
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+from json_stream import RECORD_ARRAYS
+
+SHEET_WORKERS = 4  # concurrent per-sheet extractions
+DUPLICATE_METERS = 15.0  # same-type structures / splices this close on different sheets are one record
+SEGMENT_DUPLICATE_METERS = 30.0  # ... segments on the same street with both ends this close
+LINK_KEYS = ("segment_id", "structure_id", "splice_id")  # line item -> map record references
+
+STRUCTURE_PREFIXES = {
+    "handhole": "HH",
+    "flowerpot": "FP",
+    "ground_rod": "GR",
+    "pedestal": "PED",
+    "terminal_box": "TB",
+    "marker_post": "MP",
+    "aux_ground": "AG",
+}
+
+
+def split_tiles_by_sheet(map_tiles: list) -> dict[int, list]:
+    """
+    Group tiles by page. Sheets without a LEGEND tile get the first legend
+    found, so every request can decode the symbols.
+    """
+    sheets = {}
+    for tile in map_tiles:
+        sheets.setdefault(tile.page, []).append(tile)
+    legend = next((t for t in map_tiles if t.name == "LEGEND"), None)
+    if legend is not None:
+        for tiles in sheets.values():
+            if not any(t.name == "LEGEND" for t in tiles):
+                tiles.insert(0, legend)
+    return dict(sorted(sheets.items()))
+
+
+def sheet_map_text(page: int, total: int, text: str) -> str:
+    header = (f"MAP SHEET {page} OF {total}: this request covers only this sheet; "
+              f"the other sheets are extracted separately.")
+    return f"{header}\n--- Map Page {page} ---\n{text}" if text else header
+
+
+def _add_sheet_usage(total: dict, usage: dict):
+    for key, value in usage.items():
+        if key == "time_to_first_token":
+            if value is not None and (total.get(key) is None or value < total[key]):
+                total[key] = value
+        elif value:
+            total[key] = total.get(key, 0) + value
+
+
+def extract_per_sheet(
+    wo_text: str,
+    map_page_texts: dict[int, str],
+    map_tiles: list,
+    api_key: str,
+    workers: int = SHEET_WORKERS,
+    verbose: bool = True,
+    usage: dict | None = None,
+) -> dict:
+    """
+    Run one Claude extraction per map sheet (concurrently) and merge them.
+    map_page_texts is pdf_processor.extract_map_page_texts() output.
+    If a usage dict is passed it is filled with token counts summed over
+    all sheets, plus the sheet count and earliest time_to_first_token.
+    Raises RuntimeError naming the sheets that failed.
+    """
+    from claude_client import extract_with_claude
+    from metrics import bind
+
+    sheets = split_tiles_by_sheet(map_tiles)
+    pages = sorted(set(sheets) | set(map_page_texts))
+    if len(pages) <= 1:
+        return extract_with_claude(wo_text, map_page_texts.get(pages[0], "") if pages else "",
+                                   map_tiles, api_key, verbose=verbose, usage=usage)
+
+    if verbose:
+        print(f"Extracting {len(pages)} map sheets separately ({min(workers, len(pages))} at a time)...")
+
+    def run(page):
+        sheet_usage = {}
+        text = sheet_map_text(page, len(pages), map_page_texts.get(page, ""))
+        result = extract_with_claude(wo_text, text, sheets.get(page, []), api_key,
+                                     verbose=False, usage=sheet_usage)
+        return result, sheet_usage
+
+    results = {}
+    errors = {}
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        run = bind(run)
+        futures = {page: pool.submit(run, page) for page in pages}
+        for page, future in futures.items():
+            try:
+                results[page], sheet_usage = future.result()
+            except Exception as e:
+                errors[page] = e
+                if verbose:
+                    print(f"  Sheet {page}: FAILED ({e})")
+                continue
+            if verbose:
+                print(f"  Sheet {page}: {len(sheets.get(page, []))} tiles, "
+                      f"{sheet_usage.get('output_tokens', 0)} output tokens")
+            if usage is not None:
+                _add_sheet_usage(usage, sheet_usage)
+
+    if usage is not None:
+        usage["sheets"] = len(pages)
+    if errors:
+        failed = ", ".join(f"sheet {page} ({e})" for page, e in sorted(errors.items()))
+        raise RuntimeError(f"Per-sheet extraction failed for {failed}")
+
+    merged = merge_sheet_results(results)
+    if verbose:
+        print(f"  Merged: {len(merged['segments'])} segments, {len(merged['structures'])} structures, "
+              f"{len(merged['splice_points'])} splice points, {len(merged['line_items'])} line items")
+    return merged
+
+
+def _gps(point) -> tuple[float, float] | None:
+    """(lat, lng) from a {lat, lng} dict, or None when missing or the 0,0 placeholder."""
+    if not isinstance(point, dict):
+        return None
+    try:
+        lat, lng = float(point.get("lat")), float(point.get("lng"))
+    except (TypeError, ValueError):
+        return None
+    if lat == 0 and lng == 0:
+        return None
+    return lat, lng
+
+
+def _meters(a: tuple[float, float], b: tuple[float, float]) -> float:
+    """Approximate distance (equirectangular), plenty for tens of meters."""
+    mean_lat = math.radians((a[0] + b[0]) / 2)
+    dx = (b[1] - a[1]) * 111_320 * math.cos(mean_lat)
+    dy = (b[0] - a[0]) * 110_540
+    return math.hypot(dx, dy)
+
+
+def _near(a, b, limit: float) -> bool:
+    return a is not None and b is not None and _meters(a, b) <= limit
+
+
+def _same_segment(a: dict, b: dict) -> bool:
+    street_a = str(a.get("street_name") or "").strip().lower()
+    street_b = str(b.get("street_name") or "").strip().lower()
+    if not street_a or street_a != street_b:
+        return False
+    a_ends = (_gps(a.get("gps_start")), _gps(a.get("gps_end")))
+    b_ends = (_gps(b.get("gps_start")), _gps(b.get("gps_end")))
+    limit = SEGMENT_DUPLICATE_METERS
+    return ((_near(a_ends[0], b_ends[0], limit) and _near(a_ends[1], b_ends[1], limit))
+            or (_near(a_ends[0], b_ends[1], limit) and _near(a_ends[1], b_ends[0], limit)))
+
+
+def _same_point(a: dict, b: dict, kind_key: str) -> bool:
+    if str(a.get(kind_key) or "").lower() != str(b.get(kind_key) or "").lower():
+        return False
+    return _near(_gps(a.get("gps")), _gps(b.get("gps")), DUPLICATE_METERS)
+
+
+def _structure_prefix(structure: dict) -> str:
+    prefix = STRUCTURE_PREFIXES.get(str(structure.get("type") or "").lower())
+    if prefix:
+        return prefix
+    match = re.match(r"([A-Z]+)-", str(structure.get("id") or ""))
+    return match.group(1) if match else "ST"
+
+
+class _Numbering:
+    """Sequential IDs per prefix: SEG-001, SEG-002, HH-001, ..."""
+
+    def __init__(self):
+        self.counts = {}
+
+    def next(self, prefix: str) -> str:
+        self.counts[prefix] = self.counts.get(prefix, 0) + 1
+        return f"{prefix}-{self.counts[prefix]:03d}"
+
+
+def _merge_linked_item(kept: dict, kept_page: int, item: dict, page: int):
+    """
+    Fold a linked line item into the one already kept for the same code and
+    record. Rows from the same sheet are parts of the work and add up; the
+    same record seen on another sheet (in the overlap) is the same work
+    again, so the larger quantity stands.
+    """
+    try:
+        a, b = float(kept.get("quantity") or 0), float(item.get("quantity") or 0)
+    except (TypeError, ValueError):
+        return
+    total = a + b if page == kept_page else max(a, b)
+    kept["quantity"] = int(total) if total == int(total) else round(total, 2)
+
+
+def _remap(record: dict, key: str, ids: dict):
+    value = record.get(key)
+    if value in ids:
+        record[key] = ids[value]
+
+
+def merge_sheet_results(results: dict[int, dict]) -> dict:
+    """
+    Merge per-sheet extractions (keyed by page number) into one document.
+    Deterministic: sheets are taken in page order and records in response
+    order, so the same inputs always give the same IDs.
+    """
+    merged = {"project": {}, **{name: [] for name in RECORD_ARRAYS}, "reconciliation": {}}
+    numbering = _Numbering()
+    owner = {name: [] for name in RECORD_ARRAYS}  # sheet of each merged record
+    dropped = {name: 0 for name in RECORD_ARRAYS}
+    unmatched = []
+    notes = []
+    wo_items_page = None  # the one sheet whose copy of the WO line items is kept
+    linked_items = {}  # (code, uom, description, links) -> (merged item, sheet)
+
+    def add(name: str, page: int, record: dict, same) -> dict | None:
+        """Append record unless another sheet already has it; returns the kept duplicate."""
+        for existing, sheet in zip(merged[name], owner[name]):
+            if sheet != page and same(existing, record):
+                dropped[name] += 1
+                return existing
+        merged[name].append(record)
+        owner[name].append(page)
+        return None
+
+    for page, result in sorted(results.items()):
+        if not isinstance(result, dict):
+            continue
+        for key, value in (result.get("project") or {}).items():
+            if value and not merged["project"].get(key):
+                merged["project"][key] = value
+
+        segment_ids, structure_ids, splice_ids = {}, {}, {}
+
+        for seg in result.get("segments") or []:
+            seg = dict(seg)
+            old = seg.get("segment_id")
+            kept = add("segments", page, seg, _same_segment)
+            if kept is None:
+                seg["segment_id"] = numbering.next("SEG")
+                kept = seg
+            if old is not None:
+                segment_ids[old] = kept["segment_id"]
+
+        for structure in result.get("structures") or []:
+            structure = dict(structure)
+            old = structure.get("id")
+            _remap(structure, "segment_id", segment_ids)
+            kept = add("structures", page, structure, lambda a, b: _same_point(a, b, "type"))
+            if kept is None:
+                structure["id"] = numbering.next(_structure_prefix(structure))
+                kept = structure
+            if old is not None:
+                structure_ids[old] = kept["id"]
+
+        for splice in result.get("splice_points") or []:
+            splice = dict(splice)
+            old = splice.get("splice_id")
+            _remap(splice, "segment_id", segment_ids)
+            _remap(splice, "handhole_id", structure_ids)
+            kept = add("splice_points", page, splice, lambda a, b: _same_point(a, b, "splice_type"))
+            if kept is None:
+                splice["splice_id"] = numbering.next("SP")
+                kept = splice
+            if old is not None:
+                splice_ids[old] = kept["splice_id"]
+
+        for item in result.get("line_items") or []:
+            item = dict(item)
+            _remap(item, "segment_id", segment_ids)
+            _remap(item, "structure_id", structure_ids)
+            _remap(item, "splice_id", splice_ids)
+            links = tuple(item.get(k) for k in LINK_KEYS)
+            if not any(links):
+                # Work order items: every sheet copies them from the shared WO
+                # text, so take one sheet's copy as is (repeated rows included)
+                if wo_items_page is None:
+                    wo_items_page = page
+                if page != wo_items_page:
+                    dropped["line_items"] += 1
+                    continue
+            else:
+                key = (item.get("code"), item.get("uom"), item.get("description"), links)
+                if key in linked_items:
+                    _merge_linked_item(*linked_items[key], item, page)
+                    dropped["line_items"] += 1
+                    continue
+                linked_items[key] = (item, page)
+            merged["line_items"].append(item)
+            owner["line_items"].append(page)
+
+        recon = result.get("reconciliation") or {}
+        for entry in recon.get("unmatched_items") or []:
+            if entry not in unmatched:
+                unmatched.append(entry)
+        notes.extend(f"Sheet {page}: {note}" for note in recon.get("notes") or [])
+
+    footage = 0
+    for seg in merged["segments"]:
+        try:
+            footage += float(seg.get("footage") or 0)
+        except (TypeError, ValueError):
+            pass
+    removed = ", ".join(f"{n} {name.replace('_', ' ')}" for name, n in dropped.items() if n)
+    notes.insert(0, f"Merged {len(results)} map sheets extracted separately"
+                 + (f"; duplicates removed: {removed}" if removed else ""))
+    merged["reconciliation"] = {
+        "total_footage": round(footage, 2),
+        "total_segments": len(merged["segments"]),
+        "total_structures": len(merged["structures"]),
+        "total_splice_points": len(merged["splice_points"]),
+        "total_line_items": len(merged["line_items"]),
+        "unmatched_items": unmatched,
+        "notes": notes,
+    }
+    return merged
@@ -0,0 +1,98 @@
+"""
+A stand-in for the Anthropic Messages API (POST /v1/messages, streamed as
+SSE), for tests that point ANTHROPIC_BASE_URL at it. Each request pops the
+next scripted reply off `replies`; when none are left it streams `text`.
+A prefilled assistant turn is taken as already written, and with `limit`
+set each streamed reply stops at max_tokens after that many characters.
+"""
+
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+EXTRACTION = json.dumps({
+    "project": {"name": "Test", "work_order_number": "WO-1"},
+    "segments": [{"segment_id": "SEG-001", "footage": 120, "structure_from": "HH-1", "structure_to": "HH-2"}],
+    "structures": [{"id": "HH-1"}, {"id": "HH-2"}],
+    "splice_points": [],
+    "line_items": [{"code": "UG1", "uom": "LF", "quantity": 120}],
+    "reconciliation": {"notes": []},
+})
+
+
+class StubAnthropic:
+    """Serve on 127.0.0.1:<random port> in a daemon thread until close()."""
+
+    def __init__(self, text: str = EXTRACTION):
+        self.text = text
+        self.replies = []    # (status, headers, body) for error replies, or a str to stream
+        self.requests = []   # decoded request bodies, in arrival order
+        self.times = []      # time.monotonic() each request arrived
+        self.limit = None    # chars streamed per reply before stopping at max_tokens
+        self.lock = threading.Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers["content-length"])))
+                with stub.lock:
+                    stub.requests.append(body)
+                    stub.times.append(time.monotonic())
+                    reply = stub.replies.pop(0) if stub.replies else stub.text
+                if isinstance(reply, str):
+                    stub._stream(self, body, reply, stub.limit)
+                else:
+                    status, headers, payload = reply
+                    data = json.dumps(payload).encode()
+                    self.send_response(status)
+                    for key, value in {"content-type": "application/json", **headers}.items():
+                        self.send_header(key, value)
+                    self.send_header("content-length", str(len(data)))
+                    self.end_headers()
+                    self.wfile.write(data)
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def error(self, status: int, error_type: str, retry_after: float | None = None):
+        """Queue an error reply (e.g. 429 rate_limit_error, 529 overloaded_error)."""
+        headers = {} if retry_after is None else {"retry-after": str(retry_after)}
+        self.replies.append((status, headers, {"type": "error", "error": {"type": error_type, "message": "stub"}}))
+
+    @staticmethod
+    def _stream(handler: BaseHTTPRequestHandler, body: dict, text: str, limit: int | None = None):
+        messages = body["messages"]
+        prefill = messages[-1]["content"] if messages[-1]["role"] == "assistant" else ""
+        if isinstance(prefill, str) and text.startswith(prefill):
+            text = text[len(prefill):]
+        stop_reason = "end_turn"
+        if limit is not None and len(text) > limit:
+            text, stop_reason = text[:limit], "max_tokens"
+        handler.send_response(200)
+        handler.send_header("content-type", "text/event-stream")
+        handler.end_headers()
+
+        def event(name, data):
+            handler.wfile.write(f"event: {name}\ndata: {json.dumps({'type': name, **data})}\n\n".encode())
+
+        event("message_start", {"message": {
+            "id": "msg_stub", "type": "message", "role": "assistant", "model": body["model"], "content": [],
+            "stop_reason": None, "stop_sequence": None,
+            "usage": {"input_tokens": 100, "output_tokens": 1,
+                      "cache_creation_input_tokens": 0, "cache_read_input_tokens": 0}}})
+        event("content_block_start", {"index": 0, "content_block": {"type": "text", "text": ""}})
+        for i in range(0, len(text), 64):
+            event("content_block_delta", {"index": 0, "delta": {"type": "text_delta", "text": text[i:i + 64]}})
+        event("content_block_stop", {"index": 0})
+        event("message_delta", {"delta": {"stop_reason": stop_reason, "stop_sequence": None},
+                                "usage": {"output_tokens": max(1, len(text) // 4)}})
+        event("message_stop", {})
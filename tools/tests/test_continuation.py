@@ -0,0 +1,89 @@
+"""
+max_tokens continuations: ExtractionStream against a stub /v1/messages
+that stops each reply at max_tokens after a fixed number of characters,
+so the response arrives over several rounds that are stitched back into
+the single-shot result, and the round cap that repairs what arrived.
+"""
+
+import json
+import os
+import sys
+import unittest
+import uuid
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from claude_client import ExtractionStream  # noqa: E402
+from stub_anthropic import StubAnthropic  # noqa: E402
+
+EXTRACTION = json.dumps({
+    "project": {"name": "Test", "work_order_number": "WO-1"},
+    "segments": [{"segment_id": f"SEG-{i:03d}", "footage": 100 + i, "structure_from": f"HH-{i}",
+                  "structure_to": f"HH-{i + 1}", "notes": "bore {HDD} under \"Main St\""} for i in range(1, 7)],
+    "structures": [{"id": f"HH-{i}", "unit_code": "HH1"} for i in range(1, 8)],
+    "splice_points": [{"splice_id": "SP-1", "handhole_id": "HH-1"}],
+    "line_items": [{"code": "UG1", "uom": "LF", "quantity": 621}, {"code": "HH1", "uom": "EA", "quantity": 7}],
+    "reconciliation": {"notes": ["footage matches"]},
+})
+
+
+class ContinuationTest(unittest.TestCase):
+    def setUp(self):
+        self.stub = StubAnthropic(EXTRACTION)
+        self._base_url = os.environ.get("ANTHROPIC_BASE_URL")
+        os.environ["ANTHROPIC_BASE_URL"] = self.stub.url
+
+    def tearDown(self):
+        self.stub.close()
+        if self._base_url is None:
+            os.environ.pop("ANTHROPIC_BASE_URL", None)
+        else:
+            os.environ["ANTHROPIC_BASE_URL"] = self._base_url
+
+    def stream(self, **kwargs) -> ExtractionStream:
+        # A key of its own, so claude_client builds a fresh client that picks up the stub URL
+        return ExtractionStream("WORK ORDER WO-1", "", [], f"test-{uuid.uuid4().hex}", verbose=False, **kwargs)
+
+    def test_stitched_rounds_match_single_shot(self):
+        single = self.stream()
+        single_records = list(single)
+        self.assertEqual(single.rounds, 1)
+
+        self.stub.limit = len(EXTRACTION) * 2 // 5
+        stitched = self.stream()
+        records = list(stitched)
+
+        self.assertEqual(stitched.rounds, 3)
+        self.assertEqual(stitched.usage["continuations"], 2)
+        self.assertEqual(stitched.stop_reason, "end_turn")
+        self.assertEqual(stitched.result, single.result)
+        self.assertEqual(records, single_records)
+        # Each continuation prefills the text kept so far, cut at a record boundary
+        for request in self.stub.requests[2:]:
+            prefill = request["messages"][-1]
+            self.assertEqual(prefill["role"], "assistant")
+            self.assertTrue(EXTRACTION.startswith(prefill["content"]))
+            self.assertIn(prefill["content"].rstrip()[-1], "{[},")
+
+    def test_round_cap_repairs_and_notes_the_loss(self):
+        self.stub.limit = len(EXTRACTION) // 3
+        stream = self.stream(max_continuations=1)
+        records = list(stream)
+
+        self.assertEqual(stream.rounds, 2)
+        self.assertEqual(len(self.stub.requests), 2)
+        self.assertEqual(stream.stop_reason, "max_tokens")
+        expected = json.loads(EXTRACTION)
+        segments = stream.result["segments"]
+        self.assertTrue(segments)
+        self.assertEqual(segments, expected["segments"][:len(segments)])
+        self.assertEqual([record for name, record in records if name == "segments"], segments)
+        notes = stream.result["reconciliation"]["notes"]
+        self.assertEqual(len(notes), 1)
+        self.assertTrue(notes[0].startswith("Response truncated at max_tokens; incomplete or missing:"))
+        self.assertIn("all line_items", notes[0])
+
+
+if __name__ == "__main__":
+    unittest.main()
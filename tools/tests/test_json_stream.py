@@ -0,0 +1,115 @@
+"""
+Streaming record parser and truncated-response repair: records emitted
+the same whatever the chunk boundaries, strings holding braces, brackets
+and escapes, and the repair report for a response cut at max_tokens.
+"""
+
+import json
+import sys
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from json_stream import RecordStreamParser, repair_truncated_json  # noqa: E402
+
+DOCUMENT = {
+    "work_order": {"number": "WO-1", "note": "see {sheet 2} [rev A]"},
+    "segments": [
+        {"segment_id": "SEG-001", "footage": 120, "notes": 'bore under "Main St" {HDD}'},
+        {"segment_id": "SEG-002", "footage": 85.5, "notes": "path C:\\maps\\}{ and a tab\t"},
+    ],
+    "structures": [
+        {"id": "HH-1", "unit_code": "HH1", "gps": {"lat": 29.42, "lng": -98.49}},
+        {"id": "HH-2", "unit_code": "HH1", "notes": "quote \" then ] and }"},
+    ],
+    "splice_points": [{"splice_id": "SP-1", "handhole_id": "HH-1"}],
+    "line_items": [
+        {"code": "UG1", "uom": "LF", "quantity": 205.5, "links": [{"segment_id": "SEG-001"}]},
+        {"code": "HH1", "uom": "EA", "quantity": 2, "description": "caf\u00e9 \u2013 [2x3]"},
+    ],
+    "reconciliation": {"notes": ["nested {brace} in a note"]},
+}
+
+
+def _chunks(text: str, size: int) -> list[str]:
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+class RecordStreamParserTest(unittest.TestCase):
+    def parse(self, chunks) -> tuple[RecordStreamParser, list]:
+        parser = RecordStreamParser()
+        records = []
+        for chunk in chunks:
+            records.extend(parser.feed(chunk))
+        return parser, records
+
+    def expected(self) -> list:
+        return [(name, record) for name in ("segments", "structures", "splice_points", "line_items")
+                for record in DOCUMENT[name]]
+
+    def test_chunk_sizes(self):
+        for text in (json.dumps(DOCUMENT), json.dumps(DOCUMENT, indent=2, ensure_ascii=False)):
+            for size in (1, 3, 7, 64, len(text)):
+                with self.subTest(size=size, indent="\n" in text):
+                    parser, records = self.parse(_chunks(text, size))
+                    self.assertEqual(records, self.expected())
+                    self.assertEqual(parser.counts, {"segments": 2, "structures": 2,
+                                                     "splice_points": 1, "line_items": 2})
+                    self.assertEqual(sum(parser.invalid.values()), 0)
+
+    def test_markdown_fence_and_prose(self):
+        text = "Here is the extraction:\n```json\n" + json.dumps(DOCUMENT) + "\n```\n"
+        _, records = self.parse(_chunks(text, 5))
+        self.assertEqual(records, self.expected())
+
+    def test_records_missing_required_key_are_invalid(self):
+        text = json.dumps({"segments": [{"footage": 10}, {"segment_id": "SEG-9"}],
+                           "line_items": [{"uom": "EA"}]})
+        parser, records = self.parse(_chunks(text, 3))
+        self.assertEqual(records, [("segments", {"segment_id": "SEG-9"})])
+        self.assertEqual(parser.invalid["segments"], 1)
+        self.assertEqual(parser.invalid["line_items"], 1)
+
+    def test_other_arrays_are_ignored(self):
+        text = json.dumps({"notes": [{"segment_id": "not a record"}], "segments": [{"segment_id": "SEG-1"}]})
+        _, records = self.parse(_chunks(text, 7))
+        self.assertEqual(records, [("segments", {"segment_id": "SEG-1"})])
+
+
+class RepairTruncatedJsonTest(unittest.TestCase):
+    def test_complete_document_is_untouched(self):
+        text = json.dumps(DOCUMENT)
+        doc, report = repair_truncated_json(text)
+        self.assertEqual(doc, DOCUMENT)
+        self.assertEqual(report["truncated_chars"], 0)
+        self.assertEqual(report["dropped"], {})
+        self.assertEqual(report["missing"], [])
+
+    def test_cut_inside_a_record(self):
+        text = json.dumps(DOCUMENT)
+        # Cut in the middle of the second structure, inside its quoted "]" and "}"
+        cut = text.index('"quote') + 10
+        doc, report = repair_truncated_json(text[:cut])
+        self.assertEqual(doc["segments"], DOCUMENT["segments"])
+        self.assertEqual(doc["structures"], DOCUMENT["structures"][:1])
+        self.assertEqual(report["dropped"], {"structures": 1})
+        self.assertEqual(report["missing"], ["splice_points", "line_items", "reconciliation"])
+        self.assertEqual(report["cut_at"] + report["truncated_chars"], cut)
+        self.assertTrue(text[:report["cut_at"]].endswith("}"))
+
+    def test_cut_after_a_record(self):
+        text = json.dumps(DOCUMENT)
+        cut = text.index('{"code": "HH1"')
+        doc, report = repair_truncated_json("```json\n" + text[:cut])
+        self.assertEqual(doc["line_items"], DOCUMENT["line_items"][:1])
+        self.assertEqual(report["dropped"], {})
+        self.assertEqual(report["missing"], ["reconciliation"])
+        self.assertEqual(report["cut_at"], len("```json\n") + cut - len(", "))
+
+    def test_no_document(self):
+        self.assertEqual(repair_truncated_json("I couldn't read the map.")[0], None)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,111 @@
+"""
+Retry and rate-limit behaviour: ExtractionStream against a stub
+/v1/messages that answers 429 / 529 with retry-after before streaming,
+and the timeout retry budget.
+"""
+
+import os
+import sys
+import threading
+import unittest
+import uuid
+from pathlib import Path
+from unittest import mock
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import anthropic  # noqa: E402
+import httpx  # noqa: E402
+
+import scheduler  # noqa: E402
+from claude_client import MODEL, ExtractionStream  # noqa: E402
+from stub_anthropic import StubAnthropic  # noqa: E402
+
+
+class RetryTest(unittest.TestCase):
+    def setUp(self):
+        self.stub = StubAnthropic()
+        self._base_url = os.environ.get("ANTHROPIC_BASE_URL")
+        os.environ["ANTHROPIC_BASE_URL"] = self.stub.url
+        # A limiter of our own that records backoff sleeps instead of sleeping
+        self.sleeps = []
+        self.limiter = scheduler.RateLimiter(sleep=self.sleeps.append)
+        self._limiter = scheduler._limiters.get(MODEL)
+        scheduler._limiters[MODEL] = self.limiter
+        jitter = mock.patch("scheduler.random.uniform", return_value=0.0)
+        jitter.start()
+        self.addCleanup(jitter.stop)
+
+    def tearDown(self):
+        self.stub.close()
+        if self._limiter is None:
+            scheduler._limiters.pop(MODEL, None)
+        else:
+            scheduler._limiters[MODEL] = self._limiter
+        if self._base_url is None:
+            os.environ.pop("ANTHROPIC_BASE_URL", None)
+        else:
+            os.environ["ANTHROPIC_BASE_URL"] = self._base_url
+
+    def stream(self) -> ExtractionStream:
+        # A key of its own, so claude_client builds a fresh client that picks up the stub URL
+        return ExtractionStream("WORK ORDER WO-1", "", [], f"test-{uuid.uuid4().hex}", verbose=False)
+
+    def test_backs_off_for_retry_after_then_streams(self):
+        self.stub.error(429, "rate_limit_error", retry_after=0.4)
+        self.stub.error(529, "overloaded_error", retry_after=0.2)
+        stream = self.stream()
+        records = list(stream)
+
+        self.assertEqual(len(self.stub.requests), 3)
+        self.assertEqual(self.sleeps, [0.4, 0.2])
+        self.assertEqual(stream.result["segments"][0]["segment_id"], "SEG-001")
+        self.assertIn(("line_items", {"code": "UG1", "uom": "LF", "quantity": 120}), records)
+        # The 429 paused the model: the retry waited in the queue for retry-after
+        self.assertGreaterEqual(self.stub.times[1] - self.stub.times[0], 0.4)
+
+    def test_rate_limit_pause_holds_other_jobs(self):
+        self.stub.error(429, "rate_limit_error", retry_after=0.5)
+        stream = self.stream()
+        admitted = []
+
+        def other_job():
+            # Queues behind the paused model like any other extraction would
+            while not self.sleeps:
+                threading.Event().wait(0.01)
+            self.limiter.acquire(100, 100)
+            admitted.append(scheduler.time.monotonic())
+
+        other = threading.Thread(target=other_job)
+        other.start()
+        list(stream)
+        other.join(10)
+
+        self.assertEqual(len(admitted), 1)
+        self.assertGreaterEqual(admitted[0] - self.stub.times[0], 0.5)
+        self.assertFalse(self.limiter._queue)
+
+    def test_gives_up_on_non_retryable_error(self):
+        self.stub.error(400, "invalid_request_error")
+        with self.assertRaises(anthropic.BadRequestError):
+            list(self.stream())
+        self.assertEqual(len(self.stub.requests), 1)
+        self.assertEqual(self.sleeps, [])
+
+    def test_timeouts_have_their_own_budget(self):
+        timeout = anthropic.APITimeoutError(request=httpx.Request("POST", "http://stub/v1/messages"))
+        calls = []
+
+        def fn():
+            calls.append(1)
+            raise timeout
+
+        with self.assertRaises(anthropic.APITimeoutError):
+            scheduler.call_with_retries(MODEL, fn, 100, 100)
+        self.assertEqual(len(calls), scheduler.MAX_TIMEOUT_RETRIES + 1)
+        self.assertTrue(scheduler.is_retryable(
+            anthropic.APIConnectionError(request=timeout.request), scheduler.MAX_TIMEOUT_RETRIES))
+
+
+if __name__ == "__main__":
+    unittest.main()
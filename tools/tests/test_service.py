@@ -0,0 +1,199 @@
+"""
+End-to-end test of service.py against a stub /v1/messages endpoint:
+upload a work order, follow its SSE progress to the result (or failure,
+with its metrics line), and check upload names and the origin and token
+checks. Run with `python -m pytest tests` (or unittest)
+from tools/.
+"""
+
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import threading
+import unittest
+import urllib.error
+import urllib.request
+import uuid
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import fitz  # noqa: E402
+
+import service  # noqa: E402
+from stub_anthropic import StubAnthropic  # noqa: E402
+
+
+def make_work_order(path: Path):
+    doc = fitz.open()
+    page = doc.new_page()
+    page.insert_text((72, 72), "WORK ORDER WO-1  Test project")
+    page.insert_text((72, 110), "Code   Description            UOM   Qty")
+    page.insert_text((72, 128), "UG1    Directional bore 1-1.25  LF    120")
+    doc.save(str(path))
+    doc.close()
+
+
+def multipart(files: dict, fields: dict, filenames: dict | None = None) -> tuple[bytes, str]:
+    boundary = uuid.uuid4().hex
+    body = b""
+    for name, path in files.items():
+        filename = (filenames or {}).get(name, path.name)
+        body += (f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+                 "Content-Type: application/pdf\r\n\r\n").encode() + path.read_bytes() + b"\r\n"
+    for name, value in fields.items():
+        body += f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode()
+    return body + f"--{boundary}--\r\n".encode(), f"multipart/form-data; boundary={boundary}"
+
+
+class ServiceTest(unittest.TestCase):
+    TOKEN = "test-token"
+    ORIGIN = "https://app.example.com"
+
+    @classmethod
+    def setUpClass(cls):
+        cls.stub = StubAnthropic()
+        cls._base_url = os.environ.get("ANTHROPIC_BASE_URL")
+        os.environ["ANTHROPIC_BASE_URL"] = cls.stub.url
+        cls.tmp = tempfile.TemporaryDirectory()
+        cls.wo = Path(cls.tmp.name) / "WO-1 WO.pdf"
+        make_work_order(cls.wo)
+        cls.output = Path(cls.tmp.name) / "output"
+
+        # A key of its own, so claude_client builds a fresh client that picks up the stub URL
+        svc = service.ExtractionService(f"test-{uuid.uuid4().hex}", cls.output,
+                                        api_jobs=1, render_workers=1, max_pending=2,
+                                        allow_origins=(cls.ORIGIN,), token=cls.TOKEN)
+        ready = threading.Event()
+        cls.loop = asyncio.new_event_loop()
+
+        def on_ready(port):
+            cls.base = f"http://127.0.0.1:{port}"
+            ready.set()
+
+        cls.task = cls.loop.create_task(service.serve(svc, "127.0.0.1", 0, on_ready))
+
+        def run():
+            try:
+                cls.loop.run_until_complete(cls.task)
+            except asyncio.CancelledError:
+                pass
+
+        cls.thread = threading.Thread(target=run, daemon=True)
+        cls.thread.start()
+        if not ready.wait(30):
+            raise RuntimeError("service did not start")
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.loop.call_soon_threadsafe(cls.task.cancel)
+        cls.thread.join(30)
+        cls.stub.close()
+        cls.tmp.cleanup()
+        if cls._base_url is None:
+            os.environ.pop("ANTHROPIC_BASE_URL", None)
+        else:
+            os.environ["ANTHROPIC_BASE_URL"] = cls._base_url
+
+    def request(self, path: str, data: bytes | None = None, headers: dict | None = None, token: bool = True):
+        headers = dict(headers or {})
+        if token:
+            headers["X-Service-Token"] = self.TOKEN
+        req = urllib.request.Request(self.base + path, data=data, headers=headers)
+        try:
+            with urllib.request.urlopen(req, timeout=60) as response:
+                return response.status, dict(response.headers), response.read()
+        except urllib.error.HTTPError as e:
+            return e.code, dict(e.headers), e.read()
+
+    def submit(self, **headers) -> dict:
+        body, content_type = multipart({"wo": self.wo}, {"mode": "single"})
+        status, _, data = self.request("/jobs", body, {"Content-Type": content_type, **headers})
+        self.assertEqual(status, 202, data)
+        return json.loads(data)
+
+    def events(self, job: dict) -> list[tuple[str, dict]]:
+        """Every SSE event of the job, until the stream closes."""
+        events = []
+        req = urllib.request.Request(f"{self.base}{job['events_url']}?token={self.TOKEN}")
+        with urllib.request.urlopen(req, timeout=120) as response:
+            name = None
+            for line in response:
+                line = line.decode("utf-8").rstrip("\n")
+                if line.startswith("event: "):
+                    name = line[len("event: "):]
+                elif line.startswith("data: "):
+                    events.append((name, json.loads(line[len("data: "):])))
+        return events
+
+    def metrics_lines(self) -> list[dict]:
+        path = self.output / "metrics.jsonl"
+        if not path.exists():
+            return []
+        return [json.loads(line) for line in path.read_text(encoding="utf-8").splitlines()]
+
+    def test_extraction_streams_records_from_stub(self):
+        job = self.submit()
+        events = self.events(job)
+
+        names = [name for name, _ in events]
+        self.assertEqual(names[-1], "done", events[-1])
+        records = [data["record"] for name, data in events if name == "record"]
+        self.assertIn({"segment_id": "SEG-001", "footage": 120, "structure_from": "HH-1",
+                       "structure_to": "HH-2"}, records)
+
+        status, _, data = self.request(job["status_url"])
+        result = json.loads(data)
+        self.assertEqual(status, 200)
+        self.assertEqual(result["state"], "done")
+        self.assertEqual(result["result"]["line_items"][0]["quantity"], 120)
+        self.assertTrue(self.stub.requests)
+        self.assertTrue(self.stub.requests[-1]["stream"])
+
+    def test_failed_job_writes_metrics(self):
+        self.stub.error(400, "invalid_request_error")
+        job = self.submit()
+        events = self.events(job)
+        self.assertEqual(events[-1][0], "failed", events[-1])
+        lines = [line for line in self.metrics_lines() if line.get("source") == "service"
+                 and line.get("status") == "failed"]
+        self.assertEqual(len(lines), 1, self.metrics_lines())
+        self.assertIn("stub", lines[0]["error"])
+
+    def test_upload_names(self):
+        for filename in ("..", ".", "../.."):
+            body, content_type = multipart({"wo": self.wo}, {}, {"wo": filename})
+            status, _, data = self.request("/jobs", body, {"Content-Type": content_type})
+            self.assertEqual(status, 400, (filename, data))
+        # Directories are stripped from the name
+        body, content_type = multipart({"wo": self.wo}, {}, {"wo": "../../WO-7 WO.pdf"})
+        status, _, data = self.request("/jobs", body, {"Content-Type": content_type})
+        self.assertEqual(status, 202, data)
+        job = json.loads(data)
+        self.assertEqual(self.events(job)[-1][0], "done")
+        self.assertEqual(json.loads(self.request(job["status_url"])[2])["name"], "WO-7 WO")
+
+    def test_token_required(self):
+        self.assertEqual(self.request("/jobs", token=False)[0], 401)
+        self.assertEqual(self.request("/jobs?token=wrong", token=False)[0], 401)
+        self.assertEqual(self.request("/jobs")[0], 200)
+        self.assertEqual(self.request("/health", token=False)[0], 200)
+
+    def test_foreign_origin_refused(self):
+        body, content_type = multipart({"wo": self.wo}, {})
+        status, headers, _ = self.request("/jobs", body, {"Content-Type": content_type,
+                                                         "Origin": "https://evil.example.net"})
+        self.assertEqual(status, 403)
+        self.assertNotIn("Access-Control-Allow-Origin", headers)
+
+    def test_allowed_origin_gets_cors(self):
+        status, headers, _ = self.request("/health", headers={"Origin": self.ORIGIN})
+        self.assertEqual(status, 200)
+        self.assertEqual(headers.get("Access-Control-Allow-Origin"), self.ORIGIN)
+        self.assertNotIn("Access-Control-Allow-Origin", self.request("/health")[1])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,130 @@
+"""
+Per-sheet merging: records drawn on two sheets kept once (structures and
+splices within DUPLICATE_METERS, segments with both ends within
+SEGMENT_DUPLICATE_METERS), IDs renumbered across the job with every
+reference following, and line items merged per code and linked record.
+"""
+
+import sys
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from sheets import merge_sheet_results  # noqa: E402
+
+LAT, LNG = 29.42, -98.49
+METER = 1 / 110_540  # degrees of latitude per meter
+
+
+def _at(north_m: float = 0.0, east_m: float = 0.0) -> dict:
+    return {"lat": LAT + north_m * METER, "lng": LNG + east_m * METER / 0.87}
+
+
+A, B = _at(), _at(200)  # the ends of Main St on sheet 1
+
+SHEET_1 = {
+    "project": {"name": "Test", "work_order_number": "WO-1"},
+    "segments": [
+        {"segment_id": "SEG-001", "street_name": "Main St", "footage": 650, "gps_start": A, "gps_end": B},
+        {"segment_id": "SEG-002", "street_name": "Oak Ave", "footage": 300,
+         "gps_start": _at(0, 100), "gps_end": _at(0, 200)},
+    ],
+    "structures": [
+        {"id": "HH-1", "type": "handhole", "segment_id": "SEG-001", "gps": A},
+        {"id": "HH-2", "type": "handhole", "segment_id": "SEG-001", "gps": B},
+    ],
+    "splice_points": [{"splice_id": "SP-1", "splice_type": "splice_case", "handhole_id": "HH-2",
+                       "segment_id": "SEG-001", "gps": B}],
+    "line_items": [
+        {"code": "UG1", "uom": "LF", "quantity": 950},
+        {"code": "UG1", "uom": "LF", "quantity": 100, "segment_id": "SEG-001"},
+        {"code": "UG1", "uom": "LF", "quantity": 20, "segment_id": "SEG-001"},
+        {"code": "UG10", "uom": "EA", "quantity": 1, "structure_id": "HH-2"},
+    ],
+    "reconciliation": {"notes": ["sheet 1 note"], "unmatched_items": ["PP1"]},
+}
+
+SHEET_2 = {
+    "project": {"name": "", "contractor": "LYT"},
+    "segments": [
+        # Main St again at the match line, ends 20 m and 25 m off and drawn the other way
+        {"segment_id": "SEG-001", "street_name": "main st", "footage": 650,
+         "gps_start": _at(225), "gps_end": _at(20)},
+        {"segment_id": "SEG-002", "street_name": "Elm St", "footage": 80,
+         "gps_start": _at(200), "gps_end": _at(280)},
+        # Main St, but one end 40 m off: a different segment
+        {"segment_id": "SEG-003", "street_name": "Main St", "footage": 640,
+         "gps_start": _at(0, 40), "gps_end": _at(200)},
+    ],
+    "structures": [
+        {"id": "HH-1", "type": "handhole", "segment_id": "SEG-001", "gps": _at(210)},  # HH-2 of sheet 1
+        {"id": "HH-2", "type": "handhole", "segment_id": "SEG-002", "gps": _at(20)},  # 20 m from HH-1
+        {"id": "FP-1", "type": "flowerpot", "segment_id": "SEG-002", "gps": A},  # other type, same spot
+    ],
+    "splice_points": [{"splice_id": "SP-1", "splice_type": "splice_case", "handhole_id": "HH-1",
+                       "segment_id": "SEG-001", "gps": _at(205)}],
+    "line_items": [
+        {"code": "UG1", "uom": "LF", "quantity": 950},
+        {"code": "UG1", "uom": "LF", "quantity": 110, "segment_id": "SEG-001"},
+        {"code": "UG10", "uom": "EA", "quantity": 1, "structure_id": "HH-1"},
+        {"code": "UG1", "uom": "LF", "quantity": 80, "segment_id": "SEG-002"},
+        {"code": "UG10", "uom": "EA", "quantity": 1, "structure_id": "HH-2"},
+    ],
+    "reconciliation": {"notes": ["sheet 2 note"], "unmatched_items": ["PP1", "PP2"]},
+}
+
+
+class MergeSheetResultsTest(unittest.TestCase):
+    def setUp(self):
+        # Page order, not dict order, decides the numbering
+        self.merged = merge_sheet_results({2: SHEET_2, 1: SHEET_1})
+
+    def test_duplicates_across_sheets_are_kept_once(self):
+        merged = self.merged
+        self.assertEqual([(s["segment_id"], s["street_name"]) for s in merged["segments"]],
+                         [("SEG-001", "Main St"), ("SEG-002", "Oak Ave"), ("SEG-003", "Elm St"),
+                          ("SEG-004", "Main St")])
+        self.assertEqual([(s["id"], s["gps"]) for s in merged["structures"]],
+                         [("HH-001", A), ("HH-002", B), ("HH-003", _at(20)), ("FP-001", A)])
+        self.assertEqual([s["splice_id"] for s in merged["splice_points"]], ["SP-001"])
+
+    def test_references_follow_the_renumbering(self):
+        merged = self.merged
+        self.assertEqual([s["segment_id"] for s in merged["structures"]],
+                         ["SEG-001", "SEG-001", "SEG-003", "SEG-003"])
+        self.assertEqual(merged["splice_points"][0]["handhole_id"], "HH-002")
+        self.assertEqual(merged["splice_points"][0]["segment_id"], "SEG-001")
+
+    def test_line_items(self):
+        self.assertEqual(self.merged["line_items"], [
+            # Work order items from the first sheet only
+            {"code": "UG1", "uom": "LF", "quantity": 950},
+            # Same sheet: parts of the work add up; the overlap on sheet 2 (110) is the same work
+            {"code": "UG1", "uom": "LF", "quantity": 120, "segment_id": "SEG-001"},
+            {"code": "UG10", "uom": "EA", "quantity": 1, "structure_id": "HH-002"},
+            {"code": "UG1", "uom": "LF", "quantity": 80, "segment_id": "SEG-003"},
+            {"code": "UG10", "uom": "EA", "quantity": 1, "structure_id": "HH-003"},
+        ])
+
+    def test_project_and_reconciliation(self):
+        merged = self.merged
+        self.assertEqual(merged["project"], {"name": "Test", "work_order_number": "WO-1", "contractor": "LYT"})
+        recon = merged["reconciliation"]
+        self.assertEqual(recon["total_footage"], 650 + 300 + 80 + 640)
+        self.assertEqual(recon["total_line_items"], 5)
+        self.assertEqual(recon["unmatched_items"], ["PP1", "PP2"])
+        self.assertEqual(recon["notes"], [
+            "Merged 2 map sheets extracted separately; duplicates removed: 1 segments, 1 structures, "
+            "1 splice points, 4 line items",
+            "Sheet 1: sheet 1 note",
+            "Sheet 2: sheet 2 note",
+        ])
+
+    def test_inputs_are_not_modified(self):
+        self.assertEqual(SHEET_2["structures"][0]["id"], "HH-1")
+        self.assertEqual(SHEET_1["line_items"][1]["quantity"], 100)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,108 @@
+"""
+Tiered extraction linking: work order line items split into rows per
+segment / structure / splice the map stage linked them to (by item
+number, else by code), with the unlinked remainder kept and bad links
+noted, and merge_tiered() combining both stages.
+"""
+
+import sys
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from tiered import link_line_items, merge_tiered  # noqa: E402
+
+ITEMS = [
+    {"code": "UG1", "description": "Bore 1-2in duct", "uom": "LF", "quantity": 500},
+    {"code": "UG10", "description": "Handhole 17x30", "uom": "EA", "quantity": 3},
+    {"code": "UG1", "description": "Bore 1-2in duct (rock)", "uom": "LF", "quantity": 80},
+    {"code": "PP1", "description": "Permit", "uom": "EA", "quantity": 1},
+]
+
+
+class LinkLineItemsTest(unittest.TestCase):
+    def test_links_by_item_number_with_remainder(self):
+        rows, notes = link_line_items(ITEMS, [
+            {"item": 1, "code": "UG1", "segment_id": "SEG-001", "quantity": 300},
+            {"item": 1, "code": "UG1", "segment_id": "SEG-002", "quantity": 150.5},
+            {"item": 3, "code": "UG1", "segment_id": "SEG-002", "quantity": 80},
+        ])
+        self.assertEqual(notes, [])
+        self.assertEqual(rows[:4], [
+            {**ITEMS[0], "segment_id": "SEG-001", "quantity": 300},
+            {**ITEMS[0], "segment_id": "SEG-002", "quantity": 150.5},
+            {**ITEMS[0], "quantity": 49.5},
+            {**ITEMS[1]},
+        ])
+        # Fully linked: no remainder row
+        self.assertEqual(rows[4:], [{**ITEMS[2], "segment_id": "SEG-002", "quantity": 80}, ITEMS[3]])
+        self.assertEqual(sum(r["quantity"] for r in rows if r["code"] == "UG1"), 580)
+
+    def test_links_by_code_when_the_item_number_is_off(self):
+        rows, notes = link_line_items(ITEMS, [
+            {"item": 9, "code": "UG10", "structure_id": "HH-001", "quantity": 1},
+            {"code": "UG10", "structure_id": "HH-002", "quantity": 2},
+            {"item": 2, "code": "PP1", "splice_id": "SP-001", "quantity": 1},  # item 2 isn't PP1
+        ])
+        self.assertEqual(notes, [])
+        self.assertEqual([(r["code"], r.get("structure_id"), r.get("splice_id"), r["quantity"]) for r in rows], [
+            ("UG1", None, None, 500),
+            ("UG10", "HH-001", None, 1),
+            ("UG10", "HH-002", None, 2),
+            ("UG1", None, None, 80),
+            ("PP1", None, "SP-001", 1),
+        ])
+
+    def test_bad_links_are_left_out_and_noted(self):
+        rows, notes = link_line_items(ITEMS, [
+            {"code": "UG1", "segment_id": "SEG-001", "quantity": 100},  # two UG1 items: ambiguous
+            {"item": 4, "code": "PP1", "quantity": 1},  # no map record
+            {"item": 4, "code": "PP1", "segment_id": "SEG-001", "quantity": 0},
+            "not a link",
+            {"item": 2, "code": "UG10", "structure_id": "HH-001", "quantity": 2},
+            {"item": 2, "code": "UG10", "structure_id": "HH-002", "quantity": 2},  # 4 > 3 billed
+        ])
+        self.assertEqual(rows, ITEMS)
+        self.assertEqual(notes, [
+            "3 map-stage links matched no work order item",
+            "Item 2 (UG10): map links total 4 but the work order bills 3; links not applied",
+        ])
+
+
+class MergeTieredTest(unittest.TestCase):
+    def test_merge(self):
+        work_order = {
+            "project": {"work_order_number": "WO-1", "name": ""},
+            "line_items": ITEMS[:2],
+            "unmatched_items": ["ZZ9", "PP2"],
+            "source": "local (words, min confidence 1.0)",
+        }
+        map_result = {
+            "project": {"name": "Main St", "work_order_number": "WO-?"},
+            "segments": [{"segment_id": "SEG-001", "footage": 500}],
+            "structures": [{"id": "HH-001"}],
+            "splice_points": [],
+            "line_items": [{"item": 1, "code": "UG1", "segment_id": "SEG-001", "quantity": 500},
+                           {"item": 7, "code": "AE1", "segment_id": "SEG-001", "quantity": 10}],
+            "reconciliation": {"notes": ["map note"], "unmatched_items": ["PP2"]},
+        }
+        result = merge_tiered(work_order, map_result)
+
+        self.assertEqual(result["project"], {"name": "Main St", "work_order_number": "WO-1"})
+        self.assertEqual(result["segments"], map_result["segments"])
+        self.assertEqual(result["line_items"], [{**ITEMS[0], "segment_id": "SEG-001"}, ITEMS[1]])
+        recon = result["reconciliation"]
+        self.assertEqual(recon["unmatched_items"], ["PP2", "ZZ9"])
+        self.assertEqual(recon["total_line_items"], 2)
+        self.assertEqual(recon["notes"], [
+            "map note",
+            "Line items read from the work order table: local (words, min confidence 1.0)",
+            "Tiered extraction: 1 map-stage links matched no work order item",
+        ])
+        # The map stage's own reconciliation is left as it was
+        self.assertEqual(map_result["reconciliation"]["notes"], ["map note"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,82 @@
+"""
+GPS validation against the project area: a --bbox / manifest bbox, the
+median-point fallback without one, and the bbox reaching validate()
+through batch.save_job_result().
+"""
+
+import csv
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import validation  # noqa: E402
+from batch import load_manifest, save_job_result  # noqa: E402
+
+# Downtown San Antonio, about 15 km across
+BBOX = (29.38, -98.56, 29.47, -98.45)
+
+
+def _extraction(*points: tuple[str, float, float]) -> dict:
+    return {"structures": [{"id": sid, "unit_code": "HH1", "gps": {"lat": lat, "lng": lng}}
+                           for sid, lat, lng in points]}
+
+
+def _outside(report: dict) -> list[str]:
+    return [sid for issue in report["warnings"] if issue["check"] == "gps_outside" for sid in issue["ids"]]
+
+
+@unittest.skipUnless(validation.available(), "NumPy not installed")
+class GpsAreaTest(unittest.TestCase):
+    def test_bbox_flags_points_outside_the_project(self):
+        # HH-3 is ~12 km north: inside GPS_RADIUS_KM of the median, outside the project
+        extracted = _extraction(("HH-1", 29.42, -98.49), ("HH-2", 29.43, -98.50), ("HH-3", 29.53, -98.49))
+        self.assertEqual(_outside(validation.validate(extracted, BBOX)), ["HH-3"])
+        self.assertEqual(_outside(validation.validate(extracted)), [])
+
+    def test_median_fallback_without_bbox(self):
+        # HH-4 is in Austin, ~110 km from the job's median point
+        extracted = _extraction(("HH-1", 29.42, -98.49), ("HH-2", 29.43, -98.50), ("HH-3", 29.44, -98.48),
+                                ("HH-4", 30.27, -97.74))
+        report = validation.validate(extracted)
+        self.assertEqual(_outside(report), ["HH-4"])
+        self.assertIn("median point", next(i for i in report["warnings"] if i["check"] == "gps_outside")["message"])
+
+    def test_save_job_result_validates_against_the_job_bbox(self):
+        extracted = _extraction(("HH-1", 29.42, -98.49), ("HH-2", 29.53, -98.49))
+        with tempfile.TemporaryDirectory() as tmp:
+            result = {}
+            save_job_result(extracted, {"name": "wo1", "bbox": BBOX}, result, Path(tmp), set())
+            self.assertEqual([i["ids"] for i in result["validation"]["warnings"] if i["check"] == "gps_outside"],
+                             [["HH-2"]])
+            result = {}
+            save_job_result(extracted, {"name": "wo2"}, result, Path(tmp), set())
+            self.assertFalse(any(i["check"] == "gps_outside" for i in result["validation"]["warnings"]))
+
+
+class ParseBboxTest(unittest.TestCase):
+    def test_parse(self):
+        self.assertEqual(validation.parse_bbox("29.38,-98.56, 29.47,-98.45"), BBOX)
+        self.assertEqual(validation.parse_bbox(list(BBOX)), BBOX)
+        self.assertIsNone(validation.parse_bbox(""))
+        self.assertIsNone(validation.parse_bbox(None))
+        for bad in ("29.38,-98.56,29.47", "a,b,c,d", "29.47,-98.56,29.38,-98.45", "29,-200,30,-98"):
+            with self.assertRaises(ValueError):
+                validation.parse_bbox(bad)
+
+    def test_manifest_bbox_column(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            manifest = Path(tmp) / "jobs.csv"
+            with open(manifest, "w", newline="") as f:
+                writer = csv.writer(f)
+                writer.writerow(["wo", "map", "bbox"])
+                writer.writerow(["a.pdf", "a_map.pdf", ",".join(map(str, BBOX))])
+                writer.writerow(["b.pdf", "", ""])
+            jobs = load_manifest(manifest)
+        self.assertEqual([job["bbox"] for job in jobs], [BBOX, None])
+
+
+if __name__ == "__main__":
+    unittest.main()
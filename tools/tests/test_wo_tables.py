@@ -0,0 +1,92 @@
+"""
+Local work order table reading: a clean line item table (with total,
+page and note lines around it) is read without an LLM, and a garbled
+one falls through to the cheap model in tiered.start_line_items().
+"""
+
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import fitz  # noqa: E402
+
+import tiered  # noqa: E402
+from wo_tables import CODE_LIKE, extract_line_item_table, is_clean  # noqa: E402
+
+COLUMNS = (72, 140, 380, 440)  # x of the Code, Description, UOM and Qty columns
+CLEAN_ROWS = [
+    ("UG1", "Directional bore 1-2in duct", "LF", "1,250"),
+    ("UG10", "Handhole 17x30", "EA", "4"),
+    ("AE31.1", "Aerial strand", "LF", "300"),
+]
+
+
+def _write_wo(path: Path, rows: list[tuple[str, ...]]):
+    doc = fitz.open()
+    page = doc.new_page()
+    page.insert_text((72, 60), "WORK ORDER WO-1", fontsize=14)
+    y = 110
+    for row in [("Code", "Description", "UOM", "Qty"), *rows]:
+        for x, text in zip(COLUMNS, row):
+            page.insert_text((x, y), text, fontsize=10)
+        y += 18
+    page.insert_text((72, y + 10), "TOTAL", fontsize=10)
+    page.insert_text((440, y + 10), "1,554", fontsize=10)
+    page.insert_text((72, y + 40), "NOTE", fontsize=10)
+    page.insert_text((140, y + 40), "Restore all sod within 10 days", fontsize=10)
+    page.insert_text((72, 760), "PAGE", fontsize=10)
+    page.insert_text((110, 760), "1 of 1", fontsize=10)
+    doc.save(path)
+    doc.close()
+
+
+class WoTableTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def wo(self, rows) -> str:
+        path = Path(self.tmp.name) / "wo.pdf"
+        _write_wo(path, rows)
+        return str(path)
+
+    def test_code_like(self):
+        for code in ("UG1", "FS05", "AE9L", "AE31.1", "XYZ123"):
+            self.assertTrue(CODE_LIKE.match(code), code)
+        for word in ("TOTAL", "PAGE", "NOTE", "LF", "EA", "SUBTOTAL", "1250"):
+            self.assertFalse(CODE_LIKE.match(word), word)
+
+    def test_clean_table_takes_the_local_path(self):
+        wo_path = self.wo(CLEAN_ROWS)
+        table = extract_line_item_table(wo_path)
+        self.assertTrue(is_clean(table), table["rows"])
+        self.assertEqual(table["line_items"], [
+            {"code": "UG1", "description": "Directional bore 1-2in duct", "uom": "LF", "quantity": 1250},
+            {"code": "UG10", "description": "Handhole 17x30", "uom": "EA", "quantity": 4},
+            {"code": "AE31.1", "description": "Aerial strand", "uom": "LF", "quantity": 300},
+        ])
+
+        with mock.patch("tiered.extract_line_items") as llm:
+            result = tiered.start_line_items("WORK ORDER WO-1", "test-key", wo_path=wo_path).result()
+        llm.assert_not_called()
+        self.assertTrue(result["source"].startswith("local"))
+        self.assertEqual(result["line_items"], table["line_items"])
+
+    def test_garbled_table_falls_through_to_the_llm(self):
+        # An unknown code and a quantity that isn't a number
+        wo_path = self.wo([CLEAN_ROWS[0], ("UG9Q", "Bore ?? duct", "LF", "1,2S0"), CLEAN_ROWS[1]])
+        self.assertFalse(is_clean(extract_line_item_table(wo_path)))
+
+        llm_result = {"project": {}, "line_items": [], "unmatched_items": []}
+        with mock.patch("tiered.extract_line_items", return_value=llm_result) as llm:
+            result = tiered.start_line_items("WORK ORDER WO-1", "test-key", wo_path=wo_path).result()
+        llm.assert_called_once()
+        self.assertIs(result, llm_result)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,297 @@
+"""
+LYT Communications - Tiered Extraction
+Splits an extraction into two stages so Opus only does the part that needs
+it:
+
+1. Work order stage: the WO table is read locally from the PDF layout
+   (wo_tables.py); only when a row isn't confidently matched to the rate
+   card does a fast, cheap model copy the table into project details and
+   line_items (validated against the rate card).
+2. Map stage: Opus reads the map tiles with those line items as context
+   instead of the raw WO text, and returns segments, structures, splice
+   points and reconciliation. Instead of line items it returns only links
+   (item number -> segment / structure / splice point and the quantity on
+   it), which merge_tiered() turns into linked rows of the WO items.
+
+The work order stage starts as soon as the WO text is available and runs
+while the map is being rendered, so it is usually finished before Opus is
+called. Opus output (and so latency) shrinks by the whole line item table.
+
+Usage:
+    python extract_workorder.py --wo WO.pdf --map MAP.pdf --tiered
+    python extract_workorder.py batch path/to/folder --tiered
+"""
+
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from claude_client import (
+    RATE_CARD,
+    _parse_json_response,
+    extract_with_claude,
+    shared_client,
+    unit_codes,
+    usage_stats,
+)
+from metrics import bind
+from scheduler import call_with_retries, estimate_input_tokens
+
+LINE_ITEM_MODEL = "claude-haiku-4-5"
+LINE_ITEM_MAX_TOKENS = 16000
+LINK_KEYS = ("segment_id", "structure_id", "splice_id")
+
+
+def build_line_item_prompt(wo_text: str) -> str:
+    """User prompt for the work order stage: rate card, output shape, WO text."""
+    return f"""Copy the billing line items and project details from this work order.
+
+{RATE_CARD}
+
+OUTPUT - a single JSON object, nothing else:
+{{
+  "project": {{
+    "name": "[Work order name/number - Location]",
+    "work_order_number": "[WO number from document]",
+    "client": "Vexus",
+    "region": "[LA or TX]",
+    "rate_card": "vexus-la-tx-2026",
+    "location": "[City, State]",
+    "date_received": "[Date from WO or today's date]"
+  }},
+  "line_items": [
+    {{ "code": "[unit code]", "description": "[description]", "uom": "[LF, EA, SF, CF, HR, Span]", "quantity": 0 }}
+  ],
+  "unmatched_items": ["[WO items that don't match a unit code above]"]
+}}
+
+RULES:
+1. Copy EVERY line item in the work order table, with quantities exactly as printed
+2. Use EXACT unit codes from the list above - do not invent codes
+3. Items you cannot match to a code go in unmatched_items, not line_items
+
+========================================
+WORK ORDER TEXT:
+========================================
+{wo_text}
+========================================"""
+
+
+def build_line_item_request(wo_text: str) -> dict:
+    return {
+        "model": LINE_ITEM_MODEL,
+        "max_tokens": LINE_ITEM_MAX_TOKENS,
+        "system": "You copy work order line items into JSON exactly. Output ONLY valid JSON.",
+        "messages": [{"role": "user", "content": build_line_item_prompt(wo_text)}],
+    }
+
+
+def validate_line_items(work_order: dict) -> dict:
+    """
+    Keep only line items with a rate card code (filling a missing UOM from
+    the card); anything else moves to unmatched_items.
+    """
+    codes = unit_codes()
+    items = []
+    unmatched = list(work_order.get("unmatched_items") or [])
+    for item in work_order.get("line_items") or []:
+        if not isinstance(item, dict):
+            continue
+        code = str(item.get("code") or "").strip().upper()
+        if code not in codes:
+            unmatched.append(f"{item.get('code', '')} {item.get('description', '')} "
+                             f"({item.get('quantity', '')} {item.get('uom', '')})".strip())
+            continue
+        items.append({**item, "code": code, "uom": item.get("uom") or codes[code]})
+    return {"project": work_order.get("project") or {}, "line_items": items,
+            "unmatched_items": unmatched}
+
+
+def extract_line_items(wo_text: str, api_key: str, usage: dict | None = None) -> dict:
+    """
+    Work order stage: { 'project', 'line_items', 'unmatched_items' } from
+    the cheap model. Token counts go into usage as line_item_* keys.
+    Raises ValueError if the response isn't parseable JSON.
+    """
+    client = shared_client(api_key)
+    request = build_line_item_request(wo_text)
+    message = call_with_retries(
+        LINE_ITEM_MODEL, lambda: client.messages.with_raw_response.create(**request),
+        estimate_input_tokens(request), LINE_ITEM_MAX_TOKENS // 4, label="Work order stage",
+    )
+    if usage is not None:
+        for key, value in usage_stats(message.usage).items():
+            usage[f"line_item_{key}"] = usage.get(f"line_item_{key}", 0) + value
+
+    raw_text = "".join(block.text for block in message.content if block.type == "text")
+    parsed = _parse_json_response(raw_text)
+    if not isinstance(parsed, dict):
+        raise ValueError(f"Could not parse line item response as JSON. Raw preview: {raw_text[:300]}")
+    return validate_line_items(parsed)
+
+
+def local_line_items(wo_path: str) -> dict | None:
+    """
+    Work order stage without an LLM: the WO table read from the PDF layout,
+    if every row is confidently matched to the rate card. Project details
+    are left for the map stage to fill in. None when the table isn't clean.
+    """
+    from wo_tables import extract_line_item_table, is_clean
+
+    try:
+        table = extract_line_item_table(wo_path)
+    except Exception as e:
+        print(f"  WARNING: Local WO table extraction failed ({e})")
+        return None
+    if not is_clean(table):
+        return None
+    return {"project": {}, "line_items": table["line_items"], "unmatched_items": [],
+            "source": f"local ({table['method']}, min confidence {table['confidence']})"}
+
+
+def start_line_items(wo_text: str, api_key: str, usage: dict | None = None,
+                     wo_path: str | None = None) -> Future:
+    """
+    Run the work order stage in the background (e.g. while the map
+    renders). With wo_path, a clean locally-read WO table is used and the
+    cheap model is skipped.
+    """
+    local = local_line_items(wo_path) if wo_path else None
+    if local is not None:
+        future = Future()
+        future.set_result(local)
+        return future
+    pool = ThreadPoolExecutor(max_workers=1)
+    future = pool.submit(bind(extract_line_items), wo_text, api_key, usage)
+    pool.shutdown(wait=False)
+    return future
+
+
+def _quantity(value) -> float | None:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _number(value: float):
+    return int(value) if value == int(value) else round(value, 2)
+
+
+def _link_index(link: dict, items: list) -> int | None:
+    """WO item a map-stage link refers to: its item number, else its code if only one item has it."""
+    code = str(link.get("code") or "").strip().upper()
+    try:
+        index = int(link.get("item")) - 1
+    except (TypeError, ValueError):
+        index = -1
+    if 0 <= index < len(items) and (not code or str(items[index].get("code")).upper() == code):
+        return index
+    matches = [i for i, item in enumerate(items) if str(item.get("code")).upper() == code]
+    return matches[0] if len(matches) == 1 else None
+
+
+def link_line_items(items: list, links: list) -> tuple[list, list[str]]:
+    """
+    Split each WO line item into rows per map record it is linked to (the
+    link's quantity), plus an unlinked row for any quantity left over, so
+    the item's total stays the WO quantity. Links that don't match an
+    item, or add up to more than the item's quantity, are left out and
+    noted. Returns (line items, notes).
+    """
+    by_item = {}
+    unmatched = 0
+    for link in links:
+        if not isinstance(link, dict):
+            continue
+        index = _link_index(link, items)
+        quantity = _quantity(link.get("quantity"))
+        refs = {key: link[key] for key in LINK_KEYS if link.get(key)}
+        if index is None or quantity is None or quantity <= 0 or not refs:
+            unmatched += 1
+            continue
+        by_item.setdefault(index, []).append((refs, quantity))
+
+    rows = []
+    notes = [f"{unmatched} map-stage links matched no work order item"] if unmatched else []
+    for index, item in enumerate(items):
+        links = by_item.get(index)
+        total = _quantity(item.get("quantity"))
+        linked = sum(quantity for _, quantity in links) if links else 0.0
+        if not links or total is None or linked > total * 1.0001:
+            if links:
+                notes.append(f"Item {index + 1} ({item.get('code')}): map links total {_number(linked)} "
+                             f"but the work order bills {item.get('quantity')}; links not applied")
+            rows.append(dict(item))
+            continue
+        rows.extend({**item, **refs, "quantity": _number(quantity)} for refs, quantity in links)
+        if total - linked > total * 0.0001:
+            rows.append({**item, "quantity": _number(total - linked)})
+    return rows, notes
+
+
+def merge_tiered(work_order: dict, map_result: dict) -> dict:
+    """Combine the work order stage with the map stage (and its links) into one extraction."""
+    result = dict(map_result)
+    project = dict(map_result.get("project") or {})
+    project.update({k: v for k, v in work_order["project"].items() if v})
+    result["project"] = project
+    result["line_items"], link_notes = link_line_items(work_order["line_items"],
+                                                       map_result.get("line_items") or [])
+
+    recon = dict(map_result.get("reconciliation") or {})
+    if work_order.get("source"):
+        recon["notes"] = list(recon.get("notes") or []) + [
+            f"Line items read from the work order table: {work_order['source']}"
+        ]
+    unmatched = list(recon.get("unmatched_items") or [])
+    unmatched += [entry for entry in work_order["unmatched_items"] if entry not in unmatched]
+    recon["unmatched_items"] = unmatched
+    recon["total_line_items"] = len(result["line_items"])
+    if link_notes:
+        recon["notes"] = list(recon.get("notes") or []) + [f"Tiered extraction: {note}" for note in link_notes]
+    result["reconciliation"] = recon
+    return result
+
+
+def extract_tiered(
+    wo_text: str,
+    map_text: str,
+    map_tiles: list,
+    api_key: str,
+    verbose: bool = True,
+    usage: dict | None = None,
+    work_order: Future | dict | None = None,
+    wo_path: str | None = None,
+) -> dict:
+    """
+    Two-stage extraction. work_order is the work order stage's result, or
+    the Future from start_line_items() when it was started earlier; it is
+    started here if None (reading the WO table locally first when wo_path
+    is given). If that stage fails, falls back to a normal
+    single Opus extraction.
+    """
+    if work_order is None:
+        work_order = start_line_items(wo_text, api_key, usage, wo_path)
+    try:
+        if isinstance(work_order, Future):
+            work_order = work_order.result()
+    except Exception as e:
+        print(f"  WARNING: Work order stage failed ({e}) — falling back to full Opus extraction")
+        return extract_with_claude(wo_text, map_text, map_tiles, api_key, verbose=verbose, usage=usage)
+
+    if verbose:
+        print(f"  Work order stage ({work_order.get('source', LINE_ITEM_MODEL)}): "
+              f"{len(work_order['line_items'])} line items, {len(work_order['unmatched_items'])} unmatched")
+
+    if not map_tiles and not map_text:
+        if not work_order["project"]:
+            # No map stage to fill in project details for a locally read table
+            work_order = {**work_order, "project": extract_line_items(wo_text, api_key, usage)["project"]}
+        empty = {"segments": [], "structures": [], "splice_points": [], "reconciliation": {}}
+        return merge_tiered(work_order, empty)
+
+    map_usage = {}
+    map_result = extract_with_claude(wo_text, map_text, map_tiles, api_key, verbose=verbose,
+                                     usage=map_usage, work_order=work_order)
+    if usage is not None:
+        usage.update(map_usage)
+    return merge_tiered(work_order, map_result)
@@ -0,0 +1,374 @@
+"""
+LYT Communications - Extraction Validation
+Checks the model's JSON before it goes into the sheets (JSON Import ->
+importProjectFromExtraction), so bad footage or codes are caught while
+they are still cheap to fix:
+
+- unit codes and units of measure against the rate card (claude_client.RATE_CARD)
+- segment footage per code against the billed LF quantity of the line
+  items linked to those segments, and structure / splice counts per code
+  against EA quantities
+- missing, non-numeric or negative quantities and footage
+- duplicate IDs, and segment / structure / splice references that point
+  at nothing
+- GPS points that are missing, impossible, or outside the project area
+
+Records are loaded into NumPy columns once and every check is a handful
+of array operations, so thousand-record jobs validate in milliseconds.
+NumPy is optional: without it validate() returns None and callers report
+validation as skipped.
+
+    report = validate(extracted, bbox=parse_bbox("29.41,-98.62,29.52,-98.43"))
+    report["errors"], report["warnings"]  # [{"check", "message", "ids"}]
+
+The project area comes from --bbox min_lat,min_lng,max_lat,max_lng (or a
+bbox column in a batch manifest); without one, points are checked against
+GPS_RADIUS_KM around the job's median point.
+"""
+
+import math
+import time
+
+try:
+    import numpy as np
+except ImportError:  # optional: validation is skipped without it
+    np = None
+
+from claude_client import unit_codes
+
+FOOTAGE_TOLERANCE = 0.05  # linked segment footage may differ from billed LF by this share...
+FOOTAGE_TOLERANCE_LF = 10.0  # ...or by this many feet, whichever is larger
+GPS_RADIUS_KM = 30.0  # without a bounding box: points this far from the job's median point
+MAX_LISTED_IDS = 8  # IDs quoted in one issue message
+
+
+def available() -> bool:
+    return np is not None
+
+
+def parse_bbox(value) -> tuple[float, float, float, float] | None:
+    """
+    (min_lat, min_lng, max_lat, max_lng) from "min_lat,min_lng,max_lat,max_lng"
+    or a 4-item list; None for an empty value. Raises ValueError otherwise.
+    """
+    if value is None or (isinstance(value, str) and not value.strip()):
+        return None
+    parts = value.split(",") if isinstance(value, str) else list(value)
+    try:
+        bbox = tuple(float(part) for part in parts)
+    except (TypeError, ValueError):
+        raise ValueError(f"bbox must be min_lat,min_lng,max_lat,max_lng numbers, got {value!r}") from None
+    if len(bbox) != 4:
+        raise ValueError(f"bbox needs 4 numbers (min_lat,min_lng,max_lat,max_lng), got {len(bbox)}")
+    min_lat, min_lng, max_lat, max_lng = bbox
+    if not (-90 <= min_lat < max_lat <= 90 and -180 <= min_lng < max_lng <= 180):
+        raise ValueError(f"bbox {value!r} is not min_lat,min_lng,max_lat,max_lng with min < max")
+    return bbox
+
+
+def _records(extracted: dict, key: str) -> list[dict]:
+    return [r for r in extracted.get(key) or [] if isinstance(r, dict)]
+
+
+def _text(records: list[dict], key: str, upper: bool = False) -> "np.ndarray":
+    values = [str(r.get(key) or "").strip() for r in records]
+    return np.array([v.upper() for v in values] if upper else values, dtype=str)
+
+
+def _number(value) -> float:
+    if isinstance(value, bool):
+        return math.nan
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, str):
+        try:
+            return float(value.replace(",", "").strip())
+        except ValueError:
+            pass
+    return math.nan
+
+
+def _numbers(records: list[dict], key: str) -> "np.ndarray":
+    return np.array([_number(r.get(key)) for r in records], dtype=float)
+
+
+def _gps(records: list[dict], key: str) -> tuple["np.ndarray", "np.ndarray"]:
+    points = [r.get(key) if isinstance(r.get(key), dict) else {} for r in records]
+    return (np.array([_number(p.get("lat")) for p in points], dtype=float),
+            np.array([_number(p.get("lng")) for p in points], dtype=float))
+
+
+def load_columns(extracted: dict) -> dict[str, dict[str, "np.ndarray"]]:
+    """The extraction's records as columns: {table: {field: array}}."""
+    segments = _records(extracted, "segments")
+    structures = _records(extracted, "structures")
+    splices = _records(extracted, "splice_points")
+    items = _records(extracted, "line_items")
+    seg_lat, seg_lng = _gps(segments, "gps_start")
+    seg_lat_end, seg_lng_end = _gps(segments, "gps_end")
+    st_lat, st_lng = _gps(structures, "gps")
+    sp_lat, sp_lng = _gps(splices, "gps")
+    return {
+        "segments": {"id": _text(segments, "segment_id"), "footage": _numbers(segments, "footage"),
+                     "lat": seg_lat, "lng": seg_lng, "lat_end": seg_lat_end, "lng_end": seg_lng_end},
+        "structures": {"id": _text(structures, "id"), "code": _text(structures, "unit_code", upper=True),
+                       "segment_id": _text(structures, "segment_id"), "lat": st_lat, "lng": st_lng},
+        "splice_points": {"id": _text(splices, "splice_id"), "code": _text(splices, "unit_code", upper=True),
+                          "segment_id": _text(splices, "segment_id"),
+                          "handhole_id": _text(splices, "handhole_id"), "lat": sp_lat, "lng": sp_lng},
+        "line_items": {"code": _text(items, "code", upper=True), "uom": _text(items, "uom", upper=True),
+                       "quantity": _numbers(items, "quantity"),
+                       "segment_id": _text(items, "segment_id"),
+                       "structure_id": _text(items, "structure_id"),
+                       "splice_id": _text(items, "splice_id")},
+    }
+
+
+def _listed(values) -> str:
+    values = [str(v) for v in values]
+    more = len(values) - MAX_LISTED_IDS
+    return ", ".join(values[:MAX_LISTED_IDS]) + (f" (+{more} more)" if more > 0 else "")
+
+
+def _sum_by(keys: "np.ndarray", weights: "np.ndarray") -> dict[str, float]:
+    """Sum weights per distinct key (NaN weights count as 0)."""
+    if not len(keys):
+        return {}
+    unique, inverse = np.unique(keys, return_inverse=True)
+    sums = np.bincount(inverse, weights=np.nan_to_num(weights), minlength=len(unique))
+    return dict(zip(unique.tolist(), sums.tolist()))
+
+
+def _count_by(keys: "np.ndarray") -> dict[str, int]:
+    unique, counts = np.unique(keys, return_counts=True)
+    return dict(zip(unique.tolist(), counts.tolist()))
+
+
+class _Report:
+    def __init__(self):
+        self.errors = []
+        self.warnings = []
+
+    def error(self, check: str, message: str, ids=()):
+        self.errors.append({"check": check, "message": message, "ids": [str(i) for i in ids]})
+
+    def warning(self, check: str, message: str, ids=()):
+        self.warnings.append({"check": check, "message": message, "ids": [str(i) for i in ids]})
+
+
+def _check_codes(cols: dict, codes: dict[str, str], report: _Report):
+    items = cols["line_items"]
+    known = np.array(sorted(codes), dtype=str)
+
+    missing = items["code"] == ""
+    if missing.any():
+        report.error("missing_code", f"{int(missing.sum())} line item(s) have no unit code")
+    unknown = ~missing & ~np.isin(items["code"], known)
+    if unknown.any():
+        bad = np.unique(items["code"][unknown])
+        report.error("unknown_code", f"{int(unknown.sum())} line item(s) use codes not on the rate card: "
+                     f"{_listed(bad)}", bad)
+
+    # Unit of measure must be the rate card's for the code
+    if len(items["code"]):
+        unique, inverse = np.unique(items["code"], return_inverse=True)
+        expected = np.array([codes.get(c, "").upper() for c in unique.tolist()], dtype=str)[inverse]
+        wrong = (expected != "") & (items["uom"] != "") & (items["uom"] != expected)
+        if wrong.any():
+            pairs = sorted({f"{c} as {u} (rate card {e})" for c, u, e in
+                            zip(items["code"][wrong], items["uom"][wrong], expected[wrong])})
+            report.warning("uom", f"{int(wrong.sum())} line item(s) have the wrong unit: {_listed(pairs)}",
+                           np.unique(items["code"][wrong]))
+
+    for table, label in (("structures", "structure"), ("splice_points", "splice point")):
+        code = cols[table]["code"]
+        unknown = (code != "") & ~np.isin(code, known)
+        if unknown.any():
+            report.error("unknown_code", f"{int(unknown.sum())} {label}(s) use codes not on the rate card: "
+                         f"{_listed(np.unique(code[unknown]))}", cols[table]["id"][unknown])
+
+
+def _check_numbers(cols: dict, report: _Report):
+    items = cols["line_items"]
+    quantity = items["quantity"]
+    bad = np.isnan(quantity) | (quantity <= 0)
+    if bad.any():
+        report.error("quantity", f"{int(bad.sum())} line item(s) have a missing, non-numeric or non-positive "
+                     f"quantity: {_listed(np.unique(items['code'][bad]))}", np.unique(items["code"][bad]))
+
+    segments = cols["segments"]
+    footage = segments["footage"]
+    bad = np.isnan(footage) | (footage < 0)
+    if bad.any():
+        report.error("footage", f"{int(bad.sum())} segment(s) have missing, non-numeric or negative footage: "
+                     f"{_listed(segments['id'][bad])}", segments["id"][bad])
+    zero = footage == 0
+    if zero.any():
+        report.warning("footage", f"{int(zero.sum())} segment(s) have 0 footage: {_listed(segments['id'][zero])}",
+                       segments["id"][zero])
+
+
+def _check_footage(cols: dict, codes: dict[str, str], extracted: dict, report: _Report):
+    """Billed LF per code vs the footage of the segments its line items link to."""
+    items = cols["line_items"]
+    segments = cols["segments"]
+    lf_codes = np.array([c for c, uom in codes.items() if uom.upper() == "LF"], dtype=str)
+    linked = np.isin(items["code"], lf_codes) & (items["segment_id"] != "")
+    if linked.any() and len(segments["id"]):
+        order = np.argsort(segments["id"], kind="stable")
+        sorted_ids = segments["id"][order]
+        # Each (code, segment) pair once, so a segment billed in several rows counts once
+        pairs = np.unique(np.char.add(np.char.add(items["code"][linked], "\x1f"), items["segment_id"][linked]))
+        pair_code, _, pair_segment = np.char.partition(pairs, "\x1f").T
+        position = np.clip(np.searchsorted(sorted_ids, pair_segment), 0, len(sorted_ids) - 1)
+        found = sorted_ids[position] == pair_segment
+        footage = np.where(found, np.nan_to_num(segments["footage"][order][position]), 0.0)
+        on_map = _sum_by(pair_code, footage)
+        billed = _sum_by(items["code"][linked], items["quantity"][linked])
+        for code in sorted(billed):
+            diff = abs(billed[code] - on_map.get(code, 0.0))
+            if diff > max(FOOTAGE_TOLERANCE * billed[code], FOOTAGE_TOLERANCE_LF):
+                report.warning("footage", f"{code}: {billed[code]:,.0f} LF billed vs "
+                               f"{on_map.get(code, 0.0):,.0f} LF on its linked segments", [code])
+
+    total = np.nansum(segments["footage"]) if len(segments["footage"]) else 0.0
+    stated = _number((extracted.get("reconciliation") or {}).get("total_footage"))
+    if stated and not math.isnan(stated) and abs(stated - total) > max(FOOTAGE_TOLERANCE * stated,
+                                                                       FOOTAGE_TOLERANCE_LF):
+        report.warning("total_footage", f"reconciliation.total_footage is {stated:,.0f} LF but segments "
+                       f"add up to {total:,.0f} LF")
+
+
+def _check_counts(cols: dict, codes: dict[str, str], report: _Report):
+    """Structures / splice points per EA code vs the line items' quantity for that code."""
+    items = cols["line_items"]
+    placed = _count_by(np.concatenate([cols["structures"]["code"], cols["splice_points"]["code"]]))
+    ea = np.isin(items["code"], np.array([c for c, uom in codes.items() if uom.upper() == "EA"], dtype=str))
+    billed = _sum_by(items["code"][ea], items["quantity"][ea])
+    for code in sorted(set(placed) & set(billed)):
+        if code and round(billed[code]) != placed[code]:
+            report.warning("count", f"{code}: {billed[code]:,.0f} EA billed vs {placed[code]} placed on the map",
+                           [code])
+
+
+def _check_ids(cols: dict, report: _Report):
+    for table, label in (("segments", "segment"), ("structures", "structure"), ("splice_points", "splice point")):
+        ids = cols[table]["id"]
+        missing = ids == ""
+        if missing.any():
+            report.error("missing_id", f"{int(missing.sum())} {label}(s) have no ID")
+        unique, counts = np.unique(ids[~missing], return_counts=True)
+        dupes = unique[counts > 1]
+        if len(dupes):
+            report.error("duplicate_id", f"{len(dupes)} {label} ID(s) used more than once: {_listed(dupes)}",
+                         dupes)
+
+
+def _check_references(cols: dict, report: _Report):
+    targets = {"segments": cols["segments"]["id"], "structures": cols["structures"]["id"],
+               "splice_points": cols["splice_points"]["id"]}
+    references = (
+        ("structures", "segment_id", "segments"),
+        ("splice_points", "segment_id", "segments"),
+        ("splice_points", "handhole_id", "structures"),
+        ("line_items", "segment_id", "segments"),
+        ("line_items", "structure_id", "structures"),
+        ("line_items", "splice_id", "splice_points"),
+    )
+    for table, field, target in references:
+        refs = cols[table][field]
+        dangling = (refs != "") & ~np.isin(refs, targets[target])
+        if dangling.any():
+            missing = np.unique(refs[dangling])
+            report.error("dangling_reference", f"{int(dangling.sum())} {table}[].{field} value(s) not in "
+                         f"{target}: {_listed(missing)}", missing)
+
+
+def _check_gps(cols: dict, bbox: tuple[float, float, float, float] | None, report: _Report):
+    """bbox is (min_lat, min_lng, max_lat, max_lng); without one, the job's median point +- GPS_RADIUS_KM."""
+    segments = cols["segments"]
+    ids = np.concatenate([segments["id"], segments["id"], cols["structures"]["id"], cols["splice_points"]["id"]])
+    lat = np.concatenate([segments["lat"], segments["lat_end"], cols["structures"]["lat"],
+                          cols["splice_points"]["lat"]])
+    lng = np.concatenate([segments["lng"], segments["lng_end"], cols["structures"]["lng"],
+                          cols["splice_points"]["lng"]])
+    if not len(ids):
+        return
+
+    missing = np.isnan(lat) | np.isnan(lng) | ((lat == 0) & (lng == 0))
+    if missing.any():
+        report.warning("gps_missing", f"{int(missing.sum())} point(s) have no GPS (or 0, 0): "
+                       f"{_listed(np.unique(ids[missing]))}", np.unique(ids[missing]))
+    valid = ~missing
+    impossible = valid & ((np.abs(lat) > 90) | (np.abs(lng) > 180))
+    if impossible.any():
+        report.error("gps_invalid", f"{int(impossible.sum())} point(s) have impossible coordinates: "
+                     f"{_listed(np.unique(ids[impossible]))}", np.unique(ids[impossible]))
+    valid &= ~impossible
+    if not valid.any():
+        return
+
+    if bbox is not None:
+        min_lat, min_lng, max_lat, max_lng = bbox
+        outside = valid & ((lat < min_lat) | (lat > max_lat) | (lng < min_lng) | (lng > max_lng))
+        area = "the project bounding box"
+    else:
+        lat0, lng0 = np.median(lat[valid]), np.median(lng[valid])
+        # Equirectangular distance: plenty for tens of kilometres
+        dx = (lng - lng0) * 111.32 * math.cos(math.radians(lat0))
+        dy = (lat - lat0) * 110.57
+        outside = valid & (np.hypot(dx, dy) > GPS_RADIUS_KM)
+        area = f"{GPS_RADIUS_KM:.0f} km of the job's median point ({lat0:.5f}, {lng0:.5f})"
+    if outside.any():
+        report.warning("gps_outside", f"{int(outside.sum())} point(s) fall outside {area}: "
+                       f"{_listed(np.unique(ids[outside]))}", np.unique(ids[outside]))
+
+
+def validate(extracted: dict, bbox: tuple[float, float, float, float] | None = None) -> dict | None:
+    """
+    Validate an extraction. Returns {errors, warnings, totals, elapsed_ms},
+    or None when NumPy isn't installed. bbox is the project's
+    (min_lat, min_lng, max_lat, max_lng), if known.
+    """
+    if np is None:
+        return None
+    start = time.perf_counter()
+    codes = {code.upper(): uom for code, uom in unit_codes().items()}
+    cols = load_columns(extracted)
+    report = _Report()
+    _check_codes(cols, codes, report)
+    _check_numbers(cols, report)
+    _check_footage(cols, codes, extracted, report)
+    _check_counts(cols, codes, report)
+    _check_ids(cols, report)
+    _check_references(cols, report)
+    _check_gps(cols, bbox, report)
+    return {
+        "errors": report.errors,
+        "warnings": report.warnings,
+        "totals": {
+            "segments": len(cols["segments"]["id"]),
+            "structures": len(cols["structures"]["id"]),
+            "splice_points": len(cols["splice_points"]["id"]),
+            "line_items": len(cols["line_items"]["code"]),
+            "footage": float(np.nansum(cols["segments"]["footage"])) if len(cols["segments"]["id"]) else 0.0,
+        },
+        "elapsed_ms": round((time.perf_counter() - start) * 1000, 2),
+    }
+
+
+def print_report(report: dict | None):
+    """Print a validation report under the extraction summary."""
+    if report is None:
+        print("  Validation skipped (pip install numpy to check codes, footage, IDs and GPS)")
+        return
+    errors, warnings = report["errors"], report["warnings"]
+    if not errors and not warnings:
+        print(f"  Validation: no issues ({report['elapsed_ms']:.1f} ms)")
+        return
+    print(f"  Validation: {len(errors)} error(s), {len(warnings)} warning(s) ({report['elapsed_ms']:.1f} ms)")
+    for level, issues in (("ERROR", errors), ("WARN", warnings)):
+        for issue in issues:
+            print(f"    {level:5} {issue['check']}: {issue['message']}")
+    if errors:
+        print("  Fix the errors above before importing into the sheets.")
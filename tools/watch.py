@@ -0,0 +1,350 @@
+"""
+LYT Communications - Watch Folder Daemon
+Runs unattended: polls an inbox folder, pairs each dropped work order with
+its map (same rules as batch mode), and extracts the pairs in the
+background so nobody has to launch the tool and pick files.
+
+A file is only picked up once it has stopped changing for SETTLE_SECONDS
+(so half-copied PDFs are left alone). A work order waits up to
+PAIR_WAIT_SECONDS for its map to arrive, then runs on its own. Claimed
+files move to <inbox>/processing/ and then to done/ or failed/ (with a
+.error.txt note), so finished jobs never run twice; files a crash left in
+processing/ go back to the inbox at startup.
+
+Ctrl+C stops scanning and lets in-flight jobs finish (render processes
+ignore it, so a render under way isn't killed); jobs still queued are
+cancelled and their files go back to the inbox on the next start.
+
+Jobs share one render process pool and a bounded pool of extraction
+threads, the same pipeline as batch.py. Results and metrics.jsonl go to
+the output folder. Queue depth, in-flight jobs and throughput are written
+to <output>/watch_status.json after every change and are also served as
+JSON at http://127.0.0.1:<port>/status with --status-port.
+
+Usage:
+    python extract_workorder.py watch path/to/inbox
+    python extract_workorder.py watch path/to/inbox --jobs 2 --status-port 8765
+"""
+
+import argparse
+import json
+import shutil
+import signal
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+from batch import DEFAULT_API_JOBS, _call_claude, pair_files, prepare_job, save_job_result
+from cache import _atomic_write
+from extract_workorder import DEFAULT_RENDER_WORKERS, OUTPUT_DIR, load_api_key
+
+POLL_SECONDS = 5.0
+SETTLE_SECONDS = 5.0  # a file unchanged this long is fully copied
+PAIR_WAIT_SECONDS = 120.0  # how long a work order waits for its map
+STATUS_FILE = "watch_status.json"
+THROUGHPUT_WINDOW = 3600.0  # jobs/hour is measured over the last hour
+
+
+def _log(message: str):
+    print(f"[{datetime.now().strftime('%H:%M:%S')}] {message}", flush=True)
+
+
+def _ignore_sigint():
+    """Render pool initializer: Ctrl+C is handled by the watcher, not each child process."""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def _move(path: str | None, folder: Path) -> str | None:
+    """Move a file into folder (not overwriting an earlier one) and return its new path."""
+    if path is None:
+        return None
+    folder.mkdir(parents=True, exist_ok=True)
+    target = folder / Path(path).name
+    if target.exists():
+        target = folder / f"{target.stem}_{datetime.now().strftime('%Y%m%d_%H%M%S')}{target.suffix}"
+    shutil.move(path, target)
+    return str(target)
+
+
+class InboxWatcher:
+    """Polls one inbox folder and feeds settled WO / map pairs to the extraction pools."""
+
+    def __init__(self, inbox: Path, output_dir: Path, api_key: str, api_jobs: int = DEFAULT_API_JOBS,
+                 render_workers: int = DEFAULT_RENDER_WORKERS, adaptive: bool = False,
+                 per_sheet: bool = False, tiered: bool = False, pair_wait: float = PAIR_WAIT_SECONDS,
+                 settle: float = SETTLE_SECONDS, compact: bool = False,
+                 bbox: tuple[float, float, float, float] | None = None):
+        self.inbox = Path(inbox)
+        self.output_dir = Path(output_dir)
+        self.api_key = api_key
+        self.api_jobs = api_jobs
+        self.render_workers = render_workers
+        self.options = {"adaptive": adaptive, "per_sheet": per_sheet, "tiered": tiered, "compact": compact}
+        self.bbox = bbox  # project area for GPS validation
+        self.pair_wait = pair_wait
+        self.settle = settle
+
+        self._files = {}  # path -> (size, mtime, first seen unchanged)
+        self._waiting = {}  # name -> {'job', 'reason'} not yet submitted
+        self._queued = 0
+        self._in_flight = {}  # name -> {'stage', 'started'}
+        self._finished = []  # (time, seconds, status)
+        self._last_error = None
+        self._used_names = set()
+        self._lock = threading.Lock()
+        self._started = time.time()
+
+    # -- inbox scanning ----------------------------------------------------
+
+    def _settled_files(self, now: float) -> dict[Path, float]:
+        """PDFs in the inbox that stopped changing, with the time they settled."""
+        settled = {}
+        current = {}
+        for path in self.inbox.iterdir():
+            if not path.is_file() or path.suffix.lower() != ".pdf":
+                continue
+            try:
+                stat = path.stat()
+            except OSError:
+                continue  # moved or deleted mid-scan
+            size, mtime, since = self._files.get(path, (None, None, now))
+            if (size, mtime) != (stat.st_size, stat.st_mtime):
+                since = now
+            current[path] = (stat.st_size, stat.st_mtime, since)
+            if now - since >= self.settle and now - stat.st_mtime >= self.settle:
+                settled[path] = since
+        self._files = current
+        return settled
+
+    def scan(self) -> list[dict]:
+        """Jobs ready to run: paired, or a lone work order whose map didn't arrive in time."""
+        now = time.time()
+        settled = self._settled_files(now)
+        jobs, unpaired = pair_files(settled)
+
+        ready = []
+        waiting = {}
+        for job in jobs:
+            if job["map"] is None and now - settled[Path(job["wo"])] < self.pair_wait:
+                waiting[job["name"]] = {"job": job, "reason": "waiting for map"}
+                continue
+            ready.append(job)
+        for path in unpaired:
+            waiting[path.stem] = {"job": {"name": path.stem, "wo": None, "map": str(path)},
+                                  "reason": "map without a work order"}
+        for path in set(self._files) - set(settled):
+            waiting[path.stem] = {"job": {"name": path.stem, "wo": str(path), "map": None},
+                                  "reason": "still being copied"}
+
+        with self._lock:
+            for name in waiting.keys() - self._waiting.keys():
+                if waiting[name]["reason"] != "still being copied":
+                    _log(f"Waiting: {name} ({waiting[name]['reason']})")
+            self._waiting = waiting
+        return ready
+
+    # -- jobs --------------------------------------------------------------
+
+    def claim(self, job: dict) -> dict:
+        """Move a job's files out of the inbox so no later scan sees them."""
+        processing = self.inbox / "processing"
+        return {**job, "wo": _move(job["wo"], processing), "map": _move(job["map"], processing)}
+
+    def run_job(self, job: dict, render_pool: ProcessPoolExecutor):
+        """Render and extract one job, then file its PDFs under done/ or failed/."""
+        name = job["name"]
+        start = time.time()
+        with self._lock:
+            self._queued -= 1
+            self._in_flight[name] = {"stage": "render", "started": start}
+        self.write_status()
+
+        job = {**job, "bbox": self.bbox}
+        result = {**job, "status": "pending", "output": None, "error": None}
+        job_metrics = None
+        error = None
+        try:
+            options = self.options
+            prepared = render_pool.submit(prepare_job, job["wo"], job["map"], options["adaptive"],
+                                          options["per_sheet"], options["tiered"], options["compact"]).result()
+            prepared["usage"] = {}
+            job_metrics = prepared["metrics"]
+            with self._lock:
+                self._in_flight[name]["stage"] = "extract"
+            self.write_status()
+
+            extracted = _call_claude(prepared, self.api_key)
+            with self._lock:
+                output_file = save_job_result(extracted, job, result, self.output_dir, self._used_names)
+            job_metrics.write(self.output_dir, status="ok", output=str(output_file), source="watch")
+            status = "ok"
+            _log(f"OK {name} -> {output_file.name} ({time.time() - start:.0f}s)")
+        except Exception as e:
+            status = "failed"
+            error = f"{name}: {e}"
+            if job_metrics is not None:
+                job_metrics.write(self.output_dir, status="failed", error=str(e), source="watch")
+            with self._lock:
+                self._last_error = error
+            _log(f"FAILED {name}: {e}")
+
+        folder = self.inbox / ("done" if status == "ok" else "failed")
+        _move(job["wo"], folder)
+        _move(job["map"], folder)
+        if status == "failed":
+            (folder / f"{name}.error.txt").write_text(f"{datetime.now().isoformat()}\n{error}\n",
+                                                      encoding="utf-8")
+        with self._lock:
+            del self._in_flight[name]
+            self._finished.append((time.time(), time.time() - start, status))
+        self.write_status()
+
+    # -- status ------------------------------------------------------------
+
+    def status(self) -> dict:
+        now = time.time()
+        with self._lock:
+            finished = list(self._finished)
+            recent = [f for f in finished if now - f[0] <= THROUGHPUT_WINDOW]
+            ok = [f for f in finished if f[2] == "ok"]
+            return {
+                "updated": datetime.now().isoformat(timespec="seconds"),
+                "inbox": str(self.inbox),
+                "uptime_seconds": round(now - self._started),
+                "queue_depth": len(self._waiting) + self._queued,
+                "queued": self._queued,
+                "waiting": {name: w["reason"] for name, w in sorted(self._waiting.items())},
+                "in_flight": {name: {"stage": job["stage"], "seconds": round(now - job["started"])}
+                              for name, job in self._in_flight.items()},
+                "completed": len(ok),
+                "failed": len(finished) - len(ok),
+                "jobs_last_hour": len(recent),
+                "jobs_per_hour": round(len(finished) * 3600 / max(now - self._started, 1), 2),
+                "mean_job_seconds": round(sum(f[1] for f in ok) / len(ok), 1) if ok else None,
+                "last_error": self._last_error,
+            }
+
+    def write_status(self):
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        _atomic_write(self.output_dir / STATUS_FILE, json.dumps(self.status(), indent=2).encode("utf-8"))
+
+    def serve_status(self, port: int) -> ThreadingHTTPServer:
+        """Serve status() as JSON on 127.0.0.1:port (any path) from a daemon thread."""
+        watcher = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = json.dumps(watcher.status(), indent=2).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+    # -- main loop ---------------------------------------------------------
+
+    def run(self, poll: float = POLL_SECONDS, stop: threading.Event | None = None):
+        """
+        Poll until Ctrl+C (or stop is set). In-flight jobs finish before
+        returning; queued jobs that haven't started are cancelled, leaving
+        their files in processing/ to be requeued on the next run.
+        """
+        stop = stop or threading.Event()
+        processing = self.inbox / "processing"
+        if processing.is_dir():
+            for path in sorted(processing.glob("*.pdf")):
+                _log(f"Requeueing {path.name} (interrupted last run)")
+                _move(str(path), self.inbox)
+        with ProcessPoolExecutor(max_workers=self.render_workers, initializer=_ignore_sigint) as render_pool, \
+                ThreadPoolExecutor(max_workers=self.api_jobs) as job_pool:
+            try:
+                while not stop.is_set():
+                    for job in self.scan():
+                        claimed = self.claim(job)
+                        with self._lock:
+                            self._queued += 1
+                        _log(f"Queued {job['name']}: {Path(claimed['wo']).name}"
+                             + (f" + {Path(claimed['map']).name}" if claimed["map"] else " (no map)"))
+                        job_pool.submit(self.run_job, claimed, render_pool)
+                    self.write_status()
+                    stop.wait(poll)
+            except KeyboardInterrupt:
+                _log("Stopping — waiting for in-flight jobs to finish (Ctrl+C again to abort)")
+            job_pool.shutdown(cancel_futures=True)
+        with self._lock:
+            self._queued = 0  # cancelled before they started
+        self.write_status()
+
+
+def watch_main(argv: list[str]):
+    parser = argparse.ArgumentParser(
+        prog="extract_workorder.py watch",
+        description="Watch an inbox folder and extract work order / map PDFs as they arrive",
+    )
+    parser.add_argument("inbox", help="Folder to watch for WO and map PDFs")
+    parser.add_argument("--output", help="Output directory", default=str(OUTPUT_DIR))
+    parser.add_argument("--jobs", type=int, default=DEFAULT_API_JOBS,
+                        help=f"Concurrent extractions (default {DEFAULT_API_JOBS})")
+    parser.add_argument("--render-workers", type=int, default=DEFAULT_RENDER_WORKERS,
+                        help=f"PDF rendering processes (default {DEFAULT_RENDER_WORKERS})")
+    parser.add_argument("--poll", type=float, default=POLL_SECONDS,
+                        help=f"Seconds between inbox scans (default {POLL_SECONDS:g})")
+    parser.add_argument("--pair-wait", type=float, default=PAIR_WAIT_SECONDS,
+                        help=f"Seconds a work order waits for its map (default {PAIR_WAIT_SECONDS:g})")
+    parser.add_argument("--status-port", type=int,
+                        help="Also serve status JSON on http://127.0.0.1:PORT/")
+    parser.add_argument("--adaptive", action="store_true",
+                        help="Size map tiles to each sheet's density instead of a fixed 2x2 grid")
+    parser.add_argument("--compact-tiles", action="store_true",
+                        help="Send map tiles as the smallest equally legible PNG / JPEG and drop blank sections "
+                             "(default: JPEG q70 tiles, as the web app sends)")
+    parser.add_argument("--per-sheet", action="store_true",
+                        help="Extract each map sheet in its own request and merge (no page limit)")
+    parser.add_argument("--tiered", action="store_true",
+                        help="Copy WO line items with a fast model; Opus reads only the map")
+    parser.add_argument("--bbox", metavar="MIN_LAT,MIN_LNG,MAX_LAT,MAX_LNG",
+                        help="Project area GPS points are validated against "
+                             "(default: within 30 km of each job's median point)")
+    args = parser.parse_args(argv)
+    if args.tiered and args.per_sheet:
+        parser.error("--tiered and --per-sheet can't be combined")
+    from validation import parse_bbox
+    try:
+        bbox = parse_bbox(args.bbox)
+    except ValueError as e:
+        parser.error(str(e))
+
+    inbox = Path(args.inbox)
+    if not inbox.is_dir():
+        print(f"ERROR: Folder not found: {inbox}")
+        sys.exit(1)
+
+    print()
+    print("=" * 60)
+    print("  LYT Communications - Watch Folder")
+    print("=" * 60)
+    print()
+
+    api_key = load_api_key()
+    watcher = InboxWatcher(inbox, Path(args.output), api_key, args.jobs, args.render_workers,
+                           args.adaptive, args.per_sheet, args.tiered, args.pair_wait,
+                           compact=args.compact_tiles, bbox=bbox)
+    print(f"Watching {inbox.resolve()} every {args.poll:g}s "
+          f"({args.jobs} concurrent extractions, {args.render_workers} render workers)")
+    print(f"Status: {Path(args.output) / STATUS_FILE}")
+    if args.status_port:
+        watcher.serve_status(args.status_port)
+        print(f"        http://127.0.0.1:{args.status_port}/status")
+    print("Press Ctrl+C to stop.\n")
+    watcher.run(args.poll)
@@ -0,0 +1,248 @@
+"""
+LYT Communications - Work Order Table Extraction
+Reads the line item table straight from the work order PDF's layout
+instead of flattened text: ruled tables through PyMuPDF's find_tables(),
+otherwise rows rebuilt from word positions (get_text("words")).
+
+Every row is checked against the rate card (claude_client.unit_codes())
+and gets a confidence score. When every row of a work order scores at
+least LOCAL_MIN_CONFIDENCE, its billing data needs no LLM at all (see
+tiered.start_line_items).
+"""
+
+import math
+import re
+
+import fitz  # PyMuPDF
+
+from claude_client import unit_codes
+
+LOCAL_MIN_CONFIDENCE = 0.9  # every row must reach this for the WO to skip the LLM
+UNALIGNED_MAX_CONFIDENCE = 0.8  # rows not mapped to header columns (guessed by content) never skip the LLM
+ROW_TOLERANCE = 3.0  # points: words whose vertical centres are this close share a row
+CELL_GAP = 8.0  # points: a horizontal gap this wide between words starts a new cell
+
+UOMS = {"LF", "EA", "SF", "CF", "HR", "SPAN"}
+HEADER_ALIASES = {
+    "code": ("code", "unit code", "item code", "item", "unit"),
+    "description": ("description", "desc", "item description", "work description"),
+    "uom": ("uom", "u/m", "unit of measure", "units"),
+    "quantity": ("qty", "quantity", "quan", "qty."),
+}
+CODE_LIKE = re.compile(r"^[A-Z]{1,4}\d{1,3}[A-Z]?(\.\d)?$")  # UG1, AE9L, AE31.1; not TOTAL or NOTE
+NUMBER = re.compile(r"^-?[\d,]*\.?\d+$")
+
+
+def _clean(cell) -> str:
+    return " ".join(str(cell or "").split())
+
+
+def _number(text: str) -> float | None:
+    text = _clean(text).replace("$", "")
+    if not NUMBER.match(text):
+        return None
+    return float(text.replace(",", ""))
+
+
+def _header_roles(cells: list[str]) -> dict[str, int] | None:
+    """Column index per role if this row is a table header, else None."""
+    roles = {}
+    for i, cell in enumerate(cells):
+        name = _clean(cell).lower().rstrip(":")
+        for role, aliases in HEADER_ALIASES.items():
+            if role not in roles and name in aliases:
+                roles[role] = i
+                break
+    return roles if "code" in roles and "quantity" in roles else None
+
+
+def _word_rows(page) -> list[list[tuple[str, float, float]]]:
+    """Rows of (cell text, x0, x1) rebuilt from word positions, for tables without ruling lines."""
+    words = sorted(page.get_text("words"), key=lambda w: ((w[1] + w[3]) / 2, w[0]))
+    lines = []
+    for w in words:
+        mid = (w[1] + w[3]) / 2
+        if lines and abs(lines[-1][0] - mid) <= ROW_TOLERANCE:
+            lines[-1][1].append(w)
+        else:
+            lines.append([mid, [w]])
+
+    rows = []
+    for _, line in lines:
+        line.sort(key=lambda w: w[0])
+        cells = [[line[0]]]
+        for prev, w in zip(line, line[1:]):
+            if w[0] - prev[2] > CELL_GAP:
+                cells.append([])
+            cells[-1].append(w)
+        rows.append([(" ".join(w[4] for w in cell), cell[0][0], cell[-1][2]) for cell in cells])
+    return rows
+
+
+def _column_spans(header: list[tuple[str, float, float]]) -> list[tuple[float, float]]:
+    """x range of each header column: from halfway to the previous header cell to halfway to the next."""
+    spans = []
+    for i, (_, x0, x1) in enumerate(header):
+        left = (header[i - 1][2] + x0) / 2 if i else -math.inf
+        right = (x1 + header[i + 1][1]) / 2 if i + 1 < len(header) else math.inf
+        spans.append((left, right))
+    return spans
+
+
+def _align_cells(row: list[tuple[str, float, float]], spans: list[tuple[float, float]]) -> list[str] | None:
+    """
+    A word-built row's cell texts placed under the header columns they
+    overlap, or None when a cell straddles two columns or two cells land in
+    the same column (the row can't be read by column).
+    """
+    aligned = [""] * len(spans)
+    for text, x0, x1 in row:
+        overlaps = sorted(((max(0.0, min(x1, right) - max(x0, left)), i) for i, (left, right) in enumerate(spans)),
+                          reverse=True)
+        best = overlaps[0][1]
+        if len(overlaps) > 1 and overlaps[1][0] > 0.25 * max(x1 - x0, 1.0):
+            return None
+        if aligned[best]:
+            return None
+        aligned[best] = text
+    return aligned
+
+
+def _page_tables(page) -> tuple[list[list[list]], str]:
+    """
+    Tables on the page as lists of rows, and the method that found them:
+    rows of cell texts from find_tables(), else rows of (text, x0, x1)
+    cells from _word_rows().
+    """
+    try:
+        found = page.find_tables().tables
+    except Exception:
+        found = []
+    tables = [[[_clean(c) for c in row] for row in t.extract()] for t in found]
+    if any(_find_header(t) is not None for t in tables):
+        return tables, "find_tables"
+    return [_word_rows(page)], "words"
+
+
+def _find_header(rows: list[list[str]]) -> int | None:
+    for i, row in enumerate(rows):
+        if _header_roles(row) is not None:
+            return i
+    return None
+
+
+def _row_from_roles(cells: list[str], roles: dict[str, int]) -> dict:
+    def cell(role):
+        i = roles.get(role)
+        return _clean(cells[i]) if i is not None and i < len(cells) else ""
+    return {"code": cell("code"), "description": cell("description"),
+            "uom": cell("uom"), "quantity": cell("quantity")}
+
+
+def _row_by_content(cells: list[str], codes: dict) -> dict:
+    """No header: code is the first rate-card-like cell, UOM a known unit, quantity the first number after it."""
+    cells = [_clean(c) for c in cells if _clean(c)]
+    row = {"code": "", "description": "", "uom": "", "quantity": ""}
+    rest = []
+    for cell in cells:
+        upper = cell.upper()
+        if not row["code"] and (upper in codes or CODE_LIKE.match(upper)):
+            row["code"] = cell
+        elif row["code"] and not row["uom"] and upper in UOMS:
+            row["uom"] = cell
+        elif row["code"] and not row["quantity"] and _number(cell) is not None:
+            row["quantity"] = cell
+        elif _number(cell) is None:
+            rest.append(cell)
+    row["description"] = max(rest, key=len, default="")
+    return row
+
+
+def score_row(row: dict, codes: dict) -> tuple[dict, float]:
+    """
+    Normalise a raw row into a line item and score it 0-1:
+    rate card code 0.4, UOM matching the card 0.3, a positive quantity 0.2,
+    a description 0.1.
+    """
+    code = row["code"].upper()
+    uom = row["uom"].upper()
+    quantity = _number(row["quantity"])
+    score = 0.0
+    if code in codes:
+        score += 0.4
+        if uom == codes[code].upper():
+            score += 0.3
+        elif not uom:
+            uom = codes[code].upper()
+            score += 0.15
+        elif uom in UOMS:
+            score += 0.1
+    if quantity is not None and quantity > 0:
+        score += 0.2
+    if row["description"]:
+        score += 0.1
+
+    if quantity is not None and quantity.is_integer():
+        quantity = int(quantity)
+    item = {"code": code, "description": row["description"],
+            "uom": "Span" if uom == "SPAN" else uom, "quantity": quantity}
+    return item, round(score, 2)
+
+
+def extract_line_item_table(pdf_path: str, max_pages: int | None = None) -> dict:
+    """
+    Line items read from the work order's table layout (every page unless
+    max_pages is given, like the WO text).
+    Returns {
+        'line_items': [{code, description, uom, quantity}],
+        'rows': [{...line item, confidence, page}],
+        'confidence': lowest row confidence (0 when no rows were found),
+        'method': 'find_tables' or 'words' per page,
+    }
+    """
+    codes = {code.upper(): uom for code, uom in unit_codes().items()}
+    rows = []
+    methods = set()
+
+    doc = fitz.open(pdf_path)
+    try:
+        for i in range(doc.page_count if max_pages is None else min(doc.page_count, max_pages)):
+            tables, method = _page_tables(doc[i])
+            for table in tables:
+                texts = [[cell[0] for cell in row] for row in table] if method == "words" else table
+                header = _find_header(texts)
+                roles = _header_roles(texts[header]) if header is not None else None
+                # Word-built rows skip empty cells, so they map to columns by position under the header
+                spans = _column_spans(table[header]) if roles and method == "words" else None
+                start = header + 1 if header is not None else 0
+                for row, cells in zip(table[start:], texts[start:]):
+                    if not any(cells) or _header_roles(cells) is not None:
+                        continue  # blank line or repeated header
+                    columns = _align_cells(row, spans) if spans else cells if roles else None
+                    if columns is not None:
+                        raw = _row_from_roles(columns, roles)
+                    else:
+                        raw = _row_by_content(cells, codes)
+                    code = raw["code"].upper()
+                    if not code or not (code in codes or CODE_LIKE.match(code)):
+                        continue  # totals, notes, headings
+                    item, confidence = score_row(raw, codes)
+                    if columns is None:
+                        # Guessed by content (no header, or the row doesn't line up with it)
+                        confidence = min(confidence, UNALIGNED_MAX_CONFIDENCE)
+                    rows.append({**item, "confidence": confidence, "page": i + 1})
+                    methods.add(method)
+    finally:
+        doc.close()
+
+    return {
+        "line_items": [{k: r[k] for k in ("code", "description", "uom", "quantity")} for r in rows],
+        "rows": rows,
+        "confidence": min((r["confidence"] for r in rows), default=0.0),
+        "method": "+".join(sorted(methods)) or None,
+    }
+
+
+def is_clean(table: dict, min_confidence: float = LOCAL_MIN_CONFIDENCE) -> bool:
+    """True when the table has rows and every one reaches min_confidence."""
+    return bool(table["rows"]) and table["confidence"] >= min_confidence